@@ -1,14 +1,21 @@
 {
     "name": "BIKO: POS Privatbank",
-    "version": "14.0.1.0.0",
+    "version": "14.0.1.3.0",
     "author": "BIKO Solutions, Artem Borovlev",
     "depends": [
+        "bus",
         "custom_pos_module",
         "biko_sale_order_pos",
     ],
-    "data": [],
+    "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
+        "views/assets.xml",
+        "views/privatbank_terminal_views.xml",
+        "views/privatbank_reconciliation_views.xml",
+    ],
     "license": "LGPL-3",
-    "external_dependencies": {"python": ["ftfy"]},
+    "external_dependencies": {"python": ["ftfy", "xlsxwriter"]},
     "installable": True,
     "application": True,
     "auto_install": False,
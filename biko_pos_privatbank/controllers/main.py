@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from werkzeug.exceptions import BadRequest
+
+from odoo import http
+from odoo.http import content_disposition, request
+
+from ..models.privat_terminal_export import (
+    ExportFilter,
+    iter_export_rows,
+    stream_csv,
+    stream_xlsx,
+)
+
+METRICS_TOKEN_PARAM = "biko_pos_privatbank.metrics_token"
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class PrivatbankMetrics(http.Controller):
+    @http.route(
+        "/privatbank/metrics",
+        type="http",
+        auth="public",
+        csrf=False,
+    )
+    def privatbank_metrics(self, token=None):
+        expected = (
+            request.env["ir.config_parameter"].sudo().get_param(METRICS_TOKEN_PARAM)
+        )
+        if not expected or token != expected:
+            return request.not_found()
+        text = request.env["privatbank.terminal.metric"].sudo().get_prometheus_text()
+        return request.make_response(
+            text,
+            headers=[("Content-Type", "text/plain; version=0.0.4; charset=utf-8")],
+        )
+
+
+class PrivatbankTransactionExport(http.Controller):
+    @http.route(
+        "/privatbank/transactions/export.<any(csv,xlsx):file_format>",
+        type="http",
+        auth="user",
+    )
+    def privatbank_transactions_export(self, file_format, **params):
+        if not request.env.user.has_group("point_of_sale.group_pos_manager"):
+            return request.not_found()
+        try:
+            export_filter = ExportFilter.from_params(params)
+        except ValueError as e:
+            raise BadRequest(str(e)) from e
+        rows = iter_export_rows(request.db, export_filter)
+        stream = stream_csv(rows) if file_format == "csv" else stream_xlsx(rows)
+        filename = "privatbank_transactions_{}.{}".format(
+            datetime.now().strftime("%Y%m%d_%H%M%S"), file_format
+        )
+        return http.Response(
+            stream,
+            headers=[
+                ("Content-Type", EXPORT_CONTENT_TYPES[file_format]),
+                ("Content-Disposition", content_disposition(filename)),
+            ],
+            direct_passthrough=True,
+        )
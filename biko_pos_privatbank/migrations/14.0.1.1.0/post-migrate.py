@@ -0,0 +1,36 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Fills `transaction_key` of the existing transactions.
+
+    The oldest transaction of an order and payment type gets the key, it is the one
+    `_create_update_transaction` used to update. Duplicates left by concurrent
+    workers and transactions without an order get the key suffixed with their ID:
+    every row is keyed and unique, and lookups by order and payment type keep
+    finding the oldest one.
+    """
+    if not version:
+        return
+    cr.execute(
+        """
+        UPDATE privatbank_terminal_transaction AS tx
+        SET transaction_key =
+            COALESCE(tx.order_ref, '') || '|' || COALESCE(tx.so_payment_type_id, 0)
+            || CASE WHEN ranked.pos = 1 AND tx.order_ref IS NOT NULL
+                THEN '' ELSE '|' || tx.id END
+        FROM (
+            SELECT
+                id,
+                row_number() OVER (
+                    PARTITION BY order_ref, so_payment_type_id ORDER BY id
+                ) AS pos
+            FROM privatbank_terminal_transaction
+        ) AS ranked
+        WHERE tx.id = ranked.id AND tx.transaction_key IS NULL
+        """
+    )
+    _logger.info("PRIVAT-TRMINAL: Filled the key of %d transactions", cr.rowcount)
@@ -0,0 +1,59 @@
+import logging
+
+from odoo import SUPERUSER_ID, api
+
+_logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+
+
+def migrate(cr, version):
+    """
+    Fills the reply columns of the existing transactions from `received_data`.
+
+    Rows are read in chunks by id, so the replies of a large table are never
+    loaded into memory at once. Each chunk is committed, so the updated rows
+    aren't locked for the whole backfill. The backfill is idempotent, an
+    interrupted update is simply run again.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    transactions = env["privatbank_terminal.transaction"]
+    columns = list(transactions._get_reply_vals(None))
+    assignments = ", ".join(f'"{name}" = %s' for name in columns)
+
+    last_id = 0
+    filled = 0
+    while True:
+        cr.execute(
+            """
+            SELECT id, received_data
+            FROM privatbank_terminal_transaction
+            WHERE id > %s AND received_data IS NOT NULL
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, CHUNK_SIZE),
+        )
+        rows = cr.fetchall()
+        if not rows:
+            break
+        params = []
+        for transaction_id, received_data in rows:
+            vals = transactions._get_reply_vals(received_data)
+            if any(vals.values()):
+                params.append([vals[name] for name in columns] + [transaction_id])
+        if params:
+            cr.executemany(
+                f"UPDATE privatbank_terminal_transaction SET {assignments} WHERE id = %s",
+                params,
+            )
+        filled += len(params)
+        last_id = rows[-1][0]
+        cr.commit()
+        _logger.info(
+            "PRIVAT-TRMINAL: Filled reply columns of %d transactions (up to id %d)",
+            filled,
+            last_id,
+        )
@@ -0,0 +1,57 @@
+import logging
+
+from odoo import SUPERUSER_ID, api
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_retention import (
+    decompress_payload,
+)
+
+_logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+
+
+def migrate(cr, version):
+    """
+    Fills the amount of the existing transactions from their reply, including
+    replies already compressed or moved to the archive table. Each chunk is
+    committed, an interrupted update resumes at the rows still without amount.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    transactions = env["privatbank_terminal.transaction"]
+
+    last_id = 0
+    filled = 0
+    while True:
+        cr.execute(
+            """
+            SELECT t.id, t.received_data, COALESCE(t.payload_compressed, a.payload)
+            FROM privatbank_terminal_transaction t
+            LEFT JOIN privatbank_terminal_transaction_archive a
+                ON a.transaction_id = t.id
+            WHERE t.id > %s AND t.amount IS NULL
+            ORDER BY t.id
+            LIMIT %s
+            """,
+            (last_id, CHUNK_SIZE),
+        )
+        rows = cr.fetchall()
+        if not rows:
+            break
+        params = []
+        for transaction_id, received_data, blob in rows:
+            if not received_data and blob:
+                received_data = decompress_payload(blob)[1]
+            amount = transactions._get_reply_vals(received_data)["amount"]
+            if amount is not None:
+                params.append((amount, transaction_id))
+        if params:
+            cr.executemany(
+                "UPDATE privatbank_terminal_transaction SET amount = %s WHERE id = %s",
+                params,
+            )
+        filled += len(params)
+        last_id = rows[-1][0]
+        cr.commit()
+    _logger.info("PRIVAT-TRMINAL: Filled the amount of %d transactions", filled)
@@ -1,5 +1,14 @@
 from . import (
+    pos_config,
+    pos_payment_method,
+    privatbank_payment_cancel,
+    privatbank_reconciliation,
+    privatbank_terminal_data_mixin,
+    privatbank_terminal_group,
+    privatbank_terminal_metric,
+    privatbank_terminal_status,
     privatbank_terminal_transaction,
+    privatbank_terminal_transaction_archive,
     return_order_checkbox_wizard,
     sale_order,
     sale_order_checkbox_wizard,
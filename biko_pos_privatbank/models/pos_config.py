@@ -0,0 +1,24 @@
+from typing import List
+
+from odoo import fields, models
+
+
+class PosConfig(models.Model):
+    _inherit = "pos.config"
+
+    privatbank_terminal_status_ids = fields.Many2many(
+        comodel_name="privatbank.terminal.status",
+        string="PrivatBank Terminals",
+        compute="_compute_privatbank_terminal_status_ids",
+    )
+
+    def _compute_privatbank_terminal_status_ids(self):
+        for rec in self:
+            addresses: List[str] = []
+            for method in rec.payment_method_ids.filtered(
+                lambda m: m.use_payment_terminal == "privatbank"
+            ):
+                addresses += method._get_privatbank_terminal_addresses()
+            rec.privatbank_terminal_status_ids = self.env[
+                "privatbank.terminal.status"
+            ].search([("terminal_ip", "in", addresses)])
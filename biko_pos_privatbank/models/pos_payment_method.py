@@ -0,0 +1,552 @@
+import json
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+from odoo import _, api, fields, models
+
+from .privat_terminal_api import (
+    TERMINAL_ERROR_BUSY,
+    TERMINAL_ERROR_CONNECT,
+    TERMINAL_ERROR_DOWN,
+    TERMINAL_ERROR_QUEUE,
+    PrivatbankTerminal,
+)
+from .privat_terminal_dispatcher import TerminalDispatcher, get_dispatcher
+from .privat_terminal_health import STATE_DOWN, health_cache
+from .privat_terminal_lock import get_queue_max_wait
+from .privat_terminal_retry import RetryPolicy
+from .privat_terminal_split import (
+    LEG_ERROR_DEADLINE,
+    PaymentLeg,
+    SplitPaymentFailed,
+    exchange_leg,
+    get_split_deadline,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Queue wait at a terminal of a group before failing over to the next one
+GROUP_QUEUE_WAIT: float = 2.0
+
+
+class PosPaymentMethod(models.Model):
+    _inherit = "pos.payment.method"
+
+    privatbank_terminal_group_id = fields.Many2one(
+        comodel_name="privatbank.terminal.group",
+        string="PrivatBank Terminal Group",
+        help="Payments are sent to the least loaded reachable terminal of the group. "
+        "The terminal IP of the payment method is used when the group is empty.",
+    )
+
+    def _get_privatbank_terminal_addresses(self) -> List[str]:
+        """
+        Returns the addresses of the terminals that can process the payment.
+
+        Returns:
+            List[str]: Terminal addresses in the 'IP:PORT' format.
+        """
+        self.ensure_one()
+        addresses: List[str] = self.privatbank_terminal_group_id.terminal_ids.mapped(
+            "terminal_ip"
+        )
+        if not addresses and self.privatbank_terminal_ip:
+            addresses = [self.privatbank_terminal_ip]
+        return addresses
+
+    def _privatbank_send_payment(
+        self,
+        amount: Union[float, Decimal],
+        order_id: int,
+        payment_type_id: int,
+        session_id: int,
+        rrn_param: str = "",
+        asynchronous: bool = False,
+        request_ref: str = "",
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Sends the payment to a terminal of the payment method.
+
+        Terminals are tried in the order given by the dispatcher. When a terminal
+        can't be reached or answers `deviceBusy` the request has not been processed,
+        so it fails over to the next terminal. Any other result is final. A terminal
+        used by another worker is only waited for briefly, and transient errors are
+        only retried on the terminal itself, when it is the last one.
+        In asynchronous mode the request is queued for the best ranked terminal,
+        and a payment already approved for the same `request_ref` is not sent again.
+
+        Args:
+            amount (Union[float, Decimal]): The amount to be paid.
+            order_id (int): The ID of the order.
+            payment_type_id (int): The ID of the payment type.
+            session_id (int): The ID of the session.
+            rrn_param (str, optional): The RRN parameter. Defaults to "".
+            asynchronous (bool): Queue the request on the background terminal loop.
+            request_ref (str, optional): The request the payment is made for, in the
+                'model,id' format, e.g. the checkout wizard. Defaults to "".
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the status and info of the payment request.
+        """
+        self.ensure_one()
+        dispatcher: TerminalDispatcher = get_dispatcher()
+        result: Dict[Literal["status", "info"], Any] = {
+            "status": "retry",
+            "info": _("No PrivatBank terminal is configured for %s.") % self.name,
+        }
+
+        addresses: List[str] = dispatcher.rank(self._get_privatbank_terminal_addresses())
+        queue_wait: float = get_queue_max_wait(self.env)
+        retry_policy: RetryPolicy = RetryPolicy.from_env(self.env)
+
+        index: int
+        address: str
+        for index, address in enumerate(addresses):
+            terminal: PrivatbankTerminal = PrivatbankTerminal(address, self.env)
+            terminal.request_ref = request_ref
+            if asynchronous:
+                return terminal.submit_payment_request(
+                    amount=amount,
+                    order_id=order_id,
+                    payment_type_id=payment_type_id,
+                    session_id=session_id,
+                    rrn_param=rrn_param,
+                )
+
+            last: bool = index == len(addresses) - 1
+            with dispatcher.reserve(address):
+                result = terminal.send_payment_request(
+                    amount=amount,
+                    order_id=order_id,
+                    payment_type_id=payment_type_id,
+                    session_id=session_id,
+                    rrn_param=rrn_param,
+                    # Don't wait for a terminal while another one may be idle
+                    queue_wait=queue_wait if last else GROUP_QUEUE_WAIT,
+                    retry_policy=retry_policy if last else RetryPolicy.no_retry(),
+                )
+
+            if terminal.last_error in (TERMINAL_ERROR_BUSY, TERMINAL_ERROR_QUEUE):
+                dispatcher.mark_busy(address)
+                continue
+            if terminal.last_error in (TERMINAL_ERROR_CONNECT, TERMINAL_ERROR_DOWN):
+                dispatcher.mark_down(address)
+                continue
+            dispatcher.mark_idle(address)
+            return result
+
+        return result
+
+    @api.model
+    def _privatbank_cancel_payment(self, attempt_id: str) -> None:
+        """
+        Asks the worker waiting for the terminal reply to give up the attempt.
+
+        The attempt ID comes with the `privatbank_payment_progress` bus messages.
+        The worker checks for the cancellation every few seconds, closes the
+        connection and reports the payment as failed. A payment the terminal has
+        already approved may still complete on the terminal side.
+
+        Args:
+            attempt_id (str): The ID of the payment attempt.
+
+        Returns:
+            None
+        """
+        self.env["privatbank.payment.cancel"].sudo().create({"attempt_id": attempt_id})
+
+    def _privatbank_payment_status(
+        self,
+        amount: Union[float, Decimal],
+        order_id: int,
+        payment_type_id: int,
+        request_ref: str = "",
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Returns the state of an asynchronous payment of the payment method.
+
+        Args:
+            amount (Union[float, Decimal]): The amount to be paid.
+            order_id (int): The ID of the order.
+            payment_type_id (int): The ID of the payment type.
+            request_ref (str, optional): The request the payment is made for, as
+                passed to `_privatbank_send_payment`. Defaults to "".
+
+        Returns:
+            Dict[str, Any]: The status ("new", "pending", "done" or "retry") and info.
+        """
+        self.ensure_one()
+        addresses: List[str] = self._get_privatbank_terminal_addresses()
+        if not addresses:
+            return {"status": "new", "info": ""}
+        # The state is read from the transaction record, any terminal will do
+        terminal: PrivatbankTerminal = PrivatbankTerminal(addresses[0], self.env)
+        terminal.request_ref = request_ref
+        return terminal.get_payment_status(
+            amount=amount,
+            order_id=order_id,
+            payment_type_id=payment_type_id,
+        )
+
+    @api.model
+    def _privatbank_send_split_payment(
+        self, legs: List[PaymentLeg]
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Sends the card legs of a split payment to their terminals at the same time.
+
+        Every leg is stored as `waitingCard` first, then the exchanges run in
+        parallel threads, bounded by the `biko_pos_privatbank.split_payment_deadline`
+        system parameter. Replies are stored by the request thread. A leg already
+        approved for the same `request_ref` is not sent again.
+
+        If any leg fails, the approved purchase legs are refunded on the terminal
+        that approved them, so the customer is either charged in full or not at
+        all. The caller usually raises then, which rolls back the request: the
+        writes of the attempt are rolled back to a savepoint and the outcome of
+        every leg is committed on a cursor of its own instead, so the charges and
+        refunds made on the terminals are never lost.
+
+        Args:
+            legs (List[PaymentLeg]): The legs of the payment.
+
+        Returns:
+            Dict[str, Any]: "done" if every leg was approved, otherwise "retry"
+            with the errors of the failed legs and the outcome of the refunds.
+        """
+        dispatcher: TerminalDispatcher = get_dispatcher()
+        pending: List[PaymentLeg] = []
+        leg: PaymentLeg
+        for leg in legs:
+            addresses: List[str] = dispatcher.rank(
+                leg.payment_method._get_privatbank_terminal_addresses()
+            )
+            if not addresses:
+                return {
+                    "status": "retry",
+                    "info": _("No PrivatBank terminal is configured for %s.")
+                    % leg.payment_method.name,
+                }
+            terminal: PrivatbankTerminal = PrivatbankTerminal(addresses[0], self.env)
+            leg.order, error = terminal._prepare_payment(
+                leg.amount, leg.order_id, leg.payment_type_id
+            )
+            if error:
+                return error
+            status, _reply, request_ref = terminal._get_committed_state(
+                leg.order, leg.payment_type_id
+            )
+            # Only a leg approved for the same request, e.g. a leg that could not
+            # be refunded when the split payment of the wizard failed before
+            if status == "done" and leg.request_ref and request_ref == leg.request_ref:
+                leg.result = {"status": "done", "info": _("Approved before.")}
+                continue
+            # The health cache reads the request cursor, filter in this thread
+            leg.addresses = [
+                address
+                for address in addresses
+                if health_cache.get_state(self.env, address) != STATE_DOWN
+            ]
+            leg.data = terminal._prepare_order_data(leg.amount, leg.rrn_param)
+            pending.append(leg)
+
+        if not pending:
+            return {"status": "done", "info": "Payment request sent successfully."}
+
+        try:
+            with self.env.cr.savepoint():
+                for leg in pending:
+                    self._privatbank_store_leg(self.env, leg, "waitingCard")
+                self._privatbank_run_legs(pending)
+                if all(leg.done for leg in pending):
+                    return {
+                        "status": "done",
+                        "info": "Payment request sent successfully.",
+                    }
+                raise SplitPaymentFailed()
+        except SplitPaymentFailed:
+            pass
+
+        failed: List[PaymentLeg] = [leg for leg in pending if not leg.done]
+        approved: List[PaymentLeg] = [
+            leg for leg in pending if leg.done and leg.amount > 0
+        ]
+        # Record the charges before refunding them, the refunds may take minutes
+        self._privatbank_commit_legs(pending)
+
+        infos: List[str] = [
+            "%s: %s" % (leg.payment_method.name, leg.result.get("info")) for leg in failed
+        ]
+        if approved:
+            infos.extend(self._privatbank_reverse_legs(approved))
+        return {"status": "retry", "info": "\n".join(infos)}
+
+    @api.model
+    def _privatbank_store_leg(
+        self,
+        env: Any,
+        leg: PaymentLeg,
+        status: str,
+        received_data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Stores the transaction of the leg in the given environment.
+
+        Args:
+            env (Environment): The environment to write with.
+            leg (PaymentLeg): The leg.
+            status (str): The transaction status.
+            received_data (Optional[Dict[str, Any]]): The reply to store.
+
+        Returns:
+            None
+        """
+        address: str = (
+            f"{leg.terminal.terminal_ip}:{leg.terminal.terminal_port}"
+            if leg.terminal is not None
+            else leg.payment_method._get_privatbank_terminal_addresses()[0]
+        )
+        terminal: PrivatbankTerminal = PrivatbankTerminal(address, env)
+        terminal.request_ref = leg.request_ref
+        terminal._configure_order_model(leg.amount)
+        terminal._create_update_transaction(
+            order_id=leg.order.with_env(env),
+            payment_type_id=leg.payment_type_id,
+            session_id=leg.session_id,
+            status=status,
+            send_data=json.dumps(leg.data) if leg.data else None,
+            received_data=json.dumps(received_data) if received_data else None,
+        )
+
+    @api.model
+    def _privatbank_commit_legs(self, legs: List[PaymentLeg]) -> None:
+        """
+        Commits the outcome of the legs of a failed split payment on a cursor of
+        its own: the approved legs as `done` with the terminal reply, the other
+        legs as `retry` with the error.
+
+        Args:
+            legs (List[PaymentLeg]): The legs sent to the terminals.
+
+        Returns:
+            None
+        """
+        with self.env.registry.cursor() as cr:
+            env: Any = self.env(cr=cr)
+            leg: PaymentLeg
+            for leg in legs:
+                reply: Dict[str, Any] = self._privatbank_get_leg_reply(leg)
+                if leg.done:
+                    self._privatbank_store_leg(env, leg, "done", reply)
+                    continue
+                self._privatbank_store_leg(
+                    env,
+                    leg,
+                    "retry",
+                    reply or {"error": True, "errorDescription": leg.result.get("info")},
+                )
+
+    @api.model
+    def _privatbank_get_leg_reply(self, leg: PaymentLeg) -> Dict[str, Any]:
+        """
+        Returns the parsed terminal reply of the leg, empty if there is none.
+
+        Args:
+            leg (PaymentLeg): The leg.
+
+        Returns:
+            Dict[str, Any]: The reply.
+        """
+        if leg.terminal is None or not leg.received_data:
+            return {}
+        _return_data, parsed_data = leg.terminal._parse_data(leg.received_data)
+        return parsed_data
+
+    @api.model
+    def _privatbank_get_leg_error(
+        self, leg: PaymentLeg
+    ) -> Optional[Dict[Literal["status", "info"], Any]]:
+        """
+        Binds the terminal of the leg to the request and describes the failure of
+        its exchange.
+
+        Args:
+            leg (PaymentLeg): The leg after `exchange_leg`.
+
+        Returns:
+            Optional[Dict[str, Any]]: An error dictionary, or None if the terminal
+            replied.
+        """
+        if leg.terminal is not None:
+            leg.terminal.env = self.env
+            leg.terminal.request_ref = leg.request_ref
+        if leg.error == LEG_ERROR_DEADLINE:
+            return {
+                "status": "retry",
+                "info": _("The split payment deadline was exceeded."),
+            }
+        if leg.terminal is None:
+            return {
+                "status": "retry",
+                "info": _("No reachable PrivatBank terminal for %s.")
+                % leg.payment_method.name,
+            }
+        return leg.terminal._get_exchange_error()
+
+    @api.model
+    def _privatbank_run_legs(self, legs: List[PaymentLeg]) -> None:
+        """
+        Runs the exchanges of the prepared legs in parallel and stores the replies.
+
+        Args:
+            legs (List[PaymentLeg]): Legs with their addresses and requests.
+
+        Returns:
+            None
+        """
+        expires_at: float = time.monotonic() + get_split_deadline(self.env)
+        queue_wait: float = get_queue_max_wait(self.env)
+        dispatcher: TerminalDispatcher = get_dispatcher()
+
+        with ThreadPoolExecutor(
+            max_workers=len(legs), thread_name_prefix="privatbank-split"
+        ) as executor:
+            futures: List[Future] = [
+                executor.submit(
+                    exchange_leg,
+                    leg,
+                    self.env.registry,
+                    dispatcher,
+                    expires_at,
+                    queue_wait,
+                    GROUP_QUEUE_WAIT,
+                )
+                for leg in legs
+            ]
+
+        leg: PaymentLeg
+        future: Future
+        for leg, future in zip(legs, futures):
+            if future.exception() is not None:
+                _logger.error(
+                    "PRIVAT-TRMINAL: Split payment leg failed",
+                    exc_info=future.exception(),
+                )
+                leg.result = {"status": "retry", "info": str(future.exception())}
+                continue
+            leg.result = self._privatbank_get_leg_error(leg) or {}
+            if leg.terminal is None:
+                continue
+            if leg.received_data:
+                leg.terminal._configure_order_model(leg.amount)
+                leg.result = leg.terminal._complete_payment(
+                    leg.order, leg.payment_type_id, leg.session_id, leg.received_data
+                )
+            leg.terminal._record_metrics()
+
+    @api.model
+    def _privatbank_reverse_legs(self, legs: List[PaymentLeg]) -> List[str]:
+        """
+        Refunds approved legs of a split payment that failed as a whole.
+
+        A refunded leg is stored as `retry`, the refund reply is kept in its
+        `received_data`, so the payment can be started again. A leg that could
+        not be refunded stays `done`. The outcome is committed on a cursor of
+        its own, as by `_privatbank_commit_legs`.
+
+        Args:
+            legs (List[PaymentLeg]): Approved purchase legs.
+
+        Returns:
+            List[str]: The outcome of each refund.
+        """
+        reversals: List[PaymentLeg] = []
+        leg: PaymentLeg
+        for leg in legs:
+            params: Dict[str, Any] = (
+                self._privatbank_get_leg_reply(leg).get("params") or {}
+            )
+            rrn: str = params.get("rrn") or ""
+            reversal: PaymentLeg = PaymentLeg(
+                payment_method=leg.payment_method,
+                amount=-leg.amount,
+                order_id=leg.order_id,
+                payment_type_id=leg.payment_type_id,
+                session_id=leg.session_id,
+                rrn_param=rrn,
+                request_ref=leg.request_ref,
+            )
+            # The refund must go to the terminal that approved the payment
+            reversal.addresses = [f"{leg.terminal.terminal_ip}:{leg.terminal.terminal_port}"]
+            reversal.data = leg.terminal._prepare_order_data(reversal.amount, rrn)
+            reversals.append(reversal)
+
+        expires_at: float = time.monotonic() + get_split_deadline(self.env)
+        queue_wait: float = get_queue_max_wait(self.env)
+        dispatcher: TerminalDispatcher = get_dispatcher()
+        with ThreadPoolExecutor(
+            max_workers=len(reversals), thread_name_prefix="privatbank-split"
+        ) as executor:
+            for reversal in reversals:
+                executor.submit(
+                    exchange_leg,
+                    reversal,
+                    self.env.registry,
+                    dispatcher,
+                    expires_at,
+                    queue_wait,
+                    queue_wait,
+                )
+
+        infos: List[str] = []
+        refunded: List[Tuple[PaymentLeg, Dict[str, Any]]] = []
+        for leg, reversal in zip(legs, reversals):
+            return_data: Dict[str, Any] = self._privatbank_get_leg_error(reversal) or {}
+            parsed_data: Dict[str, Any] = {}
+            if reversal.received_data:
+                return_data, parsed_data = reversal.terminal._parse_data(
+                    reversal.received_data
+                )
+            if return_data.get("status") != "done":
+                _logger.error(
+                    "PRIVAT-TRMINAL: Can't refund split payment leg of %s, RRN %s: %s",
+                    leg.order.name,
+                    reversal.rrn_param,
+                    return_data.get("info"),
+                )
+                infos.append(
+                    _(
+                        "%(method)s: the approved payment could not be refunded "
+                        "(%(info)s), refund RRN %(rrn)s manually.",
+                        method=leg.payment_method.name,
+                        info=return_data.get("info"),
+                        rrn=reversal.rrn_param,
+                    )
+                )
+                continue
+            refunded.append((leg, parsed_data))
+            infos.append(
+                _(
+                    "%(method)s: the approved payment was refunded.",
+                    method=leg.payment_method.name,
+                )
+            )
+
+        if refunded:
+            with self.env.registry.cursor() as cr:
+                env: Any = self.env(cr=cr)
+                for leg, parsed_data in refunded:
+                    self._privatbank_store_leg(
+                        env,
+                        leg,
+                        "retry",
+                        {
+                            "error": True,
+                            "errorDescription": "Refunded after a failed split payment leg",
+                            "reversal": parsed_data,
+                        },
+                    )
+        return infos
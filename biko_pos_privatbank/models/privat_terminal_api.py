@@ -1,18 +1,89 @@
 import json
 import logging
 import socket
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
 from decimal import Decimal
-from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from ftfy import fix_text
-from odoo import _, models
+import odoo
+from odoo import _, api, fields, models
 from odoo.api import Environment
 
+from .privat_terminal_async import (
+    ASYNC_CONNECT_TIMEOUT,
+    ASYNC_PAYMENT_TIMEOUT,
+    get_event_loop,
+)
+from .privat_terminal_health import STATE_DOWN, health_cache
+from .privat_terminal_lock import (
+    TerminalQueueTimeout,
+    get_queue_max_wait,
+    terminal_queue,
+)
+from .privat_terminal_metrics import metrics
+from .privat_terminal_pool import TerminalConnectionPool, get_pool
+from .privat_terminal_retry import RetryPolicy
+from .privat_terminal_protocol import (
+    CANCEL_POLL_INTERVAL,
+    READ_TIMEOUT,
+    RECV_BUFFER_SIZE,
+    REPLY_DEADLINE,
+    FrameDecoder,
+    PaymentCancelled,
+    decode_reply_text,
+    is_final_message,
+    is_service_message,
+    load_message,
+    parse_reply,
+    repair_fields,
+)
+
 _logger = logging.getLogger(__name__)
 
 OdooRecordset = Union["models.BaseModel", Any]
 
-EMPTY_THRESHOLD: int = 10
+MessageCallback = Callable[[Dict[str, Any]], None]
+CancelCheck = Callable[[], bool]
+
+# Values of `PrivatbankTerminal.last_error`
+TERMINAL_ERROR_CONNECT: str = "connect"
+TERMINAL_ERROR_SEND: str = "send"
+TERMINAL_ERROR_RECEIVE: str = "receive"
+TERMINAL_ERROR_REPLY: str = "reply"
+TERMINAL_ERROR_BUSY: str = "deviceBusy"
+TERMINAL_ERROR_QUEUE: str = "queue"
+TERMINAL_ERROR_DOWN: str = "down"
+TERMINAL_ERROR_CANCELLED: str = "cancelled"
+
+ASYNC_PAYMENT_PARAM: str = "biko_pos_privatbank.async_payment"
+
+
+def is_async_payment_enabled(env: Environment) -> bool:
+    """
+    Checks whether terminal payments are processed by the background event loop.
+
+    Args:
+        env (Environment): The Odoo environment object.
+
+    Returns:
+        bool: True if the `biko_pos_privatbank.async_payment` system parameter is set.
+    """
+    value: str = env["ir.config_parameter"].sudo().get_param(ASYNC_PAYMENT_PARAM, "")
+    return value.lower() in ("1", "true", "yes")
 
 
 class PrivatbankTerminal:
@@ -45,12 +116,60 @@ class PrivatbankTerminal:
             self.terminal_port: str = parts[1]
             self.env: Environment = env
             self.subsystem: str = subsystem
+            self.pool: TerminalConnectionPool = get_pool(
+                self.terminal_ip, int(self.terminal_port)
+            )
+            self.socket: Optional[socket.socket] = None
+            self.socket_reused: bool = False
+            self.connection_lost: bool = False
+            self.last_error: str = ""
+            self.timings: Dict[str, float] = {}
+            # Set for the current attempt by `_attempt_payment`
+            self.attempt_id: str = ""
+            # The request the payment is made for, stored on the transaction
+            self.request_ref: str = ""
+            self.on_message: Optional[MessageCallback] = None
+            self.is_cancelled: Optional[CancelCheck] = None
+            self.cancelled: bool = False
+            # The cursor of the terminal queue while the terminal is held
+            self.queue_cr: Any = None
         except Exception:
             _logger.exception("PRIVAT-TRMINAL: Can't connect with terminal")
 
+    @contextmanager
+    def _span(self, phase: str) -> Iterator[None]:
+        """
+        Adds the duration of the block to the timing of the payment phase.
+
+        Args:
+            phase (str): The phase name, one of `PHASES`.
+        """
+        started: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = (
+                self.timings.get(phase, 0.0) + time.perf_counter() - started
+            )
+
+    def _record_metrics(self) -> None:
+        """
+        Records the phase timings of the payment in the latency histograms and
+        flushes them to the database when due.
+        """
+        if not self.timings:
+            return
+        metrics.record(
+            f"{self.terminal_ip}:{self.terminal_port}", self.subsystem, self.timings
+        )
+        self.timings = {}
+        if metrics.flush_due():
+            self.env["privatbank.terminal.metric"].sudo()._flush_metrics()
+
     def _connect(self) -> bool:
         """
-        Establishes a connection to the terminal using the provided IP address and port.
+        Takes a connection to the terminal from the process-wide pool, opening a new
+        one if there is no healthy idle socket.
 
         Returns:
             bool: True if the connection is successful, False otherwise.
@@ -59,12 +178,28 @@ class PrivatbankTerminal:
             _logger.debug(
                 f"PRIVAT-TRMINAL: Connecting to terminal {self.terminal_ip}:{self.terminal_port}"
             )
-            self.socket.connect((self.terminal_ip, int(self.terminal_port)))
+            with self._span("connect"):
+                self.socket, self.socket_reused = self.pool.acquire()
+            self.connection_lost = False
         except Exception:
             _logger.exception("PRIVAT-TRMINAL: Can't connect with terminal")
             return False
         return True
 
+    def _release(self, reusable: bool) -> None:
+        """
+        Returns the current socket to the pool, or closes it if the exchange failed.
+
+        Args:
+            reusable (bool): True if the socket finished a complete request/reply exchange.
+
+        Returns:
+            None
+        """
+        if self.socket is not None:
+            self.pool.release(self.socket, reusable=reusable)
+            self.socket = None
+
     def _send_data(self, data: Dict) -> bool:
         """
         Sends data to the connected socket after encoding it to bytes and appending a null byte.
@@ -83,48 +218,110 @@ class PrivatbankTerminal:
             _logger.debug(f"PRIVAT-TRMINAL: SEND DATA: {data}")
             send_data: bytes = json.dumps(data).encode()
             send_data += b"\x00"
-            self.socket.sendall(send_data)
+            with self._span("send"):
+                self.socket.sendall(send_data)
         except Exception:
             _logger.exception("Error sending data")
             return False
         return True
 
-    def _receive_data(self) -> bytes:
+    def _receive_data(
+        self,
+        on_message: Optional[MessageCallback] = None,
+        read_timeout: float = READ_TIMEOUT,
+        deadline: float = REPLY_DEADLINE,
+        is_cancelled: Optional[CancelCheck] = None,
+    ) -> bytes:
         """
         Receives data from the terminal.
 
-        This method continuously reads data from the socket in chunks of 512 bytes
-        until the received data ends with the byte sequence `b"}\x00"`. If an
-        exception occurs during the process, it logs the error and returns an empty
-        byte string.
+        The stream is decoded incrementally by `FrameDecoder` until the final reply
+        frame arrives. Every message, including intermediate service messages, is
+        passed to `on_message` as soon as it is decoded. Each read waits at most
+        `read_timeout` seconds and the whole reply at most `deadline` seconds.
+        While waiting, `is_cancelled` is checked every `CANCEL_POLL_INTERVAL` seconds.
+        If an exception occurs during the process, it logs the error and returns
+        an empty byte string.
+
+        Args:
+            on_message (Optional[MessageCallback]): Called with each decoded message.
+            read_timeout (float): Timeout of a single read in seconds. Defaults to READ_TIMEOUT.
+            deadline (float): Timeout of the whole reply in seconds. Defaults to REPLY_DEADLINE.
+            is_cancelled (Optional[CancelCheck]): Tells whether the user cancelled the payment.
 
         Returns:
-            bytes: The received data as a byte string, or an empty byte string if
-            an error occurs.
+            bytes: The final reply frame without the NUL delimiter, or an empty byte
+            string if an error occurs.
 
         Logs:
             Logs the received data at debug level.
             Logs any exceptions that occur during receiving at exception level.
         """
+        decoder: FrameDecoder = FrameDecoder()
+        received_any: bool = False
+        expires_at: float = time.monotonic() + deadline
+        idle_since: float = time.monotonic()
+        waiting_since: float = time.perf_counter()
+        self.cancelled = False
         try:
-            received_data: bytes = b""
-            empty_count: int = 0
-
             while True:
-                data_new: bytes = self.socket.recv(512)
-                if not data_new:
-                    empty_count += 1
-                    if empty_count > EMPTY_THRESHOLD:
-                        raise Exception("Empty data received")
+                now: float = time.monotonic()
+                remaining: float = expires_at - now
+                if remaining <= 0:
+                    raise socket.timeout("Terminal reply deadline exceeded")
+                idle_left: float = read_timeout - (now - idle_since)
+                if idle_left <= 0:
+                    raise socket.timeout("Terminal read timeout")
+                if is_cancelled is not None and is_cancelled():
+                    self.cancelled = True
+                    raise PaymentCancelled("Payment cancelled by the user")
+                timeout: float = min(idle_left, remaining)
+                if is_cancelled is not None:
+                    timeout = min(timeout, CANCEL_POLL_INTERVAL)
+                self.socket.settimeout(timeout)
+                try:
+                    data_new: bytes = self.socket.recv(RECV_BUFFER_SIZE)
+                except socket.timeout:
+                    if is_cancelled is None:
+                        raise
                     continue
+                except ConnectionResetError:
+                    self.connection_lost = not received_any
+                    raise
+                if not data_new:
+                    self.connection_lost = not received_any
+                    raise ConnectionError("Connection closed by the terminal")
+                idle_since = time.monotonic()
+                if not received_any:
+                    first_data: float = time.perf_counter()
+                    self.timings["card_wait"] = (
+                        self.timings.get("card_wait", 0.0) + first_data - waiting_since
+                    )
+                received_any = True
 
-                empty_count = 0
-
-                received_data += data_new
-                if received_data.endswith(b"}\x00"):
-                    break
-            _logger.debug(f"PRIVAT-TRMINAL: RECEIVED DATA: {received_data}")
-            return received_data
+                frame: bytes
+                for frame in decoder.feed(data_new):
+                    message: Optional[Dict[str, Any]] = load_message(frame)
+                    if message is not None and on_message is not None:
+                        on_message(message)
+                    if is_final_message(message):
+                        _logger.debug(f"PRIVAT-TRMINAL: RECEIVED DATA: {frame}")
+                        self.socket.settimeout(None)
+                        self.timings["receive"] = (
+                            self.timings.get("receive", 0.0)
+                            + time.perf_counter()
+                            - first_data
+                        )
+                        return frame
+                    _logger.debug(f"PRIVAT-TRMINAL: SERVICE MESSAGE: {frame}")
+        except PaymentCancelled:
+            _logger.info(
+                "PRIVAT-TRMINAL: Payment %s on %s:%s cancelled while waiting",
+                self.attempt_id,
+                self.terminal_ip,
+                self.terminal_port,
+            )
+            return b""
         except Exception:
             _logger.exception("Error receiving reply from terminal")
             return b""
@@ -149,9 +346,13 @@ class PrivatbankTerminal:
             Exception: If there is an error during the parsing process, it will be caught and logged.
         """
         try:
-            fixed_text: str = fix_text(received_data.decode())
-            _logger.debug(f"PARSED DATA: {fixed_text}")
-            data: Dict[str, Any] = json.loads(fixed_text)
+            with self._span("decode"):
+                text: str = decode_reply_text(received_data)
+            _logger.debug(f"PARSED DATA: {text}")
+            with self._span("parse"):
+                data: Dict[str, Any] = parse_reply(text)
+            with self._span("decode"):
+                data = repair_fields(data)
             # Check if the server returned an error
             if data.get("error", False):
                 return {"status": "retry", "info": data.get("errorDescription")}, data
@@ -166,6 +367,33 @@ class PrivatbankTerminal:
             _logger.exception("Error parsing data from terminal")
             return {"status": "retry", "info": str(e)}, {}
 
+    def _get_transaction(
+        self, order_id: OdooRecordset, payment_type_id: int
+    ) -> OdooRecordset:
+        """
+        Returns the transaction record of the order and payment type, if any.
+
+        Args:
+            order_id (OdooRecordset): The order associated with the transaction.
+            payment_type_id (int): The payment type identifier.
+
+        Returns:
+            OdooRecordset: The transaction record or an empty recordset.
+        """
+        transactions: OdooRecordset = self.env["privatbank_terminal.transaction"]
+        return transactions.search(
+            [
+                (
+                    "transaction_key",
+                    "=",
+                    transactions._make_transaction_key(
+                        f"{self.model_name},{order_id.id}", payment_type_id
+                    ),
+                ),
+            ],
+            limit=1,
+        )
+
     def _create_update_transaction(
         self,
         order_id: OdooRecordset,
@@ -178,9 +406,10 @@ class PrivatbankTerminal:
         """
         Create or update a transaction record for a given order.
 
-        This method searches for an existing transaction based on the order reference
-        and payment type. If found, it updates the transaction with the provided values.
-        If not found, it creates a new transaction record.
+        The transaction is keyed by the order reference and payment type. The lookup
+        and the create or update are done by a single upsert statement, so concurrent
+        workers can't create duplicates. The transaction is marked with the
+        `request_ref` of the terminal.
 
         Args:
             order_id (OdooRecordset): The order associated with the transaction.
@@ -195,31 +424,24 @@ class PrivatbankTerminal:
         """
         # TODO: Add nested transaction for extended logging
         order_ref: str = f"{self.model_name},{order_id.id}"
-        transaction: OdooRecordset = self.env["privatbank_terminal.transaction"].search(
-            [
-                ("order_ref", "=", order_ref),
-                ("so_payment_type_id", "=", payment_type_id),
-            ],
-            limit=1,
-        )
         vals: Dict[str, Any] = {
             "order_ref": order_ref,
             "order_receipt": order_id.name,  # type: ignore
             "so_payment_type_id": payment_type_id,
             "session_id": session_id,
             "status": status,
+            "request_ref": self.request_ref or None,
         }
 
         if send_data:
             vals["send_data"] = send_data
 
+        transactions: OdooRecordset = self.env["privatbank_terminal.transaction"]
         if received_data:
             vals["received_data"] = received_data
+            vals.update(transactions._get_reply_vals(received_data))
 
-        if not transaction:
-            self.env["privatbank_terminal.transaction"].create(vals)
-        else:
-            transaction.write(vals)
+        transactions._upsert(vals)
 
     def _configure_order_model(self, amount: Union[float, Decimal]) -> None:
         """
@@ -291,35 +513,30 @@ class PrivatbankTerminal:
 
         return data
 
-    def send_payment_request(
+    def _prepare_payment(
         self,
         amount: Union[float, Decimal],
         order_id: int,
         payment_type_id: int,
-        session_id: int,
-        rrn_param: str = "",
-    ) -> Dict[Literal["status", "info"], Any]:
+    ) -> Tuple[OdooRecordset, Optional[Dict[Literal["status", "info"], Any]]]:
         """
-        Sends a payment request to the terminal.
+        Configures the order model and checks that the order and payment type exist.
 
         Args:
             amount (Union[float, Decimal]): The amount to be paid.
             order_id (int): The ID of the order.
             payment_type_id (int): The ID of the payment type.
-            session_id (int): The ID of the session.
-            rrn_param (str, optional): The RRN parameter. Defaults to "".
 
         Returns:
-            Dict[str, Any]: A dictionary containing the status and info of the payment request.
+            tuple: The order record and an error dictionary, or None if the records are valid.
         """
-
         self._configure_order_model(amount)
 
         order: OdooRecordset = self.model.browse(order_id)
         pament_type: OdooRecordset = self.env["so.payment.type"].browse(payment_type_id)
 
         if not order:
-            return {
+            return order, {
                 "status": "retry",
                 "info": _(
                     "%(model_caption)s ID=%(order_id)d not found.",
@@ -328,16 +545,653 @@ class PrivatbankTerminal:
                 ),
             }
         if not pament_type:
-            return {
+            return order, {
                 "status": "retry",
                 "info": _(
                     "Payment type ID=%(payment_type_id)d not found.",
                     payment_type_id=payment_type_id,
                 ),
             }
+        return order, None
 
-        data: Dict[str, Any] = self._prepare_order_data(amount, rrn_param)
+    def _exchange(
+        self, data: Dict[str, Any], reply_deadline: float = REPLY_DEADLINE
+    ) -> bytes:
+        """
+        Sends the request over a pooled connection and waits for the reply.
+
+        The class of a failure is left in `last_error`, `_get_exchange_error`
+        describes it.
+
+        Args:
+            data (Dict[str, Any]): The request to send.
+            reply_deadline (float): Timeout of the whole reply in seconds. Defaults to REPLY_DEADLINE.
+
+        Returns:
+            bytes: The raw reply, empty if the exchange failed.
+        """
+        received_data: bytes = b""
+        while True:
+            if not self._connect():
+                self.last_error = TERMINAL_ERROR_CONNECT
+                return received_data
+
+            sent: bool = self._send_data(data)
+            if sent:
+                received_data = self._receive_data(
+                    on_message=self.on_message,
+                    deadline=reply_deadline,
+                    is_cancelled=self.is_cancelled,
+                )
+            if received_data:
+                break
+
+            self._release(reusable=False)
+            if self.cancelled:
+                self.last_error = TERMINAL_ERROR_CANCELLED
+                return received_data
+            if not sent:
+                # A pooled socket may be half-open: the terminal dropped it while
+                # idle. The request never left, so resend once on a fresh socket.
+                if self.socket_reused:
+                    _logger.info(
+                        "PRIVAT-TRMINAL: Pooled connection to %s:%s was lost, reconnecting",
+                        self.terminal_ip,
+                        self.terminal_port,
+                    )
+                    continue
+                self.last_error = TERMINAL_ERROR_SEND
+                return received_data
+            # The request was sent, the terminal may be processing it: never resend,
+            # the payment state is decided by the committed transaction.
+            self.last_error = TERMINAL_ERROR_RECEIVE
+            return received_data
+
+        self._release(reusable=True)
+        return received_data
+
+    def _get_exchange_error(self) -> Optional[Dict[Literal["status", "info"], Any]]:
+        """
+        Describes the failure of the last exchange.
+
+        Returns:
+            Optional[Dict[str, Any]]: An error dictionary, or None if the terminal
+            replied.
+        """
+        if self.last_error == TERMINAL_ERROR_CONNECT:
+            info: str = _("Can't connect with the terminal.")
+        elif self.last_error == TERMINAL_ERROR_CANCELLED:
+            info = _("The payment was cancelled before the terminal replied.")
+        elif self.last_error == TERMINAL_ERROR_SEND:
+            info = _("Error sending data to the terminal.")
+        elif self.last_error == TERMINAL_ERROR_RECEIVE and self.connection_lost:
+            info = _(
+                "The connection to the terminal was lost after the request "
+                "was sent, the reply is lost. Check the payment on the "
+                "terminal before trying again."
+            )
+        elif self.last_error == TERMINAL_ERROR_RECEIVE:
+            info = _("Error receiving data from the terminal.")
+        elif self.last_error == TERMINAL_ERROR_QUEUE:
+            info = _("The terminal is busy with another payment, try again later.")
+        else:
+            return None
+        return {"status": "retry", "info": info}
+
+    def _complete_payment(
+        self,
+        order: OdooRecordset,
+        payment_type_id: int,
+        session_id: int,
+        received_data: bytes,
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Parses the terminal reply and stores it on the transaction.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+            session_id (int): The ID of the session.
+            received_data (bytes): The raw reply of the terminal.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the status and info of the payment request.
+        """
+        return_data, parsed_data = self._parse_data(received_data)
+        return_data: Dict[str, Any]
+        parsed_data: Dict[str, Any]
+
+        if return_data.get("status") == "retry":
+            self.last_error = (
+                TERMINAL_ERROR_BUSY
+                if return_data.get("info") == TERMINAL_ERROR_BUSY
+                else TERMINAL_ERROR_REPLY
+            )
+            return {
+                "status": "retry",
+                "info": _(
+                    "Error parsing reply from the terminal. Info %(info)s",
+                    info=return_data.get("info"),
+                ),
+            }
+        with self._span("final_write"):
+            self._create_update_transaction(
+                order_id=order,
+                payment_type_id=payment_type_id,
+                session_id=session_id,
+                status=return_data.get("status"),
+                received_data=json.dumps(parsed_data),
+            )
+
+        return {"status": "done", "info": "Payment request sent successfully."}
+
+    def _get_committed_state(
+        self, order: OdooRecordset, payment_type_id: int
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Reads the transaction as committed by other workers.
+
+        The request transaction can't see their commits, so a separate cursor is used.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+
+        Returns:
+            tuple: The committed status, received data and request reference,
+            or (None, None, None).
+        """
+        with self.env.registry.cursor() as cr:
+            cr.execute(
+                """
+                SELECT status, received_data, request_ref
+                FROM privatbank_terminal_transaction
+                WHERE transaction_key = %s
+                """,
+                (
+                    self.env["privatbank_terminal.transaction"]._make_transaction_key(
+                        f"{self.model_name},{order.id}", payment_type_id
+                    ),
+                ),
+            )
+            row: Optional[Tuple[str, str, str]] = cr.fetchone()
+        return row if row else (None, None, None)
+
+    def _check_health(self) -> Optional[Dict[Literal["status", "info"], Any]]:
+        """
+        Fails fast on a terminal the health monitor saw down, instead of waiting
+        for the connect timeout.
+
+        Returns:
+            Optional[Dict[str, Any]]: An error dictionary, or None if the terminal
+            isn't known to be down.
+        """
+        address: str = f"{self.terminal_ip}:{self.terminal_port}"
+        if health_cache.get_state(self.env, address) != STATE_DOWN:
+            return None
+        self.last_error = TERMINAL_ERROR_DOWN
+        return {
+            "status": "retry",
+            "info": _("The terminal %s is unreachable.") % address,
+        }
+
+    def _attempt_exchange(
+        self,
+        data: Dict[str, Any],
+        queue_wait: float,
+        reply_deadline: float = REPLY_DEADLINE,
+    ) -> Tuple[bytes, Optional[Dict[Literal["status", "info"], Any]]]:
+        """
+        Waits for the terminal in the queue and makes one exchange with it.
+
+        Args:
+            data (Dict[str, Any]): The request to send.
+            queue_wait (float): Maximum wait for the terminal in seconds.
+            reply_deadline (float): Timeout of the whole reply in seconds. Defaults to REPLY_DEADLINE.
+
+        Returns:
+            tuple: The raw reply and an error dictionary, or None if the exchange succeeded.
+        """
+        self.last_error = ""
+        error: Optional[Dict[Literal["status", "info"], Any]] = self._check_health()
+        if error:
+            return b"", error
+        received_data: bytes = self._run_exchange(
+            self.env.registry, data, queue_wait, reply_deadline
+        )
+        return received_data, self._get_exchange_error()
+
+    def _run_exchange(
+        self,
+        registry: Any,
+        data: Dict[str, Any],
+        queue_wait: float,
+        reply_deadline: float = REPLY_DEADLINE,
+    ) -> bytes:
+        """
+        Waits for the terminal in the queue and makes one exchange with it.
+
+        Neither the environment nor translations are used, only the queue lock
+        touches the database, on a cursor of its own: the method can run outside
+        of the request thread. The class of a failure is left in `last_error`.
+
+        Args:
+            registry (Registry): The registry the queue lock cursor is taken from.
+            data (Dict[str, Any]): The request to send.
+            queue_wait (float): Maximum wait for the terminal in seconds.
+            reply_deadline (float): Timeout of the whole reply in seconds. Defaults to REPLY_DEADLINE.
+
+        Returns:
+            bytes: The raw reply, empty if the exchange failed.
+        """
+        self.last_error = ""
+        address: str = f"{self.terminal_ip}:{self.terminal_port}"
+        try:
+            with terminal_queue(registry, address, queue_wait) as queue_cr:
+                # The callbacks of the attempt use it instead of cursors of their own
+                self.queue_cr = queue_cr
+                return self._exchange(data, reply_deadline)
+        except TerminalQueueTimeout:
+            self.last_error = TERMINAL_ERROR_QUEUE
+            return b""
+        finally:
+            self.queue_cr = None
+
+    def _attempt_payment(
+        self,
+        order: OdooRecordset,
+        payment_type_id: int,
+        session_id: int,
+        data: Dict[str, Any],
+        queue_wait: float,
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Makes one attempt of the exchange and stores the reply.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+            session_id (int): The ID of the session.
+            data (Dict[str, Any]): The request to send.
+            queue_wait (float): Maximum wait for the terminal in seconds.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the status and info of the payment request.
+        """
+        self.attempt_id = uuid.uuid4().hex
+        self.on_message = self._get_progress_publisher(order, payment_type_id)
+        self.is_cancelled = self._get_cancel_check()
+        try:
+            received_data, error = self._attempt_exchange(data, queue_wait)
+        finally:
+            self.on_message = self.is_cancelled = None
+        if error:
+            return error
+
+        return self._complete_payment(order, payment_type_id, session_id, received_data)
+
+    def _get_progress_publisher(
+        self, order: OdooRecordset, payment_type_id: int
+    ) -> MessageCallback:
+        """
+        Returns a callback that publishes the service messages of the current
+        attempt to the requesting user through the bus.
+
+        The request transaction is only committed once the payment is finished,
+        so each message is sent and committed on the cursor of the terminal queue
+        held by the exchange, or on a cursor of its own outside of it.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+
+        Returns:
+            MessageCallback: The callback for `_receive_data`.
+        """
+        registry: Any = self.env.registry
+        uid: int = self.env.uid
+        channel: Tuple[str, str, int] = (
+            self.env.cr.dbname,
+            "res.partner",
+            self.env.user.partner_id.id,
+        )
+        payload: Dict[str, Any] = {
+            "type": "privatbank_payment_progress",
+            "attempt_id": self.attempt_id,
+            "order_ref": f"{self.model_name},{order.id}",
+            "payment_type_id": payment_type_id,
+        }
+
+        def send(cr: Any, message: Dict[str, Any]) -> None:
+            params: Dict[str, Any] = message.get("params") or {}
+            env: Environment = api.Environment(cr, uid, {})
+            env["bus.bus"].sendone(
+                channel,
+                dict(payload, msg_type=params.get("msgType", ""), params=params),
+            )
+
+        def publish(message: Dict[str, Any]) -> None:
+            if not is_service_message(message):
+                return
+            queue_cr: Any = self.queue_cr
+            try:
+                with api.Environment.manage():
+                    if queue_cr is None:
+                        with registry.cursor() as cr:
+                            send(cr, message)
+                        return
+                    try:
+                        send(queue_cr, message)
+                        queue_cr.commit()
+                    except Exception:
+                        queue_cr.rollback()
+                        raise
+            except Exception:
+                _logger.exception("PRIVAT-TRMINAL: Can't publish payment progress")
+
+        return publish
+
+    def _get_cancel_check(self) -> CancelCheck:
+        """
+        Returns a check of whether the current attempt was cancelled.
+
+        A cancellation is a `privatbank.payment.cancel` request of the attempt,
+        created by `PosPaymentMethod._privatbank_cancel_payment` from another
+        request. The check consumes it on the cursor of the terminal queue held by
+        the exchange, an indexed delete that needs no connection of its own.
+
+        Returns:
+            CancelCheck: The check for `_receive_data`.
+        """
+        attempt_id: str = self.attempt_id
+
+        def is_cancelled() -> bool:
+            queue_cr: Any = self.queue_cr
+            if queue_cr is None:
+                return False
+            try:
+                queue_cr.execute(
+                    "DELETE FROM privatbank_payment_cancel WHERE attempt_id = %s "
+                    "RETURNING id",
+                    (attempt_id,),
+                )
+                cancelled: bool = bool(queue_cr.fetchall())
+                queue_cr.commit()
+            except Exception:
+                # Keep waiting for the card, the terminal may be processing it
+                _logger.exception("PRIVAT-TRMINAL: Can't check payment cancellation")
+                queue_cr.rollback()
+                return False
+            return cancelled
+
+        return is_cancelled
+
+    def send_payment_request(
+        self,
+        amount: Union[float, Decimal],
+        order_id: int,
+        payment_type_id: int,
+        session_id: int,
+        rrn_param: str = "",
+        queue_wait: Optional[float] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Sends a payment request to the terminal.
+
+        The exchange waits in a FIFO queue while another worker uses the same
+        terminal. If the terminal isn't released within `queue_wait` seconds the
+        request is answered with a busy error without being sent.
+
+        Transient failures (`deviceBusy`, connect errors) are retried according to
+        `retry_policy`. Before each retry the committed transaction is checked, so
+        a payment approved meanwhile by another worker is not sent twice.
 
+        Args:
+            amount (Union[float, Decimal]): The amount to be paid.
+            order_id (int): The ID of the order.
+            payment_type_id (int): The ID of the payment type.
+            session_id (int): The ID of the session.
+            rrn_param (str, optional): The RRN parameter. Defaults to "".
+            queue_wait (Optional[float]): Maximum wait for the terminal in seconds.
+                Defaults to the `biko_pos_privatbank.queue_max_wait` system parameter.
+            retry_policy (Optional[RetryPolicy]): The retry policy. Defaults to the
+                policy configured by the `biko_pos_privatbank.retry_*` system parameters.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the status and info of the payment request.
+        """
+        order, error = self._prepare_payment(amount, order_id, payment_type_id)
+        if error:
+            return error
+
+        if queue_wait is None:
+            queue_wait = get_queue_max_wait(self.env)
+        if retry_policy is None:
+            retry_policy = RetryPolicy.from_env(self.env)
+
+        with self._span("total"):
+            result: Dict[Literal["status", "info"], Any] = self._send_with_retries(
+                order,
+                payment_type_id,
+                session_id,
+                self._prepare_order_data(amount, rrn_param),
+                queue_wait,
+                retry_policy,
+            )
+        self._record_metrics()
+        return result
+
+    def _send_with_retries(
+        self,
+        order: OdooRecordset,
+        payment_type_id: int,
+        session_id: int,
+        data: Dict[str, Any],
+        queue_wait: float,
+        retry_policy: RetryPolicy,
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Stores the request on the transaction and runs the attempts of the payment.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+            session_id (int): The ID of the session.
+            data (Dict[str, Any]): The request to send.
+            queue_wait (float): Maximum wait for the terminal in seconds.
+            retry_policy (RetryPolicy): The retry policy.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing the status and info of the payment request.
+        """
+        _status, committed_reply, _ref = self._get_committed_state(
+            order, payment_type_id
+        )
+
+        with self._span("pre_write"):
+            self._create_update_transaction(
+                order_id=order,
+                payment_type_id=payment_type_id,
+                session_id=session_id,
+                status="waitingCard",
+                send_data=json.dumps(data),
+            )
+
+        started: float = time.monotonic()
+        retries: Dict[str, int] = {}
+        while True:
+            result: Dict[Literal["status", "info"], Any] = self._attempt_payment(
+                order, payment_type_id, session_id, data, queue_wait
+            )
+            if result.get("status") != "retry" or not retry_policy.allows(
+                self.last_error, retries, started
+            ):
+                return result
+
+            attempt: int = sum(retries.values())
+            retries[self.last_error] = retries.get(self.last_error, 0) + 1
+            _logger.info(
+                "PRIVAT-TRMINAL: Retrying payment on %s:%s after %s (retry %d)",
+                self.terminal_ip,
+                self.terminal_port,
+                self.last_error,
+                attempt + 1,
+            )
+            time.sleep(retry_policy.delay(attempt))
+
+            status, reply, _ref = self._get_committed_state(order, payment_type_id)
+            if status == "done" and reply != committed_reply:
+                _logger.info(
+                    "PRIVAT-TRMINAL: Payment for %s was completed by another worker",
+                    order.name,
+                )
+                self._create_update_transaction(
+                    order_id=order,
+                    payment_type_id=payment_type_id,
+                    session_id=session_id,
+                    status=status,
+                    received_data=reply,
+                )
+                return {"status": "done", "info": "Payment request sent successfully."}
+
+    def _is_in_flight(self, transaction: OdooRecordset) -> bool:
+        """
+        Checks whether the transaction waits for an asynchronous payment.
+
+        A transaction stuck in `waitingCard` for longer than the asynchronous
+        deadline is not, its worker process has died.
+
+        Args:
+            transaction (OdooRecordset): The transaction record.
+
+        Returns:
+            bool: True if the terminal may still reply.
+        """
+        deadline: timedelta = timedelta(
+            seconds=ASYNC_PAYMENT_TIMEOUT + ASYNC_CONNECT_TIMEOUT
+        )
+        return (
+            transaction.status == "waitingCard"
+            and fields.Datetime.now() - transaction.write_date <= deadline
+        )
+
+    def _get_async_state(
+        self, order: OdooRecordset, payment_type_id: int
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Returns the state of the asynchronous payment of `request_ref` from its
+        transaction record.
+
+        A transaction of another request is an earlier payment of the order: it
+        doesn't approve this one, which is "new" unless the other payment is still
+        waiting for the card.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+
+        Returns:
+            Dict[str, Any]: The status ("new", "pending", "done" or "retry") and info.
+        """
+        transaction: OdooRecordset = self._get_transaction(order, payment_type_id)
+        if not transaction:
+            return {"status": "new", "info": ""}
+        if not self.request_ref or transaction.request_ref != self.request_ref:
+            if self._is_in_flight(transaction):
+                return {
+                    "status": "retry",
+                    "info": _("Another payment of the order is waiting for the card."),
+                }
+            return {"status": "new", "info": ""}
+        if transaction.status == "done":
+            return {"status": "done", "info": _("Payment approved by the terminal.")}
+        if transaction.status == "waitingCard":
+            if self._is_in_flight(transaction):
+                return {"status": "pending", "info": _("Waiting for the card.")}
+            return {"status": "retry", "info": _("The terminal did not reply in time.")}
+        try:
+            data: Dict[str, Any] = json.loads(transaction.received_data or "{}")
+        except ValueError:
+            data = {}
+        return {
+            "status": "retry",
+            "info": data.get("errorDescription") or _("Unexpected error"),
+        }
+
+    def get_payment_status(
+        self,
+        amount: Union[float, Decimal],
+        order_id: int,
+        payment_type_id: int,
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Returns the state of the asynchronous payment of `request_ref` without
+        sending anything.
+
+        Args:
+            amount (Union[float, Decimal]): The amount to be paid.
+            order_id (int): The ID of the order.
+            payment_type_id (int): The ID of the payment type.
+
+        Returns:
+            Dict[str, Any]: The status ("new", "pending", "done" or "retry") and info.
+        """
+        order, error = self._prepare_payment(amount, order_id, payment_type_id)
+        if error:
+            return error
+        return self._get_async_state(order, payment_type_id)
+
+    def submit_payment_request(
+        self,
+        amount: Union[float, Decimal],
+        order_id: int,
+        payment_type_id: int,
+        session_id: int,
+        rrn_param: str = "",
+    ) -> Dict[Literal["status", "info"], Any]:
+        """
+        Queues a payment request on the background terminal event loop.
+
+        The call returns immediately. The transaction record is written when the
+        terminal replies and the requesting user is notified through the bus.
+        Calling it again for the same `request_ref` while the payment is in
+        progress or once it is approved does not resend the request, so it can be
+        used to poll the payment state. An approved payment of another request,
+        e.g. an earlier payment of the order, is not taken for this one.
+
+        As in synchronous mode, a terminal known to be down fails at once, the
+        exchange waits in the terminal queue shared with the other workers and
+        transient failures are retried according to the configured `RetryPolicy`.
+
+        Args:
+            amount (Union[float, Decimal]): The amount to be paid.
+            order_id (int): The ID of the order.
+            payment_type_id (int): The ID of the payment type.
+            session_id (int): The ID of the session.
+            rrn_param (str, optional): The RRN parameter. Defaults to "".
+
+        Returns:
+            Dict[str, Any]: The status ("pending", "done" or "retry") and info of the payment.
+        """
+        order, error = self._prepare_payment(amount, order_id, payment_type_id)
+        if error:
+            return error
+
+        state: Dict[Literal["status", "info"], Any] = self._get_async_state(
+            order, payment_type_id
+        )
+        if state["status"] in ("pending", "done"):
+            return state
+        transaction: OdooRecordset = self._get_transaction(order, payment_type_id)
+        if transaction and self._is_in_flight(transaction):
+            # The payment of another request is waiting for the card
+            return state
+        error: Optional[Dict[Literal["status", "info"], Any]] = self._check_health()
+        if error:
+            return error
+
+        data: Dict[str, Any] = self._prepare_order_data(amount, rrn_param)
         self._create_update_transaction(
             order_id=order,
             payment_type_id=payment_type_id,
@@ -346,43 +1200,134 @@ class PrivatbankTerminal:
             send_data=json.dumps(data),
         )
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as self.socket:
-            if not self._connect():
-                return {
-                    "status": "retry",
-                    "info": _("Can't connect with the terminal."),
-                }
+        env: Environment = self.env
+        terminal_ip: str = f"{self.terminal_ip}:{self.terminal_port}"
+        subsystem: str = self.subsystem
+        request_ref: str = self.request_ref
 
-            if not self._send_data(data):
-                return {
-                    "status": "retry",
-                    "info": _("Error sending data to the terminal."),
-                }
+        def finish(received_data: bytes, error_info: str) -> None:
+            _finish_async_payment(
+                dbname=env.cr.dbname,
+                uid=env.uid,
+                context=dict(env.context),
+                terminal_ip=terminal_ip,
+                subsystem=subsystem,
+                amount=amount,
+                order_id=order_id,
+                payment_type_id=payment_type_id,
+                session_id=session_id,
+                request_ref=request_ref,
+                received_data=received_data,
+                error_info=error_info,
+            )
 
-            received_data: bytes = self._receive_data()
-            if not received_data:
-                return {
-                    "status": "retry",
-                    "info": _("Error receiving data from the terminal."),
-                }
-            return_data, parsed_data = self._parse_data(received_data)
-            return_data: Dict[str, Any]
-            parsed_data: Dict[str, Any]
+        request: bytes = json.dumps(data).encode() + b"\x00"
+        self.attempt_id = uuid.uuid4().hex
+        publish: MessageCallback = self._get_progress_publisher(order, payment_type_id)
+        queue_wait: float = get_queue_max_wait(self.env)
+        retry_policy: RetryPolicy = RetryPolicy.from_env(self.env)
 
-            if return_data.get("status") == "retry":
-                return {
+        registry: Any = self.env.registry
+
+        def queue() -> ContextManager[Any]:
+            return terminal_queue(registry, terminal_ip, queue_wait)
+
+        def submit() -> None:
+            _logger.debug(f"PRIVAT-TRMINAL: SEND DATA (async): {data}")
+            get_event_loop().submit(
+                self.terminal_ip,
+                int(self.terminal_port),
+                request,
+                finish,
+                on_message=publish,
+                queue_factory=queue,
+                retry_policy=retry_policy,
+            )
+
+        # The loop must see the committed `waitingCard` record
+        self.env.cr.postcommit.add(submit)
+        return {"status": "pending", "info": _("Waiting for the card.")}
+
+    def _notify_payment(
+        self,
+        order: OdooRecordset,
+        payment_type_id: int,
+        result: Dict[Literal["status", "info"], Any],
+    ) -> None:
+        """
+        Sends the payment result to the requesting user through the bus.
+
+        Args:
+            order (OdooRecordset): The paid order.
+            payment_type_id (int): The ID of the payment type.
+            result (Dict[str, Any]): The status and info of the payment.
+
+        Returns:
+            None
+        """
+        self.env["bus.bus"].sendone(
+            (self.env.cr.dbname, "res.partner", self.env.user.partner_id.id),
+            {
+                "type": "privatbank_payment",
+                "order_ref": f"{self.model_name},{order.id}",
+                "payment_type_id": payment_type_id,
+                "status": result.get("status"),
+                "info": result.get("info"),
+            },
+        )
+
+
+def _finish_async_payment(
+    dbname: str,
+    uid: int,
+    context: Dict[str, Any],
+    terminal_ip: str,
+    subsystem: str,
+    amount: Union[float, Decimal],
+    order_id: int,
+    payment_type_id: int,
+    session_id: int,
+    request_ref: str,
+    received_data: bytes,
+    error_info: str,
+) -> None:
+    """
+    Completes an asynchronous payment in its own database transaction.
+
+    Runs in a thread of the terminal event loop executor once the exchange with
+    the terminal is finished, stores the reply and notifies the requesting user.
+    """
+    try:
+        with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+            env: Environment = api.Environment(cr, uid, context)
+            terminal: PrivatbankTerminal = PrivatbankTerminal(terminal_ip, env, subsystem)
+            terminal.request_ref = request_ref
+            order, _error = terminal._prepare_payment(amount, order_id, payment_type_id)
+
+            if received_data:
+                result: Dict[Literal["status", "info"], Any] = terminal._complete_payment(
+                    order, payment_type_id, session_id, received_data
+                )
+            else:
+                result = {
                     "status": "retry",
                     "info": _(
-                        "Error parsing reply from the terminal. Info %(info)s",
-                        info=return_data.get("info"),
+                        "Error receiving data from the terminal. Info %(info)s",
+                        info=error_info,
                     ),
                 }
-            self._create_update_transaction(
-                order_id=order,
-                payment_type_id=payment_type_id,
-                session_id=session_id,
-                status=return_data.get("status"),
-                received_data=json.dumps(parsed_data),
-            )
 
-        return {"status": "done", "info": "Payment request sent successfully."}
+            if result["status"] == "retry":
+                terminal._create_update_transaction(
+                    order_id=order,
+                    payment_type_id=payment_type_id,
+                    session_id=session_id,
+                    status="retry",
+                    received_data=json.dumps(
+                        {"error": True, "errorDescription": result["info"]}
+                    ),
+                )
+            terminal._notify_payment(order, payment_type_id, result)
+            terminal._record_metrics()
+    except Exception:
+        _logger.exception("PRIVAT-TRMINAL: Can't complete asynchronous payment")
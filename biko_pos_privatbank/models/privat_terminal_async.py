@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, ContextManager, Dict, Optional, Tuple
+
+from .privat_terminal_lock import TerminalQueueTimeout
+from .privat_terminal_protocol import (
+    RECV_BUFFER_SIZE,
+    FrameDecoder,
+    is_busy_reply,
+    is_final_message,
+    load_message,
+)
+from .privat_terminal_retry import RetryPolicy
+
+_logger = logging.getLogger(__name__)
+
+ASYNC_CONNECT_TIMEOUT: float = 10.0
+ASYNC_PAYMENT_TIMEOUT: float = 180.0
+# Threads waiting in the terminal queues for the other workers
+QUEUE_WORKERS: int = 8
+
+# Error classes of a failed exchange, the values of `PrivatbankTerminal.last_error`
+ERROR_CONNECT: str = "connect"
+ERROR_SEND: str = "send"
+ERROR_RECEIVE: str = "receive"
+ERROR_BUSY: str = "deviceBusy"
+ERROR_QUEUE: str = "queue"
+
+PaymentCallback = Callable[[bytes, str], None]
+MessageCallback = Callable[[Dict[str, Any]], None]
+QueueFactory = Callable[[], ContextManager[Any]]
+
+
+class ExchangeError(Exception):
+    """A failed asynchronous exchange and the class of its error."""
+
+    def __init__(self, error_class: str, info: str) -> None:
+        super().__init__(info)
+        self.error_class: str = error_class
+        self.info: str = info
+
+
+class TerminalEventLoop:
+    """
+    Background asyncio loop owning the terminal sockets of the worker process.
+
+    Payment requests are submitted from Odoo request threads and awaited by the
+    loop, so a request thread is released as soon as the request is queued and a
+    single process can wait for the card on many terminals at once. Requests to
+    the same terminal are serialized, the terminal handles one transaction at a time:
+    within the process by an asyncio lock, across workers by the terminal queue.
+
+    Waiting in the terminal queue blocks, it runs on an executor of its own, so
+    payments waiting for busy terminals never take the threads of the default
+    executor. Releasing a terminal has its own thread too and never waits behind
+    payments still queued for other terminals.
+    """
+
+    def __init__(self) -> None:
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.queue_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=QUEUE_WORKERS, thread_name_prefix="privatbank-queue"
+        )
+        self.release_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="privatbank-queue-release"
+        )
+        self.thread: threading.Thread = threading.Thread(
+            target=self._run,
+            name="privatbank-terminal-loop",
+            daemon=True,
+        )
+        self._terminal_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _get_terminal_lock(self, host: str, port: int) -> asyncio.Lock:
+        # Only called from the loop thread, no extra locking required
+        key: Tuple[str, int] = (host, port)
+        lock: Optional[asyncio.Lock] = self._terminal_locks.get(key)
+        if lock is None:
+            lock = self._terminal_locks[key] = asyncio.Lock()
+        return lock
+
+    async def _exchange(
+        self,
+        host: str,
+        port: int,
+        request: bytes,
+        timeout: float,
+        on_message: Optional[MessageCallback] = None,
+        queue_factory: Optional[QueueFactory] = None,
+    ) -> bytes:
+        """
+        Sends one NUL-terminated request and waits for the final reply frame.
+
+        Requests of this process are serialized by an asyncio lock. The terminal
+        is then taken from the other workers through `queue_factory`, the same
+        advisory-lock queue as the synchronous payments wait in.
+
+        Args:
+            host (str): The IP address of the terminal.
+            port (int): The TCP port of the terminal.
+            request (bytes): The encoded request including the trailing NUL byte.
+            timeout (float): Overall deadline of the exchange in seconds.
+            on_message (Optional[MessageCallback]): Called in an executor thread
+                with each intermediate service message.
+            queue_factory (Optional[QueueFactory]): Returns the context manager
+                holding the terminal across workers.
+
+        Returns:
+            bytes: The final reply frame without the NUL delimiter.
+
+        Raises:
+            ExchangeError: If the exchange failed, with the class of the error.
+        """
+        async with self._get_terminal_lock(host, port):
+            queue: Optional[ContextManager[Any]] = None
+            if queue_factory is not None:
+                queue = queue_factory()
+                try:
+                    # Waiting for the other workers blocks, keep it off the loop thread
+                    await self.loop.run_in_executor(
+                        self.queue_executor, queue.__enter__
+                    )
+                except TerminalQueueTimeout as e:
+                    raise ExchangeError(
+                        ERROR_QUEUE, "The terminal is busy with another payment"
+                    ) from e
+            try:
+                return await self._send_request(host, port, request, timeout, on_message)
+            finally:
+                if queue is not None:
+                    await self.loop.run_in_executor(
+                        self.release_executor, queue.__exit__, None, None, None
+                    )
+
+    async def _send_request(
+        self,
+        host: str,
+        port: int,
+        request: bytes,
+        timeout: float,
+        on_message: Optional[MessageCallback] = None,
+    ) -> bytes:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port),
+                timeout=ASYNC_CONNECT_TIMEOUT,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ExchangeError(
+                ERROR_CONNECT, str(e) or "Timeout connecting to the terminal"
+            ) from e
+        try:
+            try:
+                writer.write(request)
+                await writer.drain()
+            except OSError as e:
+                raise ExchangeError(ERROR_SEND, str(e) or e.__class__.__name__) from e
+            try:
+                return await asyncio.wait_for(
+                    self._read_reply(reader, on_message), timeout=timeout
+                )
+            except asyncio.TimeoutError as e:
+                raise ExchangeError(
+                    ERROR_RECEIVE, "Timeout waiting for the terminal reply"
+                ) from e
+            except (OSError, ValueError) as e:
+                raise ExchangeError(
+                    ERROR_RECEIVE, str(e) or e.__class__.__name__
+                ) from e
+        finally:
+            writer.close()
+
+    async def _read_reply(
+        self,
+        reader: asyncio.StreamReader,
+        on_message: Optional[MessageCallback] = None,
+    ) -> bytes:
+        decoder: FrameDecoder = FrameDecoder()
+        while True:
+            data: bytes = await reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("Connection closed by the terminal")
+            frame: bytes
+            for frame in decoder.feed(data):
+                message: Optional[Dict[str, Any]] = load_message(frame)
+                if is_final_message(message):
+                    return frame
+                _logger.debug(f"PRIVAT-TRMINAL: SERVICE MESSAGE: {frame}")
+                if on_message is not None:
+                    # Publishing touches the database, don't wait for it
+                    self.loop.run_in_executor(None, on_message, message)
+
+    async def _run_payment(
+        self,
+        host: str,
+        port: int,
+        request: bytes,
+        timeout: float,
+        callback: PaymentCallback,
+        on_message: Optional[MessageCallback] = None,
+        queue_factory: Optional[QueueFactory] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
+        reply: bytes = b""
+        error: str = ""
+        started: float = time.monotonic()
+        retries: Dict[str, int] = {}
+        while True:
+            error_class: str = ""
+            error = ""
+            try:
+                reply = await self._exchange(
+                    host, port, request, timeout, on_message, queue_factory
+                )
+                _logger.debug(f"PRIVAT-TRMINAL: RECEIVED DATA: {reply}")
+                if is_busy_reply(reply):
+                    error_class = ERROR_BUSY
+            except ExchangeError as e:
+                reply, error_class, error = b"", e.error_class, e.info
+            except Exception as e:
+                _logger.exception("PRIVAT-TRMINAL: Error in asynchronous exchange")
+                reply, error = b"", str(e) or e.__class__.__name__
+
+            # Only failures where the terminal did not process the request are retried
+            if (
+                not error_class
+                or retry_policy is None
+                or not retry_policy.allows(error_class, retries, started)
+            ):
+                break
+            attempt: int = sum(retries.values())
+            retries[error_class] = retries.get(error_class, 0) + 1
+            _logger.info(
+                "PRIVAT-TRMINAL: Retrying asynchronous payment on %s:%s after %s (retry %d)",
+                host,
+                port,
+                error_class,
+                attempt + 1,
+            )
+            await asyncio.sleep(retry_policy.delay(attempt))
+
+        # The callback touches the database, keep it off the loop thread
+        await self.loop.run_in_executor(None, callback, reply, error)
+
+    def submit(
+        self,
+        host: str,
+        port: int,
+        request: bytes,
+        callback: PaymentCallback,
+        timeout: float = ASYNC_PAYMENT_TIMEOUT,
+        on_message: Optional[MessageCallback] = None,
+        queue_factory: Optional[QueueFactory] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> "Future[Any]":
+        """
+        Queues a payment exchange on the loop.
+
+        Args:
+            host (str): The IP address of the terminal.
+            port (int): The TCP port of the terminal.
+            request (bytes): The encoded request including the trailing NUL byte.
+            callback (PaymentCallback): Called with the raw reply and an error text
+                (empty on success) once the exchange is finished.
+            timeout (float): Overall deadline of the exchange in seconds.
+            on_message (Optional[MessageCallback]): Called with each intermediate
+                service message.
+            queue_factory (Optional[QueueFactory]): Returns the context manager
+                holding the terminal across workers, see `terminal_queue`.
+            retry_policy (Optional[RetryPolicy]): Retries of the transient failures.
+                Defaults to no retry.
+
+        Returns:
+            Future: Resolved after the callback has run.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._run_payment(
+                host,
+                port,
+                request,
+                timeout,
+                callback,
+                on_message,
+                queue_factory,
+                retry_policy,
+            ),
+            self.loop,
+        )
+
+
+_event_loop: Optional[TerminalEventLoop] = None
+_event_loop_lock: threading.Lock = threading.Lock()
+
+
+def get_event_loop() -> TerminalEventLoop:
+    """
+    Returns the terminal event loop of this process, starting it on first use.
+
+    Returns:
+        TerminalEventLoop: The process-wide loop.
+    """
+    global _event_loop
+    if _event_loop is None:
+        with _event_loop_lock:
+            if _event_loop is None:
+                _event_loop = TerminalEventLoop()
+    return _event_loop
@@ -0,0 +1,119 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+BUSY_COOLDOWN: float = 15.0
+DOWN_COOLDOWN: float = 60.0
+
+
+class TerminalDispatcher:
+    """
+    Tracks the load of the terminals used by this worker process.
+
+    A terminal is considered busy for `BUSY_COOLDOWN` seconds after it answered
+    `deviceBusy` and unreachable for `DOWN_COOLDOWN` seconds after a failed
+    connect. Requests in flight from this process are counted per terminal.
+    """
+
+    def __init__(
+        self,
+        busy_cooldown: float = BUSY_COOLDOWN,
+        down_cooldown: float = DOWN_COOLDOWN,
+    ) -> None:
+        self.busy_cooldown: float = busy_cooldown
+        self.down_cooldown: float = down_cooldown
+        self._lock: threading.Lock = threading.Lock()
+        self._state: Dict[str, Dict[str, float]] = {}
+
+    def _get_state(self, address: str) -> Dict[str, float]:
+        state: Optional[Dict[str, float]] = self._state.get(address)
+        if state is None:
+            state = self._state[address] = {
+                "in_flight": 0,
+                "busy_until": 0.0,
+                "down_until": 0.0,
+                "last_used": 0.0,
+            }
+        return state
+
+    def rank(self, addresses: List[str]) -> List[str]:
+        """
+        Orders the terminals from the most to the least suitable one.
+
+        Reachable terminals come first, then idle ones, then the ones with the
+        fewest requests in flight; ties go to the least recently used terminal.
+        Unreachable and busy terminals are kept at the end of the list as a last resort.
+
+        Args:
+            addresses (List[str]): Terminal addresses in the 'IP:PORT' format.
+
+        Returns:
+            List[str]: The addresses in dispatch order.
+        """
+        now: float = time.monotonic()
+
+        def sort_key(address: str) -> Tuple[bool, bool, float, float]:
+            state: Dict[str, float] = self._get_state(address)
+            return (
+                state["down_until"] > now,
+                state["busy_until"] > now,
+                state["in_flight"],
+                state["last_used"],
+            )
+
+        with self._lock:
+            return sorted(dict.fromkeys(addresses), key=sort_key)
+
+    @contextmanager
+    def reserve(self, address: str) -> Iterator[None]:
+        """Counts a request in flight to the terminal for the duration of the block."""
+        with self._lock:
+            state: Dict[str, float] = self._get_state(address)
+            state["in_flight"] += 1
+            state["last_used"] = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                state["in_flight"] -= 1
+
+    def mark_busy(self, address: str) -> None:
+        with self._lock:
+            self._get_state(address)["busy_until"] = time.monotonic() + self.busy_cooldown
+
+    def mark_down(self, address: str) -> None:
+        with self._lock:
+            self._get_state(address)["down_until"] = time.monotonic() + self.down_cooldown
+
+    def mark_idle(self, address: str) -> None:
+        with self._lock:
+            state: Dict[str, float] = self._get_state(address)
+            state["busy_until"] = 0.0
+            state["down_until"] = 0.0
+
+    def get_state(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the dispatcher view of every known terminal.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Requests in flight and busy/down flags keyed by 'IP:PORT'.
+        """
+        now: float = time.monotonic()
+        with self._lock:
+            return {
+                address: {
+                    "in_flight": int(state["in_flight"]),
+                    "busy": state["busy_until"] > now,
+                    "down": state["down_until"] > now,
+                }
+                for address, state in self._state.items()
+            }
+
+
+_dispatcher: TerminalDispatcher = TerminalDispatcher()
+
+
+def get_dispatcher() -> TerminalDispatcher:
+    """Returns the dispatcher of this worker process."""
+    return _dispatcher
@@ -0,0 +1,244 @@
+import codecs
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import odoo
+import xlsxwriter
+from odoo import api
+
+EXPORT_CURSOR_NAME: str = "privatbank_transaction_export"
+EXPORT_ITERSIZE: int = 2000
+# Size of the pieces the finished XLSX file is sent in
+EXPORT_FILE_CHUNK: int = 64 * 1024
+
+SUBSYSTEM_MODELS: Dict[str, Tuple[str, ...]] = {
+    "SALE": ("sale.order", "sale.stock.return"),
+    "POS": ("pos.order",),
+}
+
+# Header and SQL expression of each exported column
+EXPORT_COLUMNS: List[Tuple[str, str]] = [
+    ("ID", "t.id"),
+    ("Date", "t.create_date"),
+    ("Status", "t.status"),
+    (
+        "Subsystem",
+        "CASE WHEN t.order_ref LIKE 'pos.order,%%' THEN 'POS' ELSE 'SALE' END",
+    ),
+    ("Order", "t.order_receipt"),
+    ("Order Reference", "t.order_ref"),
+    ("Session", "s.name"),
+    ("Payment Type", "pt.name"),
+    ("Amount", "t.amount"),
+    ("Card", "t.card_mask"),
+    ("Bank", "t.bank_name"),
+    ("Auth Code", "t.auth_code"),
+    ("RRN", "t.rrn"),
+    ("Payment System", "t.payment_system"),
+    ("Terminal ID", "t.terminal_id"),
+    ("Receipt No", "t.receipt_no"),
+]
+
+
+class ExportFilter:
+    """
+    Filter of the terminal transaction export.
+    """
+
+    def __init__(
+        self,
+        terminal_id: Optional[str] = None,
+        session_id: Optional[int] = None,
+        subsystem: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> None:
+        """
+        Initializes the filter, empty values don't filter.
+
+        Args:
+            terminal_id (Optional[str]): The terminal ID reported by the bank.
+            session_id (Optional[int]): The POS session ID.
+            subsystem (Optional[str]): "SALE" or "POS".
+            date_from (Optional[date]): First day of the period.
+            date_to (Optional[date]): Last day of the period, inclusive.
+
+        Returns:
+            None
+        """
+        self.terminal_id: Optional[str] = terminal_id
+        self.session_id: Optional[int] = session_id
+        self.subsystem: Optional[str] = subsystem
+        self.date_from: Optional[date] = date_from
+        self.date_to: Optional[date] = date_to
+
+    @classmethod
+    def from_params(cls, params: Dict[str, str]) -> "ExportFilter":
+        """
+        Builds the filter from the query string of the export request.
+
+        Args:
+            params (Dict[str, str]): `terminal_id`, `session_id`, `subsystem`,
+                `date_from` and `date_to` (YYYY-MM-DD).
+
+        Returns:
+            ExportFilter: The filter.
+
+        Raises:
+            ValueError: If a value can't be parsed.
+        """
+        subsystem: Optional[str] = (params.get("subsystem") or "").upper() or None
+        if subsystem and subsystem not in SUBSYSTEM_MODELS:
+            raise ValueError(f"Unknown subsystem: {subsystem}")
+        return cls(
+            terminal_id=params.get("terminal_id") or None,
+            session_id=int(params["session_id"]) if params.get("session_id") else None,
+            subsystem=subsystem,
+            date_from=date.fromisoformat(params["date_from"])
+            if params.get("date_from")
+            else None,
+            date_to=date.fromisoformat(params["date_to"])
+            if params.get("date_to")
+            else None,
+        )
+
+    def get_query(self) -> Tuple[str, List[Any]]:
+        """
+        Builds the export query.
+
+        Returns:
+            tuple: The SQL query and its parameters.
+        """
+        where: List[str] = ["TRUE"]
+        params: List[Any] = []
+        if self.terminal_id:
+            where.append("t.terminal_id = %s")
+            params.append(self.terminal_id)
+        if self.session_id:
+            where.append("t.session_id = %s")
+            params.append(self.session_id)
+        if self.subsystem:
+            where.append("split_part(t.order_ref, ',', 1) IN %s")
+            params.append(SUBSYSTEM_MODELS[self.subsystem])
+        if self.date_from:
+            where.append("t.create_date >= %s")
+            params.append(self.date_from)
+        if self.date_to:
+            where.append("t.create_date < %s")
+            params.append(self.date_to + timedelta(days=1))
+        columns: str = ", ".join(expression for _header, expression in EXPORT_COLUMNS)
+        query: str = f"""
+            SELECT {columns}
+            FROM privatbank_terminal_transaction t
+            LEFT JOIN pos_session s ON s.id = t.session_id
+            LEFT JOIN so_payment_type pt ON pt.id = t.so_payment_type_id
+            WHERE {" AND ".join(where)}
+            ORDER BY t.id
+        """
+        return query, params
+
+
+def iter_export_rows(
+    dbname: str, export_filter: ExportFilter
+) -> Iterator[Sequence[Any]]:
+    """
+    Yields the exported rows from a server-side cursor.
+
+    The rows are fetched `EXPORT_ITERSIZE` at a time, so memory use doesn't depend
+    on the size of the export. The generator opens its own cursor, the response
+    body is consumed after the request cursor is closed.
+
+    Args:
+        dbname (str): The database name.
+        export_filter (ExportFilter): The filter of the export.
+
+    Returns:
+        Iterator[Sequence[Any]]: The rows in the order of `EXPORT_COLUMNS`.
+    """
+    query, params = export_filter.get_query()
+    with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+        server_cursor = cr._cnx.cursor(EXPORT_CURSOR_NAME)
+        server_cursor.itersize = EXPORT_ITERSIZE
+        try:
+            server_cursor.execute(query, params)
+            yield from server_cursor
+        finally:
+            server_cursor.close()
+
+
+def _format_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def stream_csv(rows: Iterator[Sequence[Any]]) -> Iterator[bytes]:
+    """
+    Encodes the rows as CSV, one chunk per `EXPORT_ITERSIZE` rows.
+
+    Args:
+        rows (Iterator[Sequence[Any]]): The rows from `iter_export_rows`.
+
+    Returns:
+        Iterator[bytes]: UTF-8 CSV chunks, starting with the BOM, so Excel detects the encoding.
+    """
+    yield codecs.BOM_UTF8
+    buffer: io.StringIO = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _expression in EXPORT_COLUMNS])
+    row_no: int
+    row: Sequence[Any]
+    for row_no, row in enumerate(rows, start=1):
+        writer.writerow([_format_value(value) for value in row])
+        if row_no % EXPORT_ITERSIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def stream_xlsx(rows: Iterator[Sequence[Any]]) -> Iterator[bytes]:
+    """
+    Writes the rows to an XLSX workbook and yields the file.
+
+    The workbook is written in `constant_memory` mode, each row is flushed to a
+    temporary file as soon as the next one starts, and the finished file is read
+    back in chunks.
+
+    Args:
+        rows (Iterator[Sequence[Any]]): The rows from `iter_export_rows`.
+
+    Returns:
+        Iterator[bytes]: Chunks of the XLSX file.
+    """
+    fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="privatbank_export_")
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(
+            path,
+            {
+                "constant_memory": True,
+                "default_date_format": "yyyy-mm-dd hh:mm:ss",
+            },
+        )
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, [header for header, _expression in EXPORT_COLUMNS])
+        row_no: int
+        row: Sequence[Any]
+        for row_no, row in enumerate(rows, start=1):
+            worksheet.write_row(row_no, 0, row)
+        workbook.close()
+
+        with open(path, "rb") as export_file:
+            chunk: bytes = export_file.read(EXPORT_FILE_CHUNK)
+            while chunk:
+                yield chunk
+                chunk = export_file.read(EXPORT_FILE_CHUNK)
+    finally:
+        os.unlink(path)
@@ -0,0 +1,89 @@
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from odoo.api import Environment
+
+PROBE_TIMEOUT: float = 3.0
+# How long a worker trusts the status read from the database
+HEALTH_CACHE_TTL: float = 30.0
+# The monitor runs every minute, older results are not trusted
+STATUS_MAX_AGE: float = 180.0
+
+STATE_UP: str = "up"
+STATE_DEGRADED: str = "degraded"
+STATE_DOWN: str = "down"
+
+
+def probe(address: str, timeout: float = PROBE_TIMEOUT) -> Tuple[bool, float, str]:
+    """
+    Checks that the terminal accepts TCP connections.
+
+    Args:
+        address (str): The terminal address in the 'IP:PORT' format.
+        timeout (float): Connect timeout in seconds. Defaults to PROBE_TIMEOUT.
+
+    Returns:
+        tuple: Whether the terminal is reachable, the connect latency in
+        milliseconds and the error text.
+    """
+    started: float = time.perf_counter()
+    try:
+        host, port = address.rsplit(":", 1)
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            pass
+    except (OSError, ValueError) as e:
+        return False, 0.0, str(e) or e.__class__.__name__
+    return True, (time.perf_counter() - started) * 1000.0, ""
+
+
+class HealthCache:
+    """
+    Per-process cache of the terminal states written by the health monitor,
+    so payments can fail fast on a known-dead terminal without a query each time.
+    """
+
+    def __init__(self, ttl: float = HEALTH_CACHE_TTL) -> None:
+        self.ttl: float = ttl
+        self._lock: threading.Lock = threading.Lock()
+        self._states: Dict[str, Tuple[str, float]] = {}
+        self._loaded_at: float = 0.0
+
+    def _reload(self, env: Environment) -> None:
+        env.cr.execute(
+            """
+            SELECT terminal_ip, state
+            FROM privatbank_terminal_status
+            WHERE last_check > (now() AT TIME ZONE 'UTC') - %s * interval '1 second'
+            """,
+            (int(STATUS_MAX_AGE),),
+        )
+        now: float = time.monotonic()
+        with self._lock:
+            self._states = {address: (state, now) for address, state in env.cr.fetchall()}
+            self._loaded_at = now
+
+    def get_state(self, env: Environment, address: str) -> Optional[str]:
+        """
+        Returns the last known state of the terminal.
+
+        Args:
+            env (Environment): The Odoo environment object.
+            address (str): The terminal address in the 'IP:PORT' format.
+
+        Returns:
+            Optional[str]: "up", "degraded", "down" or None if the state is unknown or outdated.
+        """
+        if time.monotonic() - self._loaded_at > self.ttl:
+            self._reload(env)
+        with self._lock:
+            cached: Optional[Tuple[str, float]] = self._states.get(address)
+        return cached[0] if cached else None
+
+    def set_state(self, address: str, state: str) -> None:
+        with self._lock:
+            self._states[address] = (state, time.monotonic())
+
+
+health_cache: HealthCache = HealthCache()
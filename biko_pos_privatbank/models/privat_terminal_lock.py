@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import psycopg2
+from odoo.api import Environment
+
+_logger = logging.getLogger(__name__)
+
+QUEUE_MAX_WAIT: float = 60.0
+QUEUE_MAX_WAIT_PARAM: str = "biko_pos_privatbank.queue_max_wait"
+# First key of the two-key advisory locks taken for terminals
+LOCK_NAMESPACE: int = 0x50425431
+
+LOCK_NOT_AVAILABLE: str = "55P03"
+
+
+class TerminalQueueTimeout(Exception):
+    pass
+
+
+def _lock_key(address: str) -> Tuple[int, int]:
+    return LOCK_NAMESPACE, zlib.crc32(address.encode()) & 0x7FFFFFFF
+
+
+def get_queue_max_wait(env: Environment) -> float:
+    """
+    Returns the maximum time a payment waits for a terminal used by another worker.
+
+    Args:
+        env (Environment): The Odoo environment object.
+
+    Returns:
+        float: Seconds, from the `biko_pos_privatbank.queue_max_wait` system parameter.
+    """
+    value: str = env["ir.config_parameter"].sudo().get_param(QUEUE_MAX_WAIT_PARAM, "")
+    try:
+        return float(value) if value else QUEUE_MAX_WAIT
+    except ValueError:
+        return QUEUE_MAX_WAIT
+
+
+class QueueStats:
+    """Wait-time statistics of the terminal queues in this worker process."""
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, address: str, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            stats: Dict[str, float] = self._stats.setdefault(
+                address,
+                {"acquired": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0},
+            )
+            stats["timeouts" if timed_out else "acquired"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def get(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            result: Dict[str, Dict[str, float]] = {}
+            for address, stats in self._stats.items():
+                count: float = stats["acquired"] + stats["timeouts"]
+                result[address] = dict(
+                    stats,
+                    wait_avg=round(stats["wait_total"] / count, 4) if count else 0.0,
+                )
+            return result
+
+
+queue_stats: QueueStats = QueueStats()
+
+
+@contextmanager
+def terminal_queue(registry: Any, address: str, max_wait: float) -> Iterator[Any]:
+    """
+    Holds the terminal exclusively across all workers for the duration of the block.
+
+    The lock is a session-level PostgreSQL advisory lock taken on a dedicated
+    cursor, so it neither depends on nor delays the request transaction. The
+    transaction of the cursor ends as soon as the lock is granted: the connection
+    isn't left idle in transaction while the terminal is in use. The lock is
+    released explicitly at the end of the block, and by PostgreSQL when the
+    connection of a dead worker is closed. PostgreSQL grants waiters of the same
+    lock in arrival order, which gives a fair FIFO queue; `lock_timeout` bounds
+    the wait.
+
+    The block may run short transactions of its own on the cursor, the lock
+    outlives their commits and rollbacks.
+
+    Args:
+        registry (Registry): The registry of the database.
+        address (str): The terminal address in the 'IP:PORT' format.
+        max_wait (float): Maximum wait in seconds.
+
+    Yields:
+        Cursor: The cursor holding the lock.
+
+    Raises:
+        TerminalQueueTimeout: If the terminal wasn't released in time.
+    """
+    key: Tuple[int, int] = _lock_key(address)
+    started: float = time.monotonic()
+    cr: Any = registry.cursor()
+    locked: bool = False
+    try:
+        try:
+            cr.execute("SET LOCAL lock_timeout = %s", (f"{max(int(max_wait * 1000), 1)}ms",))
+            cr.execute("SELECT pg_advisory_lock(%s, %s)", key)
+        except psycopg2.OperationalError as e:
+            if e.pgcode != LOCK_NOT_AVAILABLE:
+                raise
+            waited: float = time.monotonic() - started
+            queue_stats.record(address, waited, timed_out=True)
+            _logger.info(
+                "PRIVAT-TRMINAL: Gave up waiting %.1fs for terminal %s", waited, address
+            )
+            raise TerminalQueueTimeout(address) from e
+        locked = True
+        cr.commit()
+
+        waited = time.monotonic() - started
+        queue_stats.record(address, waited, timed_out=False)
+        if waited > 1:
+            _logger.info(
+                "PRIVAT-TRMINAL: Waited %.1fs in queue for terminal %s", waited, address
+            )
+        yield cr
+    finally:
+        try:
+            cr.rollback()
+            if locked:
+                cr.execute("SELECT pg_advisory_unlock(%s, %s)", key)
+                cr.commit()
+        except Exception:
+            _logger.exception("PRIVAT-TRMINAL: Can't release terminal %s", address)
+        finally:
+            cr.close()
+
+
+def get_queue_depths(env: Environment, addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Reads the current queue of each terminal across all workers.
+
+    Args:
+        env (Environment): The Odoo environment object.
+        addresses (List[str]): Terminal addresses in the 'IP:PORT' format.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Whether the terminal is in use and how many
+        payments are waiting for it, keyed by address.
+    """
+    result: Dict[str, Dict[str, Any]] = {}
+    address: str
+    for address in addresses:
+        env.cr.execute(
+            """
+            SELECT
+                COALESCE(bool_or(granted), FALSE),
+                count(*) FILTER (WHERE NOT granted)
+            FROM pg_locks
+            WHERE locktype = 'advisory'
+                AND classid = %s
+                AND objid = %s
+                AND objsubid = 2
+            """,
+            _lock_key(address),
+        )
+        in_use, waiting = env.cr.fetchone()
+        result[address] = {"in_use": in_use, "waiting": waiting}
+    return result
@@ -0,0 +1,154 @@
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# RRN of PrivatBank terminals: 12 digits
+RRN_PATTERN: "re.Pattern[str]" = re.compile(r"(?<!\d)\d{12}(?!\d)")
+TOKEN_PATTERN: "re.Pattern[str]" = re.compile(r"[A-Za-z0-9]+")
+
+MATCH_RRN: str = "rrn"
+MATCH_TERMINAL: str = "terminal"
+
+
+class TerminalTransaction(NamedTuple):
+    id: int
+    rrn: Optional[str]
+    amount: Optional[float]
+    terminal_id: Optional[str]
+    date: date
+
+
+class StatementLine(NamedTuple):
+    id: int
+    date: date
+    amount: float
+    text: str
+
+
+class MatchResult(NamedTuple):
+    # (statement line ID, transaction ID, key the match was made on)
+    matched: List[Tuple[int, int, str]]
+    # (statement line ID, candidate transaction IDs)
+    ambiguous: List[Tuple[int, List[int]]]
+    unmatched_lines: List[int]
+    unmatched_transactions: List[int]
+
+
+def _cents(amount: Optional[float]) -> Optional[int]:
+    return None if amount is None else int(round(amount * 100))
+
+
+class TransactionMatcher:
+    """
+    Matches bank statement lines to terminal transactions through hash maps.
+
+    Transactions are indexed once by RRN and by (terminal ID, amount), so every
+    statement line is matched by a few dictionary lookups instead of being
+    compared with every transaction. A line is matched by the RRN found in its
+    text first, then by a terminal ID found in its text and its amount. Both
+    require the same amount and a transaction date within `window_days` before
+    the statement line date.
+    """
+
+    def __init__(
+        self, transactions: Iterable[TerminalTransaction], window_days: int = 3
+    ) -> None:
+        self.window: timedelta = timedelta(days=window_days)
+        self.transactions: Dict[int, TerminalTransaction] = {}
+        self.by_rrn: Dict[str, List[TerminalTransaction]] = defaultdict(list)
+        self.by_terminal_amount: Dict[
+            Tuple[str, int], List[TerminalTransaction]
+        ] = defaultdict(list)
+
+        transaction: TerminalTransaction
+        for transaction in transactions:
+            self.transactions[transaction.id] = transaction
+            if transaction.rrn:
+                self.by_rrn[transaction.rrn].append(transaction)
+            if transaction.terminal_id and transaction.amount is not None:
+                self.by_terminal_amount[
+                    (transaction.terminal_id.upper(), _cents(transaction.amount))
+                ].append(transaction)
+        self.terminal_ids: Set[str] = {
+            terminal_id for terminal_id, _amount in self.by_terminal_amount
+        }
+
+    def _candidates(
+        self,
+        line: StatementLine,
+        transactions: Iterable[TerminalTransaction],
+        used: Set[int],
+    ) -> List[TerminalTransaction]:
+        cents: Optional[int] = _cents(line.amount)
+        return [
+            transaction
+            for transaction in transactions
+            if transaction.id not in used
+            and _cents(transaction.amount) == cents
+            and line.date - self.window <= transaction.date <= line.date
+        ]
+
+    def match(self, lines: Iterable[StatementLine]) -> MatchResult:
+        """
+        Matches the statement lines.
+
+        Args:
+            lines (Iterable[StatementLine]): The statement lines.
+
+        Returns:
+            MatchResult: Matched pairs, ambiguous lines with their candidates and
+            the lines and transactions left unmatched.
+        """
+        matched: List[Tuple[int, int, str]] = []
+        ambiguous: List[Tuple[int, List[int]]] = []
+        unmatched_lines: List[int] = []
+        used: Set[int] = set()
+
+        line: StatementLine
+        for line in lines:
+            # Keyed by ID: the text joins payment_ref and ref, which often
+            # repeat the same RRN
+            candidates: Dict[int, TerminalTransaction] = {}
+            key: str = MATCH_RRN
+            rrn: str
+            for rrn in set(RRN_PATTERN.findall(line.text)):
+                candidates.update(
+                    (candidate.id, candidate)
+                    for candidate in self._candidates(
+                        line, self.by_rrn.get(rrn, []), used
+                    )
+                )
+            if not candidates:
+                key = MATCH_TERMINAL
+                cents: Optional[int] = _cents(line.amount)
+                token: str
+                for token in {t.upper() for t in TOKEN_PATTERN.findall(line.text)}:
+                    if token in self.terminal_ids:
+                        candidates.update(
+                            (candidate.id, candidate)
+                            for candidate in self._candidates(
+                                line,
+                                self.by_terminal_amount.get((token, cents), []),
+                                used,
+                            )
+                        )
+
+            if len(candidates) == 1:
+                transaction_id: int = next(iter(candidates))
+                matched.append((line.id, transaction_id, key))
+                used.add(transaction_id)
+            elif candidates:
+                ambiguous.append((line.id, sorted(candidates)))
+            else:
+                unmatched_lines.append(line.id)
+
+        ambiguous_ids: Set[int] = {
+            transaction_id for _line, ids in ambiguous for transaction_id in ids
+        }
+        unmatched_transactions: List[int] = [
+            transaction_id
+            for transaction_id in self.transactions
+            if transaction_id not in used and transaction_id not in ambiguous_ids
+        ]
+        return MatchResult(matched, ambiguous, unmatched_lines, unmatched_transactions)
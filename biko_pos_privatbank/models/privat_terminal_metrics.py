@@ -0,0 +1,184 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets in seconds, the last bucket is +Inf
+BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+# Phases of a payment in the order they happen
+PHASES: Tuple[str, ...] = (
+    "pre_write",
+    "connect",
+    "send",
+    "card_wait",
+    "receive",
+    "decode",
+    "parse",
+    "final_write",
+    "total",
+)
+FLUSH_INTERVAL: float = 30.0
+
+MetricKey = Tuple[str, str, str]
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, non-cumulative counts."""
+
+    def __init__(
+        self, counts: Optional[List[int]] = None, total: float = 0.0
+    ) -> None:
+        self.counts: List[int] = list(counts or [0] * (len(BUCKETS) + 1))
+        self.total: float = total
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket that contains it.
+
+        Args:
+            q (float): The quantile in the 0-1 range.
+
+        Returns:
+            float: The estimate in seconds, the last finite bound for the +Inf bucket.
+        """
+        count: int = self.count
+        if not count:
+            return 0.0
+        rank: float = q * count
+        seen: int = 0
+        index: int
+        bucket_count: int
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return BUCKETS[min(index, len(BUCKETS) - 1)]
+        return BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """
+    Per-process latency histograms keyed by terminal, subsystem and phase.
+
+    Observations are accumulated in memory and periodically flushed as deltas
+    to `privatbank.terminal.metric`, which aggregates all worker processes.
+    """
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._pending: Dict[MetricKey, Histogram] = {}
+        self._flushed_at: float = time.monotonic()
+
+    def record(self, terminal: str, subsystem: str, timings: Dict[str, float]) -> None:
+        """
+        Records the phase durations of one payment.
+
+        Args:
+            terminal (str): The terminal address in the 'IP:PORT' format.
+            subsystem (str): 'SALE' or 'POS'.
+            timings (Dict[str, float]): Durations in seconds keyed by phase.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            phase: str
+            value: float
+            for phase, value in timings.items():
+                key: MetricKey = (terminal, subsystem, phase)
+                histogram: Optional[Histogram] = self._pending.get(key)
+                if histogram is None:
+                    histogram = self._pending[key] = Histogram()
+                histogram.observe(value)
+
+    def flush_due(self) -> bool:
+        return time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+
+    def take(self) -> Dict[MetricKey, Histogram]:
+        """Returns and resets the observations made since the last flush."""
+        with self._lock:
+            pending: Dict[MetricKey, Histogram] = self._pending
+            self._pending = {}
+            self._flushed_at = time.monotonic()
+        return pending
+
+    def restore(self, pending: Dict[MetricKey, Histogram]) -> None:
+        """Puts back observations whose flush failed."""
+        with self._lock:
+            key: MetricKey
+            histogram: Histogram
+            for key, histogram in pending.items():
+                self._pending.setdefault(key, Histogram()).merge(histogram)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(
+    histograms: Iterable[Tuple[MetricKey, Histogram]],
+    name: str = "privatbank_terminal_phase_seconds",
+) -> str:
+    """
+    Renders histograms in the Prometheus text exposition format.
+
+    Args:
+        histograms (Iterable[Tuple[MetricKey, Histogram]]): Histograms keyed by
+            (terminal, subsystem, phase).
+        name (str): The metric name.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines: List[str] = [
+        f"# HELP {name} Duration of PrivatBank terminal payment phases.",
+        f"# TYPE {name} histogram",
+    ]
+    key: MetricKey
+    histogram: Histogram
+    for key, histogram in histograms:
+        terminal, subsystem, phase = key
+        labels: str = (
+            f'terminal="{_escape(terminal)}",subsystem="{_escape(subsystem)}",'
+            f'phase="{_escape(phase)}"'
+        )
+        cumulative: int = 0
+        bound: float
+        count: int
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+metrics: MetricsRegistry = MetricsRegistry()
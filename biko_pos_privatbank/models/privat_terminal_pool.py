@@ -0,0 +1,213 @@
+import logging
+import select
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Tuple
+
+_logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT: float = 10.0
+POOL_MAX_IDLE: int = 2
+POOL_IDLE_TIMEOUT: float = 300.0
+
+
+class TerminalConnectionPool:
+    """
+    Keeps idle sockets to a single terminal so consecutive payments in the same
+    worker process reuse the established TCP session instead of reconnecting.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_idle: int = POOL_MAX_IDLE,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        connect_timeout: float = CONNECT_TIMEOUT,
+    ) -> None:
+        """
+        Initializes the pool for the given terminal address.
+
+        Args:
+            host (str): The IP address of the terminal.
+            port (int): The TCP port of the terminal.
+            max_idle (int): Maximum number of idle sockets kept open. Defaults to POOL_MAX_IDLE.
+            idle_timeout (float): Seconds after which an idle socket is dropped. Defaults to POOL_IDLE_TIMEOUT.
+            connect_timeout (float): Timeout of the TCP connect in seconds. Defaults to CONNECT_TIMEOUT.
+
+        Returns:
+            None
+        """
+        self.host: str = host
+        self.port: int = port
+        self.max_idle: int = max_idle
+        self.idle_timeout: float = idle_timeout
+        self.connect_timeout: float = connect_timeout
+        self._idle: Deque[Tuple[socket.socket, float]] = deque()
+        self._lock: threading.Lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "discarded": 0,
+            "connect_errors": 0,
+        }
+
+    def _open(self) -> socket.socket:
+        """
+        Opens a new TCP connection to the terminal.
+
+        Returns:
+            socket.socket: The connected socket in blocking mode.
+
+        Raises:
+            OSError: If the connection can't be established.
+        """
+        _logger.debug(f"PRIVAT-TRMINAL: Opening connection to {self.host}:{self.port}")
+        try:
+            sock: socket.socket = socket.create_connection(
+                (self.host, self.port), timeout=self.connect_timeout
+            )
+        except OSError:
+            with self._lock:
+                self.stats["connect_errors"] += 1
+            raise
+        sock.settimeout(None)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _is_alive(sock: socket.socket) -> bool:
+        """
+        Checks that an idle socket is still usable.
+
+        An idle socket must not be readable: readability means either the peer
+        closed the connection (EOF/RST) or it sent unsolicited data, in both
+        cases the socket can't be reused safely.
+
+        Args:
+            sock (socket.socket): The idle socket.
+
+        Returns:
+            bool: True if the socket can be reused, False otherwise.
+        """
+        try:
+            readable, _, errored = select.select([sock], [], [sock], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable and not errored
+
+    @staticmethod
+    def _close(sock: socket.socket) -> None:
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def acquire(self) -> Tuple[socket.socket, bool]:
+        """
+        Returns a healthy idle socket or opens a new one.
+
+        Returns:
+            Tuple[socket.socket, bool]: The socket and a flag telling whether it was reused.
+
+        Raises:
+            OSError: If a new connection can't be established.
+        """
+        now: float = time.monotonic()
+        with self._lock:
+            while self._idle:
+                sock, released_at = self._idle.pop()
+                if now - released_at > self.idle_timeout or not self._is_alive(sock):
+                    self.stats["stale"] += 1
+                    self._close(sock)
+                    continue
+                self.stats["hits"] += 1
+                return sock, True
+            self.stats["misses"] += 1
+        return self._open(), False
+
+    def release(self, sock: socket.socket, reusable: bool = True) -> None:
+        """
+        Returns the socket to the pool or closes it.
+
+        Args:
+            sock (socket.socket): The socket obtained from `acquire`.
+            reusable (bool): False if the exchange failed and the socket must be closed.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if reusable and len(self._idle) < self.max_idle:
+                self._idle.append((sock, time.monotonic()))
+                return
+            self.stats["discarded"] += 1
+        self._close(sock)
+
+    @contextmanager
+    def connection(self) -> Iterator[socket.socket]:
+        """
+        Context manager around `acquire`/`release`. The socket is closed
+        instead of being pooled if the block raises.
+        """
+        sock, _reused = self.acquire()
+        try:
+            yield sock
+        except Exception:
+            self.release(sock, reusable=False)
+            raise
+        self.release(sock)
+
+    def clear(self) -> None:
+        """Closes all idle sockets."""
+        with self._lock:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.stats)
+            stats["idle"] = len(self._idle)
+        total: int = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / total, 4) if total else 0.0
+        return stats
+
+
+_pools: Dict[Tuple[str, int], TerminalConnectionPool] = {}
+_pools_lock: threading.Lock = threading.Lock()
+
+
+def get_pool(host: str, port: int) -> TerminalConnectionPool:
+    """
+    Returns the process-wide pool for the terminal, creating it on first use.
+
+    Args:
+        host (str): The IP address of the terminal.
+        port (int): The TCP port of the terminal.
+
+    Returns:
+        TerminalConnectionPool: The pool shared by all callers in this process.
+    """
+    key: Tuple[str, int] = (host, port)
+    pool: TerminalConnectionPool = _pools.get(key)  # type: ignore
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, TerminalConnectionPool(host, port))
+    return pool
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns hit/miss statistics of every terminal pool in this process.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Statistics keyed by 'IP:PORT'.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {f"{pool.host}:{pool.port}": pool.get_stats() for pool in pools}
@@ -0,0 +1,265 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+FRAME_DELIMITER: bytes = b"\x00"
+MAX_FRAME_SIZE: int = 64 * 1024
+RECV_BUFFER_SIZE: int = 4096
+READ_TIMEOUT: float = 120.0
+REPLY_DEADLINE: float = 180.0
+# How often a payment waiting for the card checks whether it was cancelled
+CANCEL_POLL_INTERVAL: float = 2.0
+
+# Single-byte encodings a UTF-8 reply is mistakenly decoded with
+MOJIBAKE_ENCODINGS: Tuple[str, ...] = ("latin-1", "cp1252", "cp1251")
+
+# Service messages that finish the exchange instead of reporting progress
+FINAL_SERVICE_MESSAGES: List[str] = ["deviceBusy"]
+
+
+class FrameTooLargeError(ValueError):
+    pass
+
+
+class PaymentCancelled(Exception):
+    pass
+
+
+class FrameDecoder:
+    """
+    Incremental decoder of the terminal stream.
+
+    The terminal sends JSON messages terminated by a NUL byte. Data is fed as it
+    is read from the socket, one read may carry a partial frame or several frames.
+    Only the bytes appended since the previous call are scanned for the delimiter.
+    """
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE) -> None:
+        self.max_frame_size: int = max_frame_size
+        self._buffer: bytearray = bytearray()
+        self._scan_from: int = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Appends data to the buffer and returns the frames completed by it.
+
+        Args:
+            data (bytes): Bytes read from the socket.
+
+        Returns:
+            List[bytes]: Complete frames without the NUL delimiter. Empty frames are skipped.
+
+        Raises:
+            FrameTooLargeError: If a frame exceeds `max_frame_size`.
+        """
+        buffer: bytearray = self._buffer
+        buffer += data
+        frames: List[bytes] = []
+        start: int = 0
+        position: int = self._scan_from
+
+        while True:
+            end: int = buffer.find(FRAME_DELIMITER, position)
+            if end == -1:
+                break
+            if end - start > self.max_frame_size:
+                raise FrameTooLargeError(f"Frame of {end - start} bytes received")
+            if end > start:
+                frames.append(bytes(buffer[start:end]))
+            start = position = end + 1
+
+        if start:
+            del buffer[:start]
+        self._scan_from = len(buffer)
+        if self._scan_from > self.max_frame_size:
+            raise FrameTooLargeError(
+                f"Incomplete frame exceeds {self.max_frame_size} bytes"
+            )
+        return frames
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes of an incomplete frame."""
+        return len(self._buffer)
+
+
+def load_message(frame: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Loads a frame as JSON for routing purposes.
+
+    Args:
+        frame (bytes): A complete frame without the delimiter.
+
+    Returns:
+        Optional[Dict[str, Any]]: The message, or None if the frame is not a JSON object.
+    """
+    try:
+        message: Any = json.loads(frame.decode("utf-8", errors="replace"))
+    except ValueError:
+        _logger.debug(f"PRIVAT-TRMINAL: Can't load frame {frame!r}")
+        return None
+    return message if isinstance(message, dict) else None
+
+
+def is_busy_reply(frame: bytes) -> bool:
+    """
+    Tells whether the reply frame is a `deviceBusy` service message, the terminal
+    did not process the request.
+
+    Args:
+        frame (bytes): A complete frame without the delimiter.
+
+    Returns:
+        bool: True if the terminal is busy.
+    """
+    message: Optional[Dict[str, Any]] = load_message(frame)
+    if message is None:
+        return False
+    params: Dict[str, Any] = message.get("params") or {}
+    return params.get("msgType", "") == "deviceBusy"
+
+
+def is_service_message(message: Optional[Dict[str, Any]]) -> bool:
+    """
+    Tells whether the message only reports the progress of the payment.
+
+    Args:
+        message (Optional[Dict[str, Any]]): The loaded message.
+
+    Returns:
+        bool: True for intermediate service messages (card inserted, PIN entry, ...).
+    """
+    return message is not None and not is_final_message(message)
+
+
+def is_final_message(message: Optional[Dict[str, Any]]) -> bool:
+    """
+    Tells whether the message finishes the exchange.
+
+    Intermediate service messages (card inserted, PIN entry, ...) only report
+    progress. Errors, `deviceBusy` and the reply to the request method are final.
+    Frames that can't be loaded are final as well, `_parse_data` reports them.
+
+    Args:
+        message (Optional[Dict[str, Any]]): The loaded message.
+
+    Returns:
+        bool: True if no further frames are expected.
+    """
+    if message is None or message.get("error"):
+        return True
+    if message.get("method") != "ServiceMessage":
+        return True
+    params: Dict[str, Any] = message.get("params") or {}
+    return params.get("msgType", "") in FINAL_SERVICE_MESSAGES
+
+
+_fix_text: Optional[Callable[[str], str]] = None
+
+
+def repair_text(text: str) -> str:
+    """
+    Repairs mojibake with `ftfy`, which is imported on first use only.
+
+    Args:
+        text (str): The text to repair.
+
+    Returns:
+        str: The repaired text.
+    """
+    global _fix_text
+    if _fix_text is None:
+        from ftfy import fix_text
+
+        _fix_text = fix_text
+    return _fix_text(text)
+
+
+def decode_reply_text(frame: bytes) -> str:
+    """
+    Decodes a reply frame as strict UTF-8, repairing the whole text only if the
+    frame is not valid UTF-8.
+
+    Args:
+        frame (bytes): The reply frame.
+
+    Returns:
+        str: The decoded text.
+    """
+    try:
+        return frame.decode("utf-8")
+    except UnicodeDecodeError:
+        _logger.debug(f"PRIVAT-TRMINAL: Reply is not valid UTF-8: {frame!r}")
+        return repair_text(frame.decode("utf-8", errors="replace"))
+
+
+def parse_reply(text: str) -> Dict[str, Any]:
+    """
+    Parses the reply text, falling back to the repaired text if it isn't valid JSON.
+
+    Args:
+        text (str): The decoded reply.
+
+    Returns:
+        Dict[str, Any]: The reply.
+
+    Raises:
+        ValueError: If the repaired text isn't valid JSON either.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(repair_text(text))
+
+
+def looks_like_mojibake(text: str) -> bool:
+    """
+    Cheap check of whether the text may be UTF-8 decoded with a single-byte
+    encoding: encoded back with that encoding, it is valid UTF-8.
+
+    Valid Cyrillic can't be encoded with latin-1/cp1252 and its cp1251 bytes
+    are almost never valid UTF-8, so it fails the check without reaching `ftfy`.
+    A false positive only costs a call to `repair_text`, which leaves valid
+    text unchanged.
+
+    Args:
+        text (str): A non-ASCII text.
+
+    Returns:
+        bool: True if the text should be repaired.
+    """
+    encoding: str
+    for encoding in MOJIBAKE_ENCODINGS:
+        try:
+            text.encode(encoding).decode("utf-8")
+        except UnicodeError:
+            continue
+        return True
+    return False
+
+
+def repair_fields(value: Any) -> Any:
+    """
+    Repairs the string values of a parsed reply that contain mojibake.
+
+    ASCII strings can't be broken and are returned as is, so the usual reply
+    (amounts, codes, masked PAN, RRN) never reaches `ftfy`. Other strings are
+    only repaired if `looks_like_mojibake` flags them.
+
+    Args:
+        value (Any): The parsed reply or one of its values.
+
+    Returns:
+        Any: The value with its broken strings repaired.
+    """
+    if isinstance(value, str):
+        if value.isascii() or not looks_like_mojibake(value):
+            return value
+        return repair_text(value)
+    if isinstance(value, dict):
+        return {key: repair_fields(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [repair_fields(item) for item in value]
+    return value
@@ -0,0 +1,118 @@
+import json
+import zlib
+from typing import Dict, Optional, Tuple
+
+from odoo.api import Environment
+
+RETENTION_PARAM_PREFIX: str = "biko_pos_privatbank.retention_"
+
+ARCHIVE_TABLE: str = "table"
+ARCHIVE_ATTACHMENT: str = "attachment"
+
+# Values of `payload_state`, empty while the payloads are plain text
+PAYLOAD_COMPRESSED: str = "compressed"
+PAYLOAD_ARCHIVED: str = "archived"
+PAYLOAD_COLD: str = "cold"
+
+COMPRESSION_LEVEL: int = 9
+
+
+class RetentionPolicy:
+    """
+    Age thresholds after which the request/reply payloads of terminal transactions
+    are compressed in place and then moved out of the transaction table.
+    """
+
+    def __init__(
+        self,
+        compress_days: int = 30,
+        archive_days: int = 0,
+        archive_target: str = ARCHIVE_TABLE,
+        chunk_size: int = 1000,
+        max_runtime: float = 600.0,
+    ) -> None:
+        """
+        Initializes the policy.
+
+        Args:
+            compress_days (int): Payloads older than this are compressed, 0 disables
+                the retention. Defaults to 30.
+            archive_days (int): Compressed payloads older than this are moved to the
+                archive, 0 keeps them on the transaction. Defaults to 0.
+            archive_target (str): "table" for `privatbank_terminal.transaction.archive`
+                or "attachment" for cold-storage attachments in the filestore.
+                Defaults to "table".
+            chunk_size (int): Transactions processed per committed chunk. Defaults to 1000.
+            max_runtime (float): Seconds after which a run stops starting new chunks.
+                Defaults to 600.
+
+        Returns:
+            None
+        """
+        self.compress_days: int = compress_days
+        self.archive_days: int = archive_days
+        self.archive_target: str = archive_target
+        self.chunk_size: int = chunk_size
+        self.max_runtime: float = max_runtime
+
+    @classmethod
+    def from_env(cls, env: Environment) -> "RetentionPolicy":
+        """
+        Builds the policy from the `biko_pos_privatbank.retention_*` system parameters:
+        `retention_compress_days`, `retention_archive_days`, `retention_archive_target`,
+        `retention_chunk_size` and `retention_max_runtime`.
+
+        Args:
+            env (Environment): The Odoo environment object.
+
+        Returns:
+            RetentionPolicy: The configured policy.
+        """
+        params: Dict[str, str] = {
+            param.key[len(RETENTION_PARAM_PREFIX) :]: param.value
+            for param in env["ir.config_parameter"]
+            .sudo()
+            .search([("key", "=like", f"{RETENTION_PARAM_PREFIX}%")])
+        }
+        policy: RetentionPolicy = cls()
+        try:
+            policy.compress_days = int(params.get("compress_days", policy.compress_days))
+            policy.archive_days = int(params.get("archive_days", policy.archive_days))
+            policy.chunk_size = int(params.get("chunk_size", policy.chunk_size))
+            policy.max_runtime = float(params.get("max_runtime", policy.max_runtime))
+        except ValueError:
+            return cls()
+        if params.get("archive_target") in (ARCHIVE_TABLE, ARCHIVE_ATTACHMENT):
+            policy.archive_target = params["archive_target"]
+        return policy
+
+
+def compress_payload(send_data: Optional[str], received_data: Optional[str]) -> bytes:
+    """
+    Packs the request and reply of a transaction into one compressed blob.
+
+    Args:
+        send_data (Optional[str]): The stored request.
+        received_data (Optional[str]): The stored reply.
+
+    Returns:
+        bytes: zlib-compressed JSON.
+    """
+    return zlib.compress(
+        json.dumps({"send_data": send_data, "received_data": received_data}).encode(),
+        COMPRESSION_LEVEL,
+    )
+
+
+def decompress_payload(blob: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Unpacks a blob made by `compress_payload`.
+
+    Args:
+        blob (bytes): The compressed payload.
+
+    Returns:
+        tuple: The request and the reply.
+    """
+    payload: Dict[str, Optional[str]] = json.loads(zlib.decompress(bytes(blob)))
+    return payload.get("send_data"), payload.get("received_data")
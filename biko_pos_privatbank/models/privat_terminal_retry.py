@@ -0,0 +1,122 @@
+import random
+import time
+from typing import Dict, Optional
+
+from odoo.api import Environment
+
+RETRY_PARAM_PREFIX: str = "biko_pos_privatbank.retry_"
+
+# Retries allowed per error class (values of `PrivatbankTerminal.last_error`).
+# Only failures where the terminal did not process the request are retried:
+# a lost reply may hide an approved payment, a declined payment is final.
+DEFAULT_RETRY_BUDGETS: Dict[str, int] = {
+    "connect": 3,
+    "deviceBusy": 5,
+    "send": 1,
+}
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by a total deadline and by a
+    retry budget per error class.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 0.05,
+        max_delay: float = 2.0,
+        multiplier: float = 2.0,
+        deadline: float = 15.0,
+        budgets: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        Initializes the policy.
+
+        Args:
+            base_delay (float): Delay before the first retry in seconds. Defaults to 0.05.
+            max_delay (float): Upper bound of a single delay in seconds. Defaults to 2.0.
+            multiplier (float): Growth factor of the delay. Defaults to 2.0.
+            deadline (float): No retry starts later than this many seconds after the
+                first attempt. Defaults to 15.0.
+            budgets (Optional[Dict[str, int]]): Retries allowed per error class.
+                Defaults to DEFAULT_RETRY_BUDGETS.
+
+        Returns:
+            None
+        """
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.multiplier: float = multiplier
+        self.deadline: float = deadline
+        self.budgets: Dict[str, int] = dict(
+            DEFAULT_RETRY_BUDGETS if budgets is None else budgets
+        )
+
+    @classmethod
+    def from_env(cls, env: Environment) -> "RetryPolicy":
+        """
+        Builds the policy from the `biko_pos_privatbank.retry_*` system parameters:
+        `retry_deadline`, `retry_base_delay`, `retry_max_delay` and one
+        `retry_budget_<error class>` per error class.
+
+        Args:
+            env (Environment): The Odoo environment object.
+
+        Returns:
+            RetryPolicy: The configured policy.
+        """
+        params: Dict[str, str] = {
+            param.key[len(RETRY_PARAM_PREFIX) :]: param.value
+            for param in env["ir.config_parameter"]
+            .sudo()
+            .search([("key", "=like", f"{RETRY_PARAM_PREFIX}%")])
+        }
+        policy: RetryPolicy = cls()
+        try:
+            policy.deadline = float(params.get("deadline", policy.deadline))
+            policy.base_delay = float(params.get("base_delay", policy.base_delay))
+            policy.max_delay = float(params.get("max_delay", policy.max_delay))
+            for key, value in params.items():
+                if key.startswith("budget_"):
+                    policy.budgets[key[len("budget_") :]] = int(value)
+        except ValueError:
+            return cls()
+        return policy
+
+    @classmethod
+    def no_retry(cls) -> "RetryPolicy":
+        """Returns a policy that never retries."""
+        return cls(budgets={})
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the pause before the given retry.
+
+        Args:
+            attempt (int): Number of the retry, starting from 0.
+
+        Returns:
+            float: A random delay between 0 and the capped exponential delay.
+        """
+        return random.uniform(  # nosec B311
+            0, min(self.max_delay, self.base_delay * self.multiplier**attempt)
+        )
+
+    def allows(
+        self, error_class: str, used: Dict[str, int], started: float
+    ) -> bool:
+        """
+        Tells whether another retry is allowed.
+
+        Args:
+            error_class (str): The class of the last error.
+            used (Dict[str, int]): Retries already made per error class.
+            started (float): `time.monotonic()` of the first attempt.
+
+        Returns:
+            bool: True if the budget of the error class and the deadline allow a retry.
+        """
+        if used.get(error_class, 0) >= self.budgets.get(error_class, 0):
+            return False
+        return time.monotonic() - started < self.deadline
@@ -0,0 +1,176 @@
+import logging
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from odoo import models
+from odoo.api import Environment
+
+from .privat_terminal_api import (
+    TERMINAL_ERROR_BUSY,
+    TERMINAL_ERROR_CONNECT,
+    TERMINAL_ERROR_QUEUE,
+    PrivatbankTerminal,
+)
+from .privat_terminal_dispatcher import TerminalDispatcher
+from .privat_terminal_protocol import is_busy_reply
+
+_logger = logging.getLogger(__name__)
+
+OdooRecordset = Union["models.BaseModel", Any]
+
+PARALLEL_SPLIT_PARAM: str = "biko_pos_privatbank.parallel_split_payment"
+SPLIT_DEADLINE_PARAM: str = "biko_pos_privatbank.split_payment_deadline"
+SPLIT_DEADLINE: float = 180.0
+
+# Values of `PaymentLeg.error`, failures before any terminal was used
+LEG_ERROR_UNREACHABLE: str = "unreachable"
+LEG_ERROR_DEADLINE: str = "deadline"
+
+
+def is_parallel_split_enabled(env: Environment) -> bool:
+    """
+    Checks whether the card legs of a split payment are sent to their terminals at once.
+
+    Args:
+        env (Environment): The Odoo environment object.
+
+    Returns:
+        bool: True if the `biko_pos_privatbank.parallel_split_payment` system parameter is set.
+    """
+    value: str = env["ir.config_parameter"].sudo().get_param(PARALLEL_SPLIT_PARAM, "")
+    return value.lower() in ("1", "true", "yes")
+
+
+def get_split_deadline(env: Environment) -> float:
+    """
+    Returns the time all legs of a split payment have to finish in.
+
+    Args:
+        env (Environment): The Odoo environment object.
+
+    Returns:
+        float: Seconds, from the `biko_pos_privatbank.split_payment_deadline` system parameter.
+    """
+    value: str = env["ir.config_parameter"].sudo().get_param(SPLIT_DEADLINE_PARAM, "")
+    try:
+        return float(value) if value else SPLIT_DEADLINE
+    except ValueError:
+        return SPLIT_DEADLINE
+
+
+class SplitPaymentFailed(Exception):
+    """Rolls the writes of a failed split payment back to its savepoint."""
+
+
+class PaymentLeg:
+    """One card payment line of a split payment and the state of its exchange."""
+
+    def __init__(
+        self,
+        payment_method: OdooRecordset,
+        amount: Union[float, Decimal],
+        order_id: int,
+        payment_type_id: int,
+        session_id: int,
+        rrn_param: str = "",
+        request_ref: str = "",
+    ) -> None:
+        self.payment_method: OdooRecordset = payment_method
+        self.amount: Union[float, Decimal] = amount
+        self.order_id: int = order_id
+        self.payment_type_id: int = payment_type_id
+        self.session_id: int = session_id
+        self.rrn_param: str = rrn_param
+        # The request the payment is made for, see `PrivatbankTerminal.request_ref`
+        self.request_ref: str = request_ref
+        # Filled by the request thread before the exchange
+        self.addresses: List[str] = []
+        self.order: OdooRecordset = None
+        self.data: Dict[str, Any] = {}
+        # Filled by the exchange
+        self.terminal: Optional[PrivatbankTerminal] = None
+        self.received_data: bytes = b""
+        self.error: str = ""
+        # Filled by the request thread after the exchange
+        self.result: Dict[Literal["status", "info"], Any] = {}
+
+    @property
+    def done(self) -> bool:
+        return self.result.get("status") == "done"
+
+
+def exchange_leg(
+    leg: PaymentLeg,
+    registry: Any,
+    dispatcher: TerminalDispatcher,
+    expires_at: float,
+    queue_wait: float,
+    group_queue_wait: float,
+) -> None:
+    """
+    Sends the request of the leg to the first terminal that processes it.
+
+    Runs in a thread of its own and only uses the plain values of the leg: the
+    terminal has no environment and only the queue lock touches the database, on
+    a cursor of its own. The reply and the class of the error are stored on the
+    leg, the request thread describes, parses and saves them. As in
+    `_privatbank_send_payment`, a terminal that is unreachable, queued or answers
+    `deviceBusy` hasn't processed the request and the next terminal is tried.
+
+    Args:
+        leg (PaymentLeg): The prepared leg.
+        registry (Registry): The registry the queue lock cursors are taken from.
+        dispatcher (TerminalDispatcher): The process-wide dispatcher.
+        expires_at (float): `time.monotonic()` by which the exchange must be finished.
+        queue_wait (float): Maximum wait at the last terminal in seconds.
+        group_queue_wait (float): Maximum wait at the other terminals in seconds.
+
+    Returns:
+        None
+    """
+    leg.error = LEG_ERROR_UNREACHABLE
+    index: int
+    address: str
+    for index, address in enumerate(leg.addresses):
+        remaining: float = expires_at - time.monotonic()
+        if remaining <= 0:
+            leg.error = LEG_ERROR_DEADLINE
+            return
+
+        last: bool = index == len(leg.addresses) - 1
+        # Bound to the request environment by the request thread
+        terminal: PrivatbankTerminal = PrivatbankTerminal(
+            address, env=None  # type: ignore
+        )
+        with dispatcher.reserve(address):
+            received_data: bytes = terminal._run_exchange(
+                registry,
+                leg.data,
+                queue_wait=min(queue_wait if last else group_queue_wait, remaining),
+                reply_deadline=remaining,
+            )
+
+        if received_data and is_busy_reply(received_data):
+            terminal.last_error = TERMINAL_ERROR_BUSY
+        if terminal.last_error in (TERMINAL_ERROR_BUSY, TERMINAL_ERROR_QUEUE):
+            dispatcher.mark_busy(address)
+        elif terminal.last_error == TERMINAL_ERROR_CONNECT:
+            dispatcher.mark_down(address)
+        else:
+            dispatcher.mark_idle(address)
+
+        leg.terminal = terminal
+        leg.received_data = received_data
+        leg.error = ""
+        if terminal.last_error not in (
+            TERMINAL_ERROR_BUSY,
+            TERMINAL_ERROR_QUEUE,
+            TERMINAL_ERROR_CONNECT,
+        ):
+            return
+        _logger.info(
+            "PRIVAT-TRMINAL: Split payment leg failed over from %s after %s",
+            address,
+            terminal.last_error,
+        )
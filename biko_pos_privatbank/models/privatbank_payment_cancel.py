@@ -0,0 +1,11 @@
+from odoo import fields, models
+
+
+class PrivatbankPaymentCancel(models.TransientModel):
+    _name = "privatbank.payment.cancel"
+    _description = "PrivatBank Payment Cancellation Request"
+    # The waiting attempt deletes its request, the autovacuum removes the
+    # requests of attempts that had already finished
+    _transient_max_hours = 1.0
+
+    attempt_id = fields.Char(required=True, index=True)
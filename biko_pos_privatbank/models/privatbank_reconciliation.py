@@ -0,0 +1,305 @@
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from odoo import _, api, fields, models
+
+from .privat_terminal_matcher import (
+    MatchResult,
+    StatementLine,
+    TerminalTransaction,
+    TransactionMatcher,
+)
+
+_logger = logging.getLogger(__name__)
+
+OdooRecordset = Union["models.BaseModel", Any]
+
+
+class PrivatbankReconciliation(models.TransientModel):
+    _name = "privatbank.reconciliation"
+    _description = "PrivatBank Terminal Reconciliation"
+
+    date_from = fields.Date(
+        required=True,
+        default=lambda self: fields.Date.today().replace(day=1),
+    )
+    date_to = fields.Date(required=True, default=fields.Date.context_today)
+    journal_id = fields.Many2one(
+        comodel_name="account.journal",
+        domain=[("type", "=", "bank")],
+        help="Only statement lines of this journal are matched. All bank journals if empty.",
+    )
+    window_days = fields.Integer(
+        string="Date Window, days",
+        default=3,
+        help="A transaction matches a statement line dated up to this many days later.",
+    )
+    matched_count = fields.Integer(readonly=True)
+    line_ids = fields.One2many(
+        comodel_name="privatbank.reconciliation.line",
+        inverse_name="reconciliation_id",
+        readonly=True,
+    )
+
+    def _get_tz(self) -> str:
+        """
+        Returns the timezone the dates of the period are in, the user's one.
+
+        Returns:
+            str: The timezone name.
+        """
+        return self.env.context.get("tz") or self.env.user.tz or "UTC"
+
+    def _read_transactions(self) -> List[TerminalTransaction]:
+        """
+        Reads the approved, not yet matched transactions of the period, including
+        the date window before it. Dates are in the timezone of the user, as the
+        dates of the period and of the bank statements.
+
+        Returns:
+            List[TerminalTransaction]: The transactions.
+        """
+        self.env["privatbank_terminal.transaction"].flush(
+            ["rrn", "amount", "terminal_id", "status", "statement_line_id"]
+        )
+        self.env.cr.execute(
+            """
+            SELECT id, rrn, amount, terminal_id,
+                (create_date AT TIME ZONE 'UTC' AT TIME ZONE %(tz)s)::date
+            FROM privatbank_terminal_transaction
+            WHERE status = 'done'
+                AND statement_line_id IS NULL
+                AND create_date >= %(date_from)s::timestamp AT TIME ZONE %(tz)s
+                    AT TIME ZONE 'UTC'
+                AND create_date < %(date_to)s::timestamp AT TIME ZONE %(tz)s
+                    AT TIME ZONE 'UTC'
+            """,
+            {
+                "tz": self._get_tz(),
+                "date_from": self.date_from - timedelta(days=self.window_days),
+                "date_to": self.date_to + timedelta(days=1),
+            },
+        )
+        return [
+            TerminalTransaction(
+                row[0], row[1], float(row[2]) if row[2] is not None else None, row[3], row[4]
+            )
+            for row in self.env.cr.fetchall()
+        ]
+
+    def _read_statement_lines(self) -> List[StatementLine]:
+        """
+        Reads the statement lines of the period not yet matched to a transaction.
+
+        Returns:
+            List[StatementLine]: The statement lines with their label, reference
+            and notes as the text to search for the RRN and terminal ID.
+        """
+        self.env["account.bank.statement.line"].flush(["amount", "payment_ref"])
+        self.env["account.move"].flush(["date", "ref", "narration", "journal_id"])
+        query: str = """
+            SELECT l.id, m.date, l.amount,
+                concat_ws(' ', l.payment_ref, m.ref, m.narration)
+            FROM account_bank_statement_line l
+            JOIN account_move m ON m.id = l.move_id
+            WHERE m.date BETWEEN %s AND %s
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM privatbank_terminal_transaction t
+                    WHERE t.statement_line_id = l.id
+                )
+        """
+        params: List[Any] = [self.date_from, self.date_to]
+        if self.journal_id:
+            query += " AND m.journal_id = %s"
+            params.append(self.journal_id.id)
+        self.env.cr.execute(query, params)
+        return [StatementLine(*row) for row in self.env.cr.fetchall()]
+
+    def action_match(self) -> Dict[str, Any]:
+        """
+        Matches the transactions of the period to the bank statement lines.
+
+        Matched transactions are linked to their statement line, so the next run
+        only considers what is left. Ambiguous and unmatched items of the period
+        are listed on the wizard.
+
+        Returns:
+            Dict[str, Any]: The action reopening the wizard with the report.
+        """
+        self.ensure_one()
+        started: float = time.monotonic()
+        transactions: List[TerminalTransaction] = self._read_transactions()
+        statement_lines: List[StatementLine] = self._read_statement_lines()
+        matcher: TransactionMatcher = TransactionMatcher(transactions, self.window_days)
+        result: MatchResult = matcher.match(statement_lines)
+
+        if result.matched:
+            line_ids, transaction_ids, _keys = zip(*result.matched)
+            self.env.cr.execute(
+                """
+                UPDATE privatbank_terminal_transaction t
+                SET statement_line_id = match.statement_line_id
+                FROM unnest(%s::int[], %s::int[])
+                    AS match(statement_line_id, transaction_id)
+                WHERE t.id = match.transaction_id
+                """,
+                (list(line_ids), list(transaction_ids)),
+            )
+            self.env["privatbank_terminal.transaction"].invalidate_cache(
+                ["statement_line_id"], list(transaction_ids)
+            )
+
+        # Transactions of the window before the period are only candidates
+        unmatched_transactions: List[int] = [
+            transaction_id
+            for transaction_id in result.unmatched_transactions
+            if matcher.transactions[transaction_id].date >= self.date_from
+        ]
+        self._replace_lines(result, unmatched_transactions)
+        self.write({"matched_count": len(result.matched)})
+        _logger.info(
+            "PRIVAT-TRMINAL: Reconciled %d transactions against %d statement lines "
+            "in %.1fs: %d matched, %d ambiguous",
+            len(transactions),
+            len(statement_lines),
+            time.monotonic() - started,
+            len(result.matched),
+            len(result.ambiguous),
+        )
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("PrivatBank Reconciliation"),
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    def _replace_lines(
+        self, result: MatchResult, unmatched_transactions: List[int]
+    ) -> None:
+        """
+        Replaces the items listed on the wizard by those of the match result.
+
+        A period leaves thousands of items, they are inserted by a statement per
+        table instead of an ORM create each.
+
+        Args:
+            result (MatchResult): The match result.
+            unmatched_transactions (List[int]): The unmatched transactions to list.
+
+        Returns:
+            None
+        """
+        self.env.cr.execute(
+            "DELETE FROM privatbank_reconciliation_line WHERE reconciliation_id = %s",
+            (self.id,),
+        )
+        rows: List[Tuple[str, Optional[int], Optional[int]]] = [
+            ("ambiguous", line_id, None) for line_id, _candidate_ids in result.ambiguous
+        ]
+        rows += [
+            ("unmatched_statement", line_id, None) for line_id in result.unmatched_lines
+        ]
+        rows += [
+            ("unmatched_transaction", None, transaction_id)
+            for transaction_id in unmatched_transactions
+        ]
+        if rows:
+            states, statement_line_ids, transaction_ids = zip(*rows)
+            self.env.cr.execute(
+                """
+                INSERT INTO privatbank_reconciliation_line (
+                    reconciliation_id, state, statement_line_id, transaction_id,
+                    create_uid, create_date, write_uid, write_date
+                )
+                SELECT %(id)s, item.state, item.statement_line_id, item.transaction_id,
+                    %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                FROM unnest(
+                    %(states)s::varchar[], %(lines)s::int[], %(transactions)s::int[]
+                ) AS item(state, statement_line_id, transaction_id)
+                RETURNING id, statement_line_id
+                """,
+                {
+                    "id": self.id,
+                    "uid": self.env.uid,
+                    "states": list(states),
+                    "lines": list(statement_line_ids),
+                    "transactions": list(transaction_ids),
+                },
+            )
+            item_ids: Dict[int, int] = {
+                statement_line_id: item_id
+                for item_id, statement_line_id in self.env.cr.fetchall()
+                if statement_line_id
+            }
+            candidates: List[Tuple[int, int]] = [
+                (item_ids[line_id], transaction_id)
+                for line_id, candidate_ids in result.ambiguous
+                for transaction_id in candidate_ids
+            ]
+            if candidates:
+                item_column, transaction_column = zip(*candidates)
+                self.env.cr.execute(
+                    """
+                    INSERT INTO privatbank_reconciliation_candidate_rel (
+                        line_id, transaction_id
+                    )
+                    SELECT * FROM unnest(%s::int[], %s::int[])
+                    """,
+                    (list(item_column), list(transaction_column)),
+                )
+        self.env["privatbank.reconciliation.line"].invalidate_cache()
+        self.invalidate_cache(["line_ids"], self.ids)
+
+
+class PrivatbankReconciliationLine(models.TransientModel):
+    _name = "privatbank.reconciliation.line"
+    _description = "PrivatBank Terminal Reconciliation Item"
+    _order = "state, id"
+
+    reconciliation_id = fields.Many2one(
+        comodel_name="privatbank.reconciliation",
+        required=True,
+        ondelete="cascade",
+    )
+    state = fields.Selection(
+        selection=[
+            ("ambiguous", "Ambiguous"),
+            ("unmatched_statement", "Unmatched Statement Line"),
+            ("unmatched_transaction", "Unmatched Transaction"),
+        ],
+        required=True,
+    )
+    statement_line_id = fields.Many2one(comodel_name="account.bank.statement.line")
+    transaction_id = fields.Many2one(comodel_name="privatbank_terminal.transaction")
+    candidate_ids = fields.Many2many(
+        comodel_name="privatbank_terminal.transaction",
+        relation="privatbank_reconciliation_candidate_rel",
+        column1="line_id",
+        column2="transaction_id",
+        string="Candidate Transactions",
+    )
+    date = fields.Date(compute="_compute_details")
+    amount = fields.Float(compute="_compute_details", digits=(16, 2))
+    reference = fields.Char(compute="_compute_details")
+
+    @api.depends("statement_line_id", "transaction_id")
+    def _compute_details(self) -> None:
+        line: OdooRecordset
+        for line in self:
+            if line.statement_line_id:
+                line.date = line.statement_line_id.date
+                line.amount = line.statement_line_id.amount
+                line.reference = line.statement_line_id.payment_ref
+            else:
+                line.date = fields.Date.context_today(
+                    line, line.transaction_id.create_date
+                )
+                line.amount = line.transaction_id.amount
+                line.reference = " / ".join(
+                    filter(None, [line.transaction_id.rrn, line.transaction_id.terminal_id])
+                )
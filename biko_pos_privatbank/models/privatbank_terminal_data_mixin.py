@@ -0,0 +1,76 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from odoo import models
+
+OdooRecordset = Union["models.BaseModel", Any]
+
+TerminalDataKey = Tuple[int, int]
+
+
+class PrivatbankTerminalDataMixin(models.AbstractModel):
+    _name = "privatbank.terminal.data.mixin"
+    _description = "PrivatBank Terminal Data Lookup"
+
+    def _get_privatbank_terminal_data_batch(
+        self,
+        payment_type_ids: OdooRecordset,
+        pos_session_id: Optional[OdooRecordset] = None,
+    ) -> Dict[TerminalDataKey, Dict[str, Any]]:
+        """
+        Retrieves the PrivatBank payment details of all orders of the recordset
+        for the given payment types in a single query.
+
+        Args:
+            payment_type_ids (OdooRecordset): The payment type recordset.
+            pos_session_id (Optional[OdooRecordset], optional): The POS session recordset. Defaults to None.
+
+        Returns:
+            Dict[Tuple[int, int], Dict[str, Any]]: Payment details keyed by
+            (order ID, payment type ID). Pairs without a transaction are absent.
+        """
+        if not self or not payment_type_ids:
+            return {}
+
+        domain: List[Tuple[str, str, Any]] = [
+            ("order_ref", "in", [f"{self._name},{order_id}" for order_id in self.ids]),
+            ("so_payment_type_id", "in", payment_type_ids.ids),
+        ]
+
+        if pos_session_id:
+            domain.append(("session_id", "=", pos_session_id.id))
+
+        transactions: OdooRecordset = self.env["privatbank_terminal.transaction"].search(
+            domain, order="id"
+        )
+
+        result: Dict[TerminalDataKey, Dict[str, Any]] = {}
+        transaction: OdooRecordset
+        for transaction in transactions:
+            key: TerminalDataKey = (
+                transaction.order_ref.id,
+                transaction.so_payment_type_id.id,
+            )
+            if key not in result:
+                result[key] = transaction._get_receipt_data()
+        return result
+
+    def _get_privatbank_terminal_data(
+        self,
+        payment_type_id: OdooRecordset,
+        pos_session_id: Optional[OdooRecordset] = None,
+    ) -> Dict[str, Any]:
+        """
+        Retrieves the PrivatBank payment details of a single order.
+
+        Args:
+            payment_type_id (OdooRecordset): The payment type recordset.
+            pos_session_id (Optional[OdooRecordset], optional): The POS session recordset. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Card mask, bank name, authorization code, RRN, payment
+            system, terminal ID and receipt number, empty if there is no transaction.
+        """
+        self.ensure_one()
+        return self._get_privatbank_terminal_data_batch(
+            payment_type_id, pos_session_id
+        ).get((self.id, payment_type_id.id), {})
@@ -0,0 +1,73 @@
+from typing import Any, Dict, List
+
+from odoo import api, fields, models
+
+from .privat_terminal_lock import get_queue_depths, queue_stats
+
+
+class PrivatbankTerminalGroup(models.Model):
+    _name = "privatbank.terminal.group"
+    _description = "PrivatBank Terminal Group"
+
+    name = fields.Char(required=True)
+    active = fields.Boolean(default=True)
+    terminal_ids = fields.One2many(
+        comodel_name="privatbank.terminal",
+        inverse_name="group_id",
+        string="Terminals",
+    )
+
+
+class PrivatbankTerminalDevice(models.Model):
+    _name = "privatbank.terminal"
+    _description = "PrivatBank Terminal"
+    _order = "sequence, id"
+
+    name = fields.Char(required=True)
+    sequence = fields.Integer(default=10)
+    active = fields.Boolean(default=True)
+    terminal_ip = fields.Char(
+        string="Terminal IP",
+        required=True,
+        help="IP address and port of the terminal in the format IP:PORT",
+    )
+    group_id = fields.Many2one(
+        comodel_name="privatbank.terminal.group",
+        string="Group",
+        ondelete="cascade",
+    )
+
+    @api.model
+    def _get_configured_addresses(self) -> List[str]:
+        """
+        Returns the addresses of all terminals configured in groups and payment methods.
+
+        Returns:
+            List[str]: Terminal addresses in the 'IP:PORT' format.
+        """
+        addresses: List[str] = self.search([]).mapped("terminal_ip")
+        addresses += (
+            self.env["pos.payment.method"]
+            .search([("use_payment_terminal", "=", "privatbank")])
+            .mapped("privatbank_terminal_ip")
+        )
+        return list(dict.fromkeys(address for address in addresses if address))
+
+    @api.model
+    def get_queue_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the queue state of every configured terminal.
+
+        The current use and number of waiting payments are read across all
+        workers; wait times are the statistics of this worker process.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Queue statistics keyed by 'IP:PORT'.
+        """
+        waits: Dict[str, Dict[str, float]] = queue_stats.get()
+        return {
+            address: dict(depth, **waits.get(address, {}))
+            for address, depth in get_queue_depths(
+                self.env, self._get_configured_addresses()
+            ).items()
+        }
@@ -0,0 +1,162 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from odoo import api, fields, models
+
+from .privat_terminal_metrics import (
+    Histogram,
+    MetricKey,
+    metrics,
+    to_prometheus,
+)
+from .privat_terminal_pool import get_pool_stats
+
+_logger = logging.getLogger(__name__)
+
+
+class PrivatbankTerminalMetric(models.Model):
+    _name = "privatbank.terminal.metric"
+    _description = "PrivatBank Terminal Latency Histogram"
+    _order = "terminal_ip, subsystem, phase"
+
+    terminal_ip = fields.Char(string="Terminal IP", required=True)
+    subsystem = fields.Char(required=True)
+    phase = fields.Char(required=True)
+    count = fields.Integer()
+    total = fields.Float(string="Total, s")
+    buckets = fields.Char(help="JSON list of the observation count per bucket")
+
+    _sql_constraints = [
+        (
+            "metric_uniq",
+            "unique(terminal_ip, subsystem, phase)",
+            "The histogram must be unique per terminal, subsystem and phase.",
+        ),
+    ]
+
+    @api.model
+    def _flush_metrics(self) -> None:
+        """
+        Adds the observations of this worker process to the stored histograms.
+
+        A separate cursor is used so that the flush neither waits for nor is
+        rolled back with the request transaction.
+        """
+        pending: Dict[MetricKey, Histogram] = metrics.take()
+        if not pending:
+            return
+        try:
+            with self.env.registry.cursor() as cr:
+                key: MetricKey
+                histogram: Histogram
+                for key, histogram in sorted(pending.items()):
+                    cr.execute(
+                        """
+                        INSERT INTO privatbank_terminal_metric
+                            (terminal_ip, subsystem, phase, count, total, buckets,
+                             create_uid, create_date, write_uid, write_date)
+                        VALUES (%s, %s, %s, 0, 0, '[]',
+                                %s, now() AT TIME ZONE 'UTC',
+                                %s, now() AT TIME ZONE 'UTC')
+                        ON CONFLICT (terminal_ip, subsystem, phase) DO NOTHING
+                        """,
+                        key + (self.env.uid, self.env.uid),
+                    )
+                    cr.execute(
+                        """
+                        SELECT id, count, total, buckets
+                        FROM privatbank_terminal_metric
+                        WHERE terminal_ip = %s AND subsystem = %s AND phase = %s
+                        FOR UPDATE
+                        """,
+                        key,
+                    )
+                    rec_id, _count, total, buckets = cr.fetchone()
+                    stored: Histogram = Histogram(json.loads(buckets or "[]"), total)
+                    stored.merge(histogram)
+                    cr.execute(
+                        """
+                        UPDATE privatbank_terminal_metric
+                        SET count = %s, total = %s, buckets = %s,
+                            write_date = now() AT TIME ZONE 'UTC'
+                        WHERE id = %s
+                        """,
+                        (stored.count, stored.total, json.dumps(stored.counts), rec_id),
+                    )
+        except Exception:
+            _logger.exception("PRIVAT-TRMINAL: Can't flush latency metrics")
+            metrics.restore(pending)
+
+    def _get_histogram(self) -> Histogram:
+        self.ensure_one()
+        return Histogram(json.loads(self.buckets or "[]") or None, self.total)
+
+    @api.model
+    def get_histograms(
+        self,
+        terminal_ip: Optional[str] = None,
+        subsystem: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the latency summary of every payment phase.
+
+        Args:
+            terminal_ip (Optional[str]): Only this terminal. Defaults to None.
+            subsystem (Optional[str]): Only 'SALE' or 'POS'. Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: Count, average and p50/p95/p99 bucket estimates in
+            seconds per terminal, subsystem and phase.
+        """
+        self._flush_metrics()
+        domain: List[Tuple[str, str, Any]] = []
+        if terminal_ip:
+            domain.append(("terminal_ip", "=", terminal_ip))
+        if subsystem:
+            domain.append(("subsystem", "=", subsystem))
+
+        result: List[Dict[str, Any]] = []
+        for rec in self.search(domain):
+            histogram: Histogram = rec._get_histogram()
+            result.append(
+                {
+                    "terminal_ip": rec.terminal_ip,
+                    "subsystem": rec.subsystem,
+                    "phase": rec.phase,
+                    "count": histogram.count,
+                    "avg": histogram.total / histogram.count if histogram.count else 0.0,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+            )
+        return result
+
+    @api.model
+    def get_prometheus_text(self) -> str:
+        """
+        Returns the histograms of all worker processes and the connection pool
+        statistics of the current process in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        self._flush_metrics()
+        text: str = to_prometheus(
+            ((rec.terminal_ip, rec.subsystem, rec.phase), rec._get_histogram())
+            for rec in self.search([])
+        )
+        lines: List[str] = [
+            "# HELP privatbank_terminal_pool_total Connection pool events of this worker.",
+            "# TYPE privatbank_terminal_pool_total counter",
+        ]
+        address: str
+        stats: Dict[str, Any]
+        for address, stats in get_pool_stats().items():
+            for event in ("hits", "misses", "stale", "discarded", "connect_errors"):
+                lines.append(
+                    f'privatbank_terminal_pool_total{{terminal="{address}",'
+                    f'event="{event}"}} {stats[event]}'
+                )
+        return text + "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+from odoo import api, fields, models
+
+from .privat_terminal_health import (
+    STATE_DEGRADED,
+    STATE_DOWN,
+    STATE_UP,
+    health_cache,
+    probe,
+)
+from .privat_terminal_lock import get_queue_depths
+
+_logger = logging.getLogger(__name__)
+
+OdooRecordset = Union["models.BaseModel", Any]
+
+DEGRADED_LATENCY_MS: float = 300.0
+# Consecutive failed probes before a terminal is considered down
+DOWN_AFTER_FAILURES: int = 2
+PROBE_WORKERS: int = 16
+
+
+class PrivatbankTerminalStatus(models.Model):
+    _name = "privatbank.terminal.status"
+    _description = "PrivatBank Terminal Status"
+    _order = "terminal_ip"
+
+    terminal_ip = fields.Char(string="Terminal IP", required=True, index=True)
+    state = fields.Selection(
+        selection=[
+            (STATE_UP, "Up"),
+            (STATE_DEGRADED, "Degraded"),
+            (STATE_DOWN, "Down"),
+        ],
+        required=True,
+        default=STATE_UP,
+    )
+    latency_ms = fields.Float(string="Latency, ms", digits=(16, 1))
+    consecutive_failures = fields.Integer()
+    last_check = fields.Datetime()
+    last_up = fields.Datetime()
+    last_error = fields.Char()
+
+    _sql_constraints = [
+        (
+            "terminal_ip_uniq",
+            "unique(terminal_ip)",
+            "The terminal status must be unique per terminal IP.",
+        ),
+    ]
+
+    @api.model
+    def _compute_state(self, ok: bool, latency_ms: float, failures: int) -> str:
+        """
+        Returns the state of a terminal from its latest probe.
+
+        Args:
+            ok (bool): Whether the probe succeeded.
+            latency_ms (float): The connect latency in milliseconds.
+            failures (int): Consecutive failed probes including this one.
+
+        Returns:
+            str: "up", "degraded" or "down".
+        """
+        if not ok:
+            return STATE_DOWN if failures >= DOWN_AFTER_FAILURES else STATE_DEGRADED
+        if latency_ms >= DEGRADED_LATENCY_MS:
+            return STATE_DEGRADED
+        return STATE_UP
+
+    @api.model
+    def _cron_probe_terminals(self) -> None:
+        """
+        Probes every configured terminal and stores its state.
+
+        Terminals currently used by a payment are not probed, they are up.
+        Probes run in parallel threads, the results are written afterwards.
+        Terminals turning degraded or down are reported to the POS managers.
+        """
+        addresses: List[str] = self.env[
+            "privatbank.terminal"
+        ]._get_configured_addresses()
+        in_use: List[str] = [
+            address
+            for address, depth in get_queue_depths(self.env, addresses).items()
+            if depth["in_use"]
+        ]
+        to_probe: List[str] = [address for address in addresses if address not in in_use]
+
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+            results: List[Tuple[bool, float, str]] = list(executor.map(probe, to_probe))
+        results += [(True, 0.0, "")] * len(in_use)
+
+        statuses: Dict[str, OdooRecordset] = {
+            rec.terminal_ip: rec for rec in self.search([("terminal_ip", "in", addresses)])
+        }
+        now: Any = fields.Datetime.now()
+        changed: List[OdooRecordset] = []
+
+        address: str
+        for address, (ok, latency_ms, error) in zip(to_probe + in_use, results):
+            status: OdooRecordset = statuses.get(address) or self.create(
+                {"terminal_ip": address}
+            )
+            failures: int = 0 if ok else status.consecutive_failures + 1
+            state: str = self._compute_state(ok, latency_ms, failures)
+            vals: Dict[str, Any] = {
+                "state": state,
+                "consecutive_failures": failures,
+                "last_check": now,
+                "last_error": error,
+            }
+            if ok:
+                vals["last_up"] = now
+                if latency_ms:
+                    vals["latency_ms"] = latency_ms
+            if state != status.state and state != STATE_UP:
+                changed.append(status)
+            status.write(vals)
+            health_cache.set_state(address, state)
+
+        if changed:
+            self._notify_degraded(changed)
+
+    def _notify_degraded(self, statuses: List[OdooRecordset]) -> None:
+        """
+        Logs and pushes degraded or unreachable terminals to the POS managers.
+
+        Args:
+            statuses (List[OdooRecordset]): The statuses that changed for the worse.
+
+        Returns:
+            None
+        """
+        status: OdooRecordset
+        for status in statuses:
+            _logger.warning(
+                "PRIVAT-TRMINAL: Terminal %s is %s (%s)",
+                status.terminal_ip,
+                status.state,
+                status.last_error or f"{status.latency_ms:.0f} ms",
+            )
+        managers: OdooRecordset = self.env.ref("point_of_sale.group_pos_manager").users
+        self.env["bus.bus"].sendmany(
+            [
+                (
+                    (self.env.cr.dbname, "res.partner", partner.id),
+                    {
+                        "type": "privatbank_terminal_status",
+                        "terminals": [
+                            {
+                                "terminal_ip": status.terminal_ip,
+                                "state": status.state,
+                                "last_error": status.last_error,
+                            }
+                            for status in statuses
+                        ],
+                    },
+                )
+                for partner in managers.partner_id
+            ]
+        )
@@ -1,6 +1,38 @@
-from typing import List, Tuple
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from odoo import api, fields, models
+import psycopg2
+from odoo import api, fields, models, tools
+
+from .privat_terminal_retention import (
+    ARCHIVE_ATTACHMENT,
+    PAYLOAD_ARCHIVED,
+    PAYLOAD_COLD,
+    PAYLOAD_COMPRESSED,
+    RetentionPolicy,
+    compress_payload,
+    decompress_payload,
+)
+
+_logger = logging.getLogger(__name__)
+
+OdooRecordset = Union["models.BaseModel", Any]
+
+Payloads = Tuple[Optional[str], Optional[str]]
+
+# Columns filled from the `params` of the terminal reply
+REPLY_FIELDS: Dict[str, str] = {
+    "card_mask": "pan",
+    "bank_name": "bankAcquirer",
+    "auth_code": "approvalCode",
+    "rrn": "rrn",
+    "payment_system": "paymentSystem",
+    "terminal_id": "terminalId",
+    "receipt_no": "invoiceNumber",
+}
 
 
 class PrivatbankTerminalTransaction(models.Model):
@@ -26,3 +58,447 @@ class PrivatbankTerminalTransaction(models.Model):
 
     order_ref = fields.Reference(selection="_select_target_model")
     so_payment_type_id = fields.Many2one(comodel_name="so.payment.type")
+    transaction_key = fields.Char(
+        readonly=True,
+        copy=False,
+        help="Order reference and payment type, the conflict target of `_upsert`.",
+    )
+    request_ref = fields.Char(
+        readonly=True,
+        copy=False,
+        help="The request the payment was made for, e.g. the checkout wizard. The "
+        "same request finds its approved payment again, a new one is charged.",
+    )
+    card_mask = fields.Char(readonly=True)
+    bank_name = fields.Char(readonly=True)
+    auth_code = fields.Char(readonly=True)
+    rrn = fields.Char(string="RRN", readonly=True, index=True)
+    payment_system = fields.Char(readonly=True)
+    terminal_id = fields.Char(string="Terminal ID", readonly=True, index=True)
+    receipt_no = fields.Char(readonly=True)
+    amount = fields.Float(
+        readonly=True, digits=(16, 2), help="Approved amount, negative for refunds."
+    )
+    statement_line_id = fields.Many2one(
+        comodel_name="account.bank.statement.line",
+        string="Bank Statement Line",
+        readonly=True,
+        copy=False,
+        index=True,
+        ondelete="set null",
+    )
+    # Empty while `send_data` and `received_data` are stored as plain text
+    payload_state = fields.Selection(
+        selection=[
+            (PAYLOAD_COMPRESSED, "Compressed"),
+            (PAYLOAD_ARCHIVED, "Archived"),
+            (PAYLOAD_COLD, "Cold Storage"),
+        ],
+        readonly=True,
+    )
+    payload_compressed = fields.Binary(
+        attachment=False,
+        readonly=True,
+        help="zlib-compressed send and received data, read it with `_get_payloads`.",
+    )
+    payload_attachment_id = fields.Many2one(
+        comodel_name="ir.attachment",
+        readonly=True,
+        ondelete="set null",
+    )
+
+    _sql_constraints = [
+        (
+            "transaction_key_uniq",
+            "unique(transaction_key)",
+            "Only one terminal transaction is allowed per order and payment type.",
+        ),
+    ]
+
+    def init(self) -> None:
+        tools.create_index(
+            self._cr,
+            "privatbank_terminal_transaction_order_ref_idx",
+            self._table,
+            ["order_ref", "so_payment_type_id", "session_id"],
+        )
+        tools.create_index(
+            self._cr,
+            "privatbank_terminal_transaction_create_date_idx",
+            self._table,
+            ["create_date"],
+        )
+        # Reconciliation reads the approved transactions of a period
+        tools.create_index(
+            self._cr,
+            "privatbank_terminal_transaction_status_date_idx",
+            self._table,
+            ["status", "create_date"],
+        )
+        # Small partial indexes, so each retention chunk starts at the first
+        # unprocessed row instead of walking the processed ones again
+        self._cr.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS privatbank_terminal_transaction_plain_idx
+            ON {self._table} (id)
+            WHERE payload_state IS NULL
+                AND (send_data IS NOT NULL OR received_data IS NOT NULL)
+            """
+        )
+        self._cr.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS privatbank_terminal_transaction_compressed_idx
+            ON {self._table} (id)
+            WHERE payload_state = %s
+            """,
+            (PAYLOAD_COMPRESSED,),
+        )
+
+    @api.model
+    def _make_transaction_key(
+        self, order_ref: str, payment_type_id: Optional[int]
+    ) -> str:
+        """
+        Returns the unique key of the transaction of an order and payment type.
+
+        The session is left out: refunds and the asynchronous payment state look
+        the transaction up by the order and payment type only, and a payment
+        retried from another session must update the same transaction.
+
+        Args:
+            order_ref (str): The order reference in the 'model,id' format.
+            payment_type_id (Optional[int]): The payment type identifier.
+
+        Returns:
+            str: The key.
+        """
+        return f"{order_ref}|{payment_type_id or 0}"
+
+    @api.model
+    def _get_reply_vals(self, received_data: Optional[str]) -> Dict[str, Any]:
+        """
+        Extracts the payment details of a stored terminal reply.
+
+        Args:
+            received_data (Optional[str]): The reply as stored in `received_data`.
+
+        Returns:
+            Dict[str, Any]: Values of the reply columns, empty for a reply without details.
+        """
+        try:
+            data: Any = json.loads(received_data or "{}")
+        except ValueError:
+            data = {}
+        params: Any = data.get("params") if isinstance(data, dict) else None
+        if not isinstance(params, dict):
+            params = {}
+        vals: Dict[str, Any] = {
+            name: str(params[key]) if params.get(key) not in (None, "") else None
+            for name, key in REPLY_FIELDS.items()
+        }
+        try:
+            amount: Optional[float] = float(params["amount"])
+        except (KeyError, TypeError, ValueError):
+            amount = None
+        if amount is not None and data.get("method") == "Refund":
+            amount = -amount
+        vals["amount"] = amount
+        return vals
+
+    def _get_receipt_data(self) -> Dict[str, Any]:
+        """
+        Returns the payment details of the transaction for the fiscal receipt.
+
+        Returns:
+            Dict[str, Any]: Card mask, bank name, authorization code, RRN, payment
+            system, terminal ID and receipt number, None if not in the reply.
+        """
+        self.ensure_one()
+        return {
+            "card_mask": self.card_mask or None,
+            "bank_name": self.bank_name or None,
+            "auth_code": self.auth_code or None,
+            "rrn": self.rrn or None,
+            "payment_system": self.payment_system or None,
+            "terminal": self.terminal_id or None,
+            "receipt_no": self.receipt_no or None,
+        }
+
+    @api.model
+    def _upsert(self, vals: Dict[str, Any]) -> OdooRecordset:
+        """
+        Updates the transaction of the order and payment type with `vals`, or
+        creates it if there is none yet.
+
+        The existing transaction, the case of every write but the first one of a
+        payment, is found and updated by a single statement on the unique
+        `transaction_key`. A new transaction is created through the ORM, so the
+        defaults, required fields and computed fields of the base model apply. A
+        concurrent worker creating the same transaction fails on the unique key
+        instead of making a duplicate.
+
+        Args:
+            vals (Dict[str, Any]): Field values, `order_ref` is required.
+
+        Returns:
+            OdooRecordset: The transaction record.
+        """
+        vals = dict(
+            vals,
+            transaction_key=self._make_transaction_key(
+                vals["order_ref"], vals.get("so_payment_type_id")
+            ),
+        )
+        self.flush(list(vals))
+
+        update_vals: Dict[str, Any] = dict(
+            vals, write_uid=self.env.uid, write_date=fields.Datetime.now()
+        )
+        updates: str = ", ".join(f'"{name}" = %s' for name in update_vals)
+        self._cr.execute(
+            f"""
+            UPDATE {self._table}
+            SET {updates}
+            WHERE transaction_key = %s
+            RETURNING id
+            """,
+            list(update_vals.values()) + [vals["transaction_key"]],
+        )
+        row: Optional[Tuple[int]] = self._cr.fetchone()
+        if not row:
+            return self.create(vals)
+
+        transaction: OdooRecordset = self.browse(row[0])
+        transaction.invalidate_cache(list(update_vals), transaction.ids)
+        transaction.modified(list(vals))
+        return transaction
+
+    def _get_payloads(self) -> Dict[int, Payloads]:
+        """
+        Returns the request and reply of the transactions wherever they are stored.
+
+        Returns:
+            Dict[int, Tuple[Optional[str], Optional[str]]]: `send_data` and
+            `received_data` keyed by transaction ID.
+        """
+        if not self:
+            return {}
+        self.flush(["send_data", "received_data", "payload_compressed"])
+        self._cr.execute(
+            f"""
+            SELECT t.id, t.send_data, t.received_data,
+                COALESCE(t.payload_compressed, a.payload), t.payload_attachment_id
+            FROM {self._table} t
+            LEFT JOIN privatbank_terminal_transaction_archive a
+                ON a.transaction_id = t.id
+            WHERE t.id IN %s
+            """,
+            (tuple(self.ids),),
+        )
+        result: Dict[int, Payloads] = {}
+        for transaction_id, send_data, received_data, blob, attachment_id in self._cr.fetchall():
+            if send_data or received_data:
+                result[transaction_id] = (send_data, received_data)
+            elif blob:
+                result[transaction_id] = decompress_payload(blob)
+            elif attachment_id:
+                attachment: OdooRecordset = self.env["ir.attachment"].sudo().browse(
+                    attachment_id
+                )
+                result[transaction_id] = decompress_payload(attachment.raw)
+            else:
+                result[transaction_id] = (None, None)
+        return result
+
+    @api.model
+    def _cron_apply_retention(self) -> None:
+        """
+        Compresses and archives the payloads of old transactions according to
+        the `biko_pos_privatbank.retention_*` system parameters.
+
+        Rows are processed in chunks, each committed on its own and locked with
+        SKIP LOCKED, so payments are never blocked for longer than one chunk.
+        The extracted reply columns stay on the transaction.
+        """
+        policy: RetentionPolicy = RetentionPolicy.from_env(self.env)
+        if policy.compress_days <= 0:
+            return
+        started: float = time.monotonic()
+        now: datetime = fields.Datetime.now()
+
+        compressed: int = self._run_retention_chunks(
+            policy,
+            started,
+            lambda: self._compress_payloads(
+                now - timedelta(days=policy.compress_days), policy.chunk_size
+            ),
+        )
+        archived: int = 0
+        if policy.archive_days > 0:
+            archived = self._run_retention_chunks(
+                policy,
+                started,
+                lambda: self._archive_payloads(
+                    now - timedelta(days=policy.archive_days), policy
+                ),
+            )
+        _logger.info(
+            "PRIVAT-TRMINAL: Retention compressed %d and archived %d payloads in %.1fs",
+            compressed,
+            archived,
+            time.monotonic() - started,
+        )
+
+    def _run_retention_chunks(
+        self, policy: RetentionPolicy, started: float, run_chunk: Callable[[], int]
+    ) -> int:
+        """
+        Runs and commits chunks until there is nothing left or the run is too long.
+
+        Args:
+            policy (RetentionPolicy): The retention policy.
+            started (float): `time.monotonic()` of the start of the run.
+            run_chunk (Callable[[], int]): Processes one chunk, returns its size.
+
+        Returns:
+            int: Number of processed transactions.
+        """
+        total: int = 0
+        while time.monotonic() - started < policy.max_runtime:
+            count: int = run_chunk()
+            self._cr.commit()
+            total += count
+            if count < policy.chunk_size:
+                break
+        return total
+
+    @api.model
+    def _compress_payloads(self, before: datetime, limit: int) -> int:
+        """
+        Replaces the plain payloads of one chunk of finished transactions by a
+        compressed blob.
+
+        Args:
+            before (datetime): Only transactions created earlier are processed.
+            limit (int): The chunk size.
+
+        Returns:
+            int: Number of compressed transactions.
+        """
+        self._cr.execute(
+            f"""
+            SELECT id, send_data, received_data
+            FROM {self._table}
+            WHERE payload_state IS NULL
+                AND (send_data IS NOT NULL OR received_data IS NOT NULL)
+                AND create_date < %s
+                AND status IS DISTINCT FROM 'waitingCard'
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (before, limit),
+        )
+        rows: List[Tuple[int, Optional[str], Optional[str]]] = self._cr.fetchall()
+        if not rows:
+            return 0
+        self._cr.executemany(
+            f"""
+            UPDATE {self._table}
+            SET payload_compressed = %s,
+                payload_state = %s,
+                send_data = NULL,
+                received_data = NULL
+            WHERE id = %s
+            """,
+            [
+                (
+                    psycopg2.Binary(compress_payload(send_data, received_data)),
+                    PAYLOAD_COMPRESSED,
+                    transaction_id,
+                )
+                for transaction_id, send_data, received_data in rows
+            ],
+        )
+        self.invalidate_cache(
+            ["send_data", "received_data", "payload_compressed", "payload_state"],
+            [row[0] for row in rows],
+        )
+        return len(rows)
+
+    @api.model
+    def _archive_payloads(self, before: datetime, policy: RetentionPolicy) -> int:
+        """
+        Moves the compressed payloads of one chunk of transactions out of the
+        transaction table, to the archive table or to cold-storage attachments.
+
+        Args:
+            before (datetime): Only transactions created earlier are processed.
+            policy (RetentionPolicy): The retention policy.
+
+        Returns:
+            int: Number of archived transactions.
+        """
+        self._cr.execute(
+            f"""
+            SELECT id, payload_compressed
+            FROM {self._table}
+            WHERE payload_state = %s AND create_date < %s
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (PAYLOAD_COMPRESSED, before, policy.chunk_size),
+        )
+        rows: List[Tuple[int, bytes]] = self._cr.fetchall()
+        if not rows:
+            return 0
+
+        if policy.archive_target == ARCHIVE_ATTACHMENT:
+            attachments: OdooRecordset = self.env["ir.attachment"].sudo().create(
+                [
+                    {
+                        "name": f"privatbank_payload_{transaction_id}.json.zz",
+                        "res_model": self._name,
+                        "res_id": transaction_id,
+                        "raw": bytes(blob),
+                        "mimetype": "application/zlib",
+                    }
+                    for transaction_id, blob in rows
+                ]
+            )
+            params: List[Tuple[Any, ...]] = [
+                (PAYLOAD_COLD, attachment.id, transaction_id)
+                for (transaction_id, _blob), attachment in zip(rows, attachments)
+            ]
+        else:
+            self._cr.executemany(
+                """
+                INSERT INTO privatbank_terminal_transaction_archive
+                    (transaction_id, payload,
+                     create_uid, create_date, write_uid, write_date)
+                VALUES (%s, %s, %s, now() AT TIME ZONE 'UTC',
+                        %s, now() AT TIME ZONE 'UTC')
+                """,
+                [
+                    (transaction_id, blob, self.env.uid, self.env.uid)
+                    for transaction_id, blob in rows
+                ],
+            )
+            params = [(PAYLOAD_ARCHIVED, None, transaction_id) for transaction_id, _blob in rows]
+
+        self._cr.executemany(
+            f"""
+            UPDATE {self._table}
+            SET payload_compressed = NULL,
+                payload_state = %s,
+                payload_attachment_id = %s
+            WHERE id = %s
+            """,
+            params,
+        )
+        self.invalidate_cache(
+            ["payload_compressed", "payload_state", "payload_attachment_id"],
+            [row[0] for row in rows],
+        )
+        return len(rows)
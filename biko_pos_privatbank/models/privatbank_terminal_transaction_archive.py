@@ -0,0 +1,17 @@
+from odoo import fields, models
+
+
+class PrivatbankTerminalTransactionArchive(models.Model):
+    _name = "privatbank_terminal.transaction.archive"
+    _description = "PrivatBank Terminal Transaction Payload Archive"
+
+    transaction_id = fields.Many2one(
+        comodel_name="privatbank_terminal.transaction",
+        required=True,
+        index=True,
+        ondelete="cascade",
+    )
+    payload = fields.Binary(
+        attachment=False,
+        help="zlib-compressed send and received data of the transaction.",
+    )
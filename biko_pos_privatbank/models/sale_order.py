@@ -1,16 +1,13 @@
-import json
-import logging
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Optional, Union
 
 from odoo import models
 
-_logger = logging.getLogger(__name__)
-
 OdooRecordset = Union["models.BaseModel", Any]
 
 
 class SaleOrder(models.Model):
-    _inherit = "sale.order"
+    _name = "sale.order"
+    _inherit = ["sale.order", "privatbank.terminal.data.mixin"]
 
     def _get_payment_terminal_data(
         self,
@@ -34,36 +31,7 @@ class SaleOrder(models.Model):
             pos_session_id=pos_session_id,
         )
 
-        domain: List[Tuple[str, str, Any]] = [
-            ("order_ref", "=", f"{self._name},{self.id}"),
-            ("so_payment_type_id", "=", payment_type_id.id),
-        ]
-
-        if pos_session_id:
-            domain.append(("session_id", "=", pos_session_id.id))
-
-        transaction: OdooRecordset = self.env["privatbank_terminal.transaction"].search(
-            domain
+        payment_data.update(
+            self._get_privatbank_terminal_data(payment_type_id, pos_session_id)
         )
-
-        if not transaction:
-            return payment_data
-
-        try:
-            data: Dict[str, Any] = json.loads(transaction.received_data)  # type: ignore
-            payment_params: Dict[str, Any] = data.get("params", {})  # type: ignore
-            payment_data.update(
-                {
-                    "card_mask": payment_params.get("pan"),
-                    "bank_name": payment_params.get("bankAcquirer"),
-                    "auth_code": payment_params.get("approvalCode"),
-                    "rrn": payment_params.get("rrn"),
-                    "payment_system": payment_params.get("paymentSystem"),
-                    "terminal": payment_params.get("terminalId"),
-                    "receipt_no": payment_params.get("invoiceNumber"),
-                }
-            )
-            return payment_data
-        except Exception:
-            _logger.exception("Error parsing data")
-            return payment_data
+        return payment_data
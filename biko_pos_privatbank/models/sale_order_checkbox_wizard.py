@@ -1,9 +1,10 @@
-from typing import Any, Dict, Literal
+from typing import Any, Dict, List, Literal
 
 from odoo import _, models
 from odoo.exceptions import ValidationError
 
-from .privat_terminal_api import PrivatbankTerminal
+from .privat_terminal_api import is_async_payment_enabled
+from .privat_terminal_split import PaymentLeg, is_parallel_split_enabled
 
 
 class SaleOrderCheckbox(models.TransientModel):
@@ -18,6 +19,14 @@ class SaleOrderCheckbox(models.TransientModel):
         payment lines and sends a payment request to the PrivatBank terminal if
         the payment method is set to use PrivatBank.
 
+        In asynchronous mode the requests are queued on the background terminal
+        loop and the method returns False until every terminal has approved the
+        payment. The wizard form queues them beforehand with
+        `terminal_submit_payment` and waits for the replies, see
+        `privatbank_async_payment.js`.
+        With parallel split payments enabled, a payment over several PrivatBank
+        lines is sent to all their terminals at once.
+
         Args:
             raise_exceptions (bool): If True, raises a ValidationError on failure.
                                      Defaults to True.
@@ -34,6 +43,23 @@ class SaleOrderCheckbox(models.TransientModel):
         if not result:
             return result
 
+        async_mode: bool = is_async_payment_enabled(self.env)
+        pending: bool = False
+
+        if not async_mode and is_parallel_split_enabled(self.env):
+            legs: List[PaymentLeg] = self._get_privatbank_payment_legs()
+            if len(legs) > 1:
+                send_result: Dict[
+                    Literal["status", "info"], Any
+                ] = self.env["pos.payment.method"]._privatbank_send_split_payment(legs)
+                if send_result.get("status", "") == "retry":
+                    if raise_exceptions:
+                        raise ValidationError(
+                            send_result.get("info", _("Unexpected error"))
+                        )
+                    return False
+                return result
+
         payment: Any
         for payment in self.payment_lines:
             # Only for PrivatBank
@@ -43,20 +69,21 @@ class SaleOrderCheckbox(models.TransientModel):
             ):
                 continue
 
-            terminal: PrivatbankTerminal = PrivatbankTerminal(
-                payment.pos_payment_method_id.privatbank_terminal_ip,
-                self.env,
-            )
-
             send_result: Dict[
                 Literal["status", "info"], Any
-            ] = terminal.send_payment_request(
+            ] = payment.pos_payment_method_id._privatbank_send_payment(
                 amount=payment.cash_amount,
                 order_id=self.order_id.id,
                 payment_type_id=payment.payment_type.id,
                 session_id=self.pos_session_id.id,
+                asynchronous=async_mode,
+                request_ref=self._get_privatbank_request_ref(),
             )
 
+            if send_result.get("status", "") == "pending":
+                pending = True
+                continue
+
             if send_result.get("status", "") == "retry":
                 if raise_exceptions:
                     raise ValidationError(
@@ -65,4 +92,126 @@ class SaleOrderCheckbox(models.TransientModel):
                 else:
                     return False
 
+        if pending:
+            return False
+
         return result
+
+    def _get_privatbank_request_ref(self) -> str:
+        """
+        Returns the reference the PrivatBank payments of the wizard are stored with.
+
+        Every call of the wizard finds the payments it has already made, another
+        wizard of the same order makes new ones.
+
+        Returns:
+            str: The wizard reference in the 'model,id' format.
+        """
+        self.ensure_one()
+        return f"{self._name},{self.id}"
+
+    def _get_privatbank_payment_legs(self) -> List[PaymentLeg]:
+        """
+        Returns the PrivatBank payment lines of the wizard as legs of a split payment.
+
+        Returns:
+            List[PaymentLeg]: One leg per non-zero PrivatBank payment line.
+        """
+        legs: List[PaymentLeg] = []
+        payment: Any
+        for payment in self.payment_lines:
+            if (
+                payment.payment_amount == 0
+                or payment.pos_payment_method_id.use_payment_terminal != "privatbank"
+            ):
+                continue
+
+            legs.append(
+                PaymentLeg(
+                    payment_method=payment.pos_payment_method_id,
+                    amount=payment.cash_amount,
+                    order_id=self.order_id.id,
+                    payment_type_id=payment.payment_type.id,
+                    session_id=self.pos_session_id.id,
+                    request_ref=self._get_privatbank_request_ref(),
+                )
+            )
+        return legs
+
+    def terminal_payment_status(self) -> List[Dict[str, Any]]:
+        """
+        Returns the state of the asynchronous PrivatBank payments of the wizard.
+
+        Returns:
+            List[Dict[str, Any]]: One entry per PrivatBank payment line with the
+            payment type ID, status ("new", "pending", "done" or "retry") and info.
+        """
+        statuses: List[Dict[str, Any]] = []
+        payment: Any
+        for payment in self.payment_lines:
+            if (
+                payment.payment_amount == 0
+                or payment.pos_payment_method_id.use_payment_terminal != "privatbank"
+            ):
+                continue
+
+            status: Dict[
+                str, Any
+            ] = payment.pos_payment_method_id._privatbank_payment_status(
+                amount=payment.cash_amount,
+                order_id=self.order_id.id,
+                payment_type_id=payment.payment_type.id,
+                request_ref=self._get_privatbank_request_ref(),
+            )
+            statuses.append(dict(status, payment_type_id=payment.payment_type.id))
+        return statuses
+
+    def terminal_submit_payment(self) -> List[Dict[str, Any]]:
+        """
+        Queues the asynchronous PrivatBank payments of the wizard and returns their state.
+
+        In asynchronous mode the wizard form calls it before `terminal_send_payment`,
+        waits with the dialog open until every terminal has replied, then runs
+        `terminal_send_payment`, which finds the payments approved. A payment that is
+        already pending or approved is not sent again.
+
+        Returns:
+            List[Dict[str, Any]]: As `terminal_payment_status`, empty in synchronous mode.
+        """
+        if not is_async_payment_enabled(self.env):
+            return []
+
+        statuses: List[Dict[str, Any]] = []
+        payment: Any
+        for payment in self.payment_lines:
+            if (
+                payment.payment_amount == 0
+                or payment.pos_payment_method_id.use_payment_terminal != "privatbank"
+            ):
+                continue
+
+            status: Dict[
+                str, Any
+            ] = payment.pos_payment_method_id._privatbank_send_payment(
+                amount=payment.cash_amount,
+                order_id=self.order_id.id,
+                payment_type_id=payment.payment_type.id,
+                session_id=self.pos_session_id.id,
+                asynchronous=True,
+                request_ref=self._get_privatbank_request_ref(),
+            )
+            statuses.append(dict(status, payment_type_id=payment.payment_type.id))
+        return statuses
+
+    def terminal_cancel_payment(self, attempt_id: str) -> bool:
+        """
+        Cancels a PrivatBank payment that is waiting for the card.
+
+        Args:
+            attempt_id (str): The attempt ID of the `privatbank_payment_progress` bus messages.
+
+        Returns:
+            bool: Always True.
+        """
+        self.env["pos.payment.method"]._privatbank_cancel_payment(attempt_id)
+        return True
@@ -0,0 +1,132 @@
+odoo.define("biko_pos_privatbank.async_payment", function (require) {
+    "use strict";
+
+    const core = require("web.core");
+    const FormController = require("web.FormController");
+
+    const _t = core._t;
+
+    // Wizards whose `terminal_send_payment` button pays on PrivatBank terminals
+    const WIZARD_MODELS = ["sale.order.checkbox.wizard", "return.order.checkbox.wizard"];
+    const PAYMENT_BUTTON = "terminal_send_payment";
+    const POLL_INTERVAL = 2000;
+
+    /**
+     * In asynchronous mode the payments are queued with `terminal_submit_payment`
+     * before the `terminal_send_payment` button runs. The dialog stays open while
+     * the customer pays: the state is polled and re-read as soon as a
+     * `privatbank_payment` bus notification arrives. Once every terminal has
+     * approved, the button runs as usual, a failed payment is reported instead.
+     */
+    FormController.include({
+        /**
+         * @override
+         */
+        destroy: function () {
+            if (WIZARD_MODELS.includes(this.modelName)) {
+                clearTimeout(this._privatbankTimer);
+                this.call("bus_service", "off", "notification", this);
+            }
+            this._super.apply(this, arguments);
+        },
+
+        /**
+         * @override
+         */
+        _callButtonAction: function (attrs, record) {
+            if (!WIZARD_MODELS.includes(this.modelName) || attrs.name !== PAYMENT_BUTTON) {
+                return this._super.apply(this, arguments);
+            }
+            // `_super` is only bound during the synchronous call
+            const _super = this._super.bind(this);
+            const args = arguments;
+            return this._rpc({
+                model: this.modelName,
+                method: "terminal_submit_payment",
+                args: [[record.res_id]],
+            })
+                .then((statuses) => this._privatbankWaitPayment(record.res_id, statuses))
+                .then(() => _super(...args));
+        },
+
+        /**
+         * Resolves once no payment of the wizard is pending, rejects if one failed.
+         *
+         * @private
+         * @param {integer} resId
+         * @param {Object[]} statuses
+         * @returns {Promise}
+         */
+        _privatbankWaitPayment: function (resId, statuses) {
+            return new Promise((resolve, reject) => {
+                let polling = false;
+
+                const finish = (error) => {
+                    clearTimeout(this._privatbankTimer);
+                    this.call("bus_service", "off", "notification", this);
+                    if (error) {
+                        this.displayNotification({
+                            type: "danger",
+                            title: _t("PrivatBank payment failed"),
+                            message: error,
+                            sticky: true,
+                        });
+                        reject();
+                    } else {
+                        resolve();
+                    }
+                };
+                const check = (current) => {
+                    const failed = current.filter((status) => status.status === "retry");
+                    if (failed.length) {
+                        finish(failed.map((status) => status.info).join("\n"));
+                    } else if (!current.some((status) => status.status === "pending")) {
+                        finish();
+                    } else {
+                        clearTimeout(this._privatbankTimer);
+                        this._privatbankTimer = setTimeout(poll, POLL_INTERVAL);
+                    }
+                };
+                const poll = () => {
+                    if (polling) {
+                        return;
+                    }
+                    polling = true;
+                    this._rpc({
+                        model: this.modelName,
+                        method: "terminal_payment_status",
+                        args: [[resId]],
+                    }).then(
+                        (current) => {
+                            polling = false;
+                            check(current);
+                        },
+                        () => {
+                            polling = false;
+                            finish(_t("Can't read the state of the payment."));
+                        }
+                    );
+                };
+
+                if (!statuses.some((status) => status.status === "pending")) {
+                    check(statuses);
+                    return;
+                }
+                this.displayNotification({
+                    type: "info",
+                    title: _t("PrivatBank"),
+                    message: _t("Waiting for the card..."),
+                });
+                this.call("bus_service", "onNotification", this, (notifications) => {
+                    const paid = notifications.some(
+                        ([, message]) => message && message.type === "privatbank_payment"
+                    );
+                    if (paid) {
+                        poll();
+                    }
+                });
+                check(statuses);
+            });
+        },
+    });
+});
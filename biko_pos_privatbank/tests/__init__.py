@@ -0,0 +1,7 @@
+from . import test_async_payment
+from . import test_protocol
+from . import test_retry
+from . import test_split_payment
+from . import test_retention
+from . import test_matcher
+from . import test_export
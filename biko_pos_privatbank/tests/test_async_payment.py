@@ -0,0 +1,170 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests.common import BaseCase, TransactionCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_api import (
+    PrivatbankTerminal,
+)
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_async import (
+    ASYNC_PAYMENT_TIMEOUT,
+    ERROR_BUSY,
+    ERROR_CONNECT,
+    ERROR_RECEIVE,
+    ExchangeError,
+    TerminalEventLoop,
+)
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_retry import RetryPolicy
+
+REQUEST_REF = "sale.order.checkbox.wizard,1"
+APPROVED_REPLY = json.dumps(
+    {"method": "Purchase", "params": {"responseCode": "0000"}, "error": False}
+).encode()
+BUSY_REPLY = json.dumps(
+    {"method": "ServiceMessage", "params": {"msgType": "deviceBusy"}, "error": False}
+).encode()
+
+
+class TestAsyncPaymentState(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.terminal = PrivatbankTerminal("127.0.0.1:2000", self.env)
+        self.terminal.request_ref = REQUEST_REF
+
+    def _get_status(self, **vals):
+        transaction = self.env["privatbank_terminal.transaction"]
+        if vals:
+            transaction = transaction.new(
+                dict({"write_date": fields.Datetime.now()}, **vals)
+            )
+        with patch.object(
+            PrivatbankTerminal, "_get_transaction", return_value=transaction
+        ):
+            return self.terminal._get_async_state(None, 1)["status"]
+
+    def test_new_payment(self):
+        self.assertEqual(self._get_status(), "new")
+
+    def test_approved_for_the_same_request(self):
+        self.assertEqual(
+            self._get_status(status="done", request_ref=REQUEST_REF), "done"
+        )
+
+    def test_approved_for_another_request(self):
+        # An earlier payment of the order doesn't approve this one
+        self.assertEqual(
+            self._get_status(status="done", request_ref="pos.order,7"), "new"
+        )
+        self.assertEqual(self._get_status(status="done", request_ref=False), "new")
+
+    def test_other_request_waiting_for_the_card(self):
+        self.assertEqual(
+            self._get_status(status="waitingCard", request_ref="pos.order,7"),
+            "retry",
+        )
+
+    def test_waiting_for_the_card(self):
+        self.assertEqual(
+            self._get_status(status="waitingCard", request_ref=REQUEST_REF),
+            "pending",
+        )
+
+    def test_worker_died_while_waiting(self):
+        stale = fields.Datetime.now() - timedelta(seconds=ASYNC_PAYMENT_TIMEOUT * 2)
+        self.assertEqual(
+            self._get_status(
+                status="waitingCard", request_ref=REQUEST_REF, write_date=stale
+            ),
+            "retry",
+        )
+        self.assertEqual(
+            self._get_status(
+                status="waitingCard", request_ref="pos.order,7", write_date=stale
+            ),
+            "new",
+        )
+
+    def test_declined(self):
+        transaction = self.env["privatbank_terminal.transaction"].new(
+            {
+                "status": "retry",
+                "request_ref": REQUEST_REF,
+                "write_date": fields.Datetime.now(),
+                "received_data": json.dumps({"errorDescription": "Declined"}),
+            }
+        )
+        with patch.object(
+            PrivatbankTerminal, "_get_transaction", return_value=transaction
+        ):
+            state = self.terminal._get_async_state(None, 1)
+        self.assertEqual(state, {"status": "retry", "info": "Declined"})
+
+
+class ScriptedEventLoop(TerminalEventLoop):
+    """Answers every exchange with the next scripted error class, then approves."""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.requests = 0
+
+    async def _send_request(self, host, port, request, timeout, on_message=None):
+        self.requests += 1
+        error = self.errors.pop(0) if self.errors else None
+        if error == ERROR_BUSY:
+            return BUSY_REPLY
+        if error:
+            raise ExchangeError(error, f"{error} failed")
+        return APPROVED_REPLY
+
+
+class TestTerminalEventLoopRetry(BaseCase):
+    def _pay(self, errors, retry_policy):
+        event_loop = ScriptedEventLoop(errors)
+        self.addCleanup(self._stop, event_loop)
+        replies = []
+        event_loop.submit(
+            "127.0.0.1",
+            2000,
+            b"{}\x00",
+            lambda reply, error: replies.append((reply, error)),
+            retry_policy=retry_policy,
+        ).result(timeout=10)
+        return event_loop.requests, replies[0]
+
+    def _stop(self, event_loop):
+        event_loop.loop.call_soon_threadsafe(event_loop.loop.stop)
+        event_loop.thread.join(timeout=10)
+        event_loop.queue_executor.shutdown()
+        event_loop.release_executor.shutdown()
+        event_loop.loop.close()
+
+    def test_lost_reply_not_resent(self):
+        # The terminal may have charged the card, the state decides, not a resend
+        requests, (reply, error) = self._pay(
+            [ERROR_RECEIVE], RetryPolicy(base_delay=0.001)
+        )
+        self.assertEqual(requests, 1)
+        self.assertEqual(reply, b"")
+        self.assertEqual(error, "receive failed")
+
+    def test_unprocessed_requests_retried(self):
+        requests, (reply, error) = self._pay(
+            [ERROR_CONNECT, ERROR_BUSY], RetryPolicy(base_delay=0.001)
+        )
+        self.assertEqual(requests, 3)
+        self.assertEqual((reply, error), (APPROVED_REPLY, ""))
+
+    def test_retry_budget(self):
+        requests, (reply, error) = self._pay(
+            [ERROR_CONNECT] * 3, RetryPolicy(base_delay=0.001, budgets={"connect": 1})
+        )
+        self.assertEqual(requests, 2)
+        self.assertEqual((reply, error), (b"", "connect failed"))
+
+    def test_no_retry_policy(self):
+        requests, (reply, _error) = self._pay([ERROR_BUSY], None)
+        self.assertEqual(requests, 1)
+        self.assertEqual(reply, BUSY_REPLY)
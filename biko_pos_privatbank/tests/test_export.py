@@ -0,0 +1,65 @@
+from datetime import date
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_export import (
+    EXPORT_COLUMNS,
+    ExportFilter,
+)
+
+
+class TestExportFilter(BaseCase):
+    def test_no_filter(self):
+        query, params = ExportFilter().get_query()
+        self.assertIn("WHERE TRUE", query)
+        self.assertIn("ORDER BY t.id", query)
+        self.assertEqual(params, [])
+        for _header, expression in EXPORT_COLUMNS:
+            self.assertIn(expression, query)
+
+    def test_all_filters(self):
+        query, params = ExportFilter(
+            terminal_id="S1T00001",
+            session_id=7,
+            subsystem="SALE",
+            date_from=date(2024, 3, 1),
+            date_to=date(2024, 3, 31),
+        ).get_query()
+        self.assertIn(
+            "t.terminal_id = %s AND t.session_id = %s "
+            "AND split_part(t.order_ref, ',', 1) IN %s "
+            "AND t.create_date >= %s AND t.create_date < %s",
+            query,
+        )
+        # The last day is included
+        self.assertEqual(
+            params,
+            [
+                "S1T00001",
+                7,
+                ("sale.order", "sale.stock.return"),
+                date(2024, 3, 1),
+                date(2024, 4, 1),
+            ],
+        )
+
+    def test_from_params(self):
+        export_filter = ExportFilter.from_params(
+            {"session_id": "7", "subsystem": "pos", "date_from": "2024-03-01"}
+        )
+        self.assertEqual(export_filter.session_id, 7)
+        self.assertEqual(export_filter.subsystem, "POS")
+        self.assertEqual(export_filter.date_from, date(2024, 3, 1))
+        self.assertIsNone(export_filter.terminal_id)
+        self.assertIsNone(export_filter.date_to)
+        _query, params = export_filter.get_query()
+        self.assertEqual(params, [7, ("pos.order",), date(2024, 3, 1)])
+
+    def test_from_params_invalid(self):
+        for params in (
+            {"subsystem": "stock"},
+            {"session_id": "seven"},
+            {"date_to": "31.03.2024"},
+        ):
+            with self.assertRaises(ValueError):
+                ExportFilter.from_params(params)
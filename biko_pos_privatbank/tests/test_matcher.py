@@ -0,0 +1,91 @@
+from datetime import date
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_matcher import (
+    MATCH_RRN,
+    MATCH_TERMINAL,
+    StatementLine,
+    TerminalTransaction,
+    TransactionMatcher,
+)
+
+DAY = date(2024, 3, 15)
+
+
+class TestTransactionMatcher(BaseCase):
+    def test_match_by_rrn(self):
+        matcher = TransactionMatcher(
+            [TerminalTransaction(1, "123456789012", 100.0, "S1T00001", DAY)]
+        )
+        result = matcher.match(
+            [StatementLine(10, DAY, 100.0, "Card payment RRN 123456789012")]
+        )
+        self.assertEqual(result.matched, [(10, 1, MATCH_RRN)])
+        self.assertEqual(result.unmatched_lines, [])
+        self.assertEqual(result.unmatched_transactions, [])
+
+    def test_repeated_rrn_matches_once(self):
+        matcher = TransactionMatcher(
+            [TerminalTransaction(1, "123456789012", 100.0, None, DAY)]
+        )
+        result = matcher.match(
+            [StatementLine(10, DAY, 100.0, "123456789012 / ref 123456789012")]
+        )
+        self.assertEqual(result.matched, [(10, 1, MATCH_RRN)])
+
+    def test_match_by_terminal_and_amount(self):
+        matcher = TransactionMatcher(
+            [
+                TerminalTransaction(1, None, 55.5, "S1T00001", DAY),
+                TerminalTransaction(2, None, 70.0, "S1T00001", DAY),
+            ]
+        )
+        result = matcher.match([StatementLine(10, DAY, 55.5, "terminal s1t00001")])
+        self.assertEqual(result.matched, [(10, 1, MATCH_TERMINAL)])
+        self.assertEqual(result.unmatched_transactions, [2])
+
+    def test_amount_and_window(self):
+        matcher = TransactionMatcher(
+            [
+                TerminalTransaction(1, "123456789012", 100.0, None, date(2024, 3, 1)),
+                TerminalTransaction(2, "123456789013", 100.0, None, DAY),
+            ],
+            window_days=3,
+        )
+        result = matcher.match(
+            [
+                # Outside the window
+                StatementLine(10, DAY, 100.0, "123456789012"),
+                # Another amount
+                StatementLine(11, DAY, 99.99, "123456789013"),
+            ]
+        )
+        self.assertEqual(result.matched, [])
+        self.assertEqual(result.unmatched_lines, [10, 11])
+        self.assertEqual(result.unmatched_transactions, [1, 2])
+
+    def test_ambiguous(self):
+        matcher = TransactionMatcher(
+            [
+                TerminalTransaction(1, None, 20.0, "S1T00001", DAY),
+                TerminalTransaction(2, None, 20.0, "S1T00001", DAY),
+            ]
+        )
+        result = matcher.match([StatementLine(10, DAY, 20.0, "S1T00001")])
+        self.assertEqual(result.matched, [])
+        self.assertEqual(result.ambiguous, [(10, [1, 2])])
+        self.assertEqual(result.unmatched_transactions, [])
+
+    def test_transaction_matched_once(self):
+        matcher = TransactionMatcher(
+            [TerminalTransaction(1, "123456789012", 100.0, None, DAY)]
+        )
+        result = matcher.match(
+            [
+                StatementLine(10, DAY, 100.0, "123456789012"),
+                StatementLine(11, DAY, 100.0, "123456789012"),
+            ]
+        )
+        self.assertEqual(result.matched, [(10, 1, MATCH_RRN)])
+        self.assertEqual(result.unmatched_lines, [11])
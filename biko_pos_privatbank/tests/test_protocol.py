@@ -0,0 +1,46 @@
+from odoo.tests.common import BaseCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_protocol import (
+    FrameDecoder,
+    FrameTooLargeError,
+)
+
+
+class TestFrameDecoder(BaseCase):
+    def test_frames_split_across_reads(self):
+        decoder = FrameDecoder()
+        self.assertEqual(decoder.feed(b'{"a"'), [])
+        self.assertEqual(decoder.pending, 4)
+        self.assertEqual(decoder.feed(b": 1}\x00{"), [b'{"a": 1}'])
+        self.assertEqual(decoder.pending, 1)
+        self.assertEqual(decoder.feed(b"}\x00"), [b"{}"])
+        self.assertEqual(decoder.pending, 0)
+
+    def test_several_frames_in_one_read(self):
+        decoder = FrameDecoder()
+        self.assertEqual(decoder.feed(b"one\x00two\x00thr"), [b"one", b"two"])
+        self.assertEqual(decoder.feed(b"ee\x00"), [b"three"])
+
+    def test_byte_by_byte(self):
+        decoder = FrameDecoder()
+        frames = []
+        for byte in b"first\x00second\x00":
+            frames.extend(decoder.feed(bytes([byte])))
+        self.assertEqual(frames, [b"first", b"second"])
+
+    def test_empty_frames_skipped(self):
+        decoder = FrameDecoder()
+        self.assertEqual(decoder.feed(b"\x00\x00one\x00\x00"), [b"one"])
+        self.assertEqual(decoder.pending, 0)
+
+    def test_frame_too_large(self):
+        decoder = FrameDecoder(max_frame_size=8)
+        self.assertEqual(decoder.feed(b"12345678\x00"), [b"12345678"])
+        with self.assertRaises(FrameTooLargeError):
+            decoder.feed(b"123456789\x00")
+
+    def test_incomplete_frame_too_large(self):
+        decoder = FrameDecoder(max_frame_size=8)
+        decoder.feed(b"1234")
+        with self.assertRaises(FrameTooLargeError):
+            decoder.feed(b"56789")
@@ -0,0 +1,33 @@
+import json
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_retention import (
+    compress_payload,
+    decompress_payload,
+)
+
+
+class TestPayloadCompression(BaseCase):
+    def test_round_trip(self):
+        send_data = json.dumps({"method": "Purchase", "params": {"amount": "10.00"}})
+        received_data = json.dumps(
+            {"params": {"rrn": "123456789012"}, "errorDescription": "Операцію схвалено"}
+        )
+        blob = compress_payload(send_data, received_data)
+        self.assertIsInstance(blob, bytes)
+        self.assertEqual(decompress_payload(blob), (send_data, received_data))
+
+    def test_empty_values(self):
+        self.assertEqual(decompress_payload(compress_payload(None, None)), (None, None))
+        self.assertEqual(decompress_payload(compress_payload("", None)), ("", None))
+
+    def test_memoryview(self):
+        # Binary columns are read back as memoryview
+        blob = compress_payload("request", "reply")
+        self.assertEqual(decompress_payload(memoryview(blob)), ("request", "reply"))
+
+    def test_smaller_than_the_payloads(self):
+        received_data = json.dumps({"params": {"receipt": "line " * 200}})
+        blob = compress_payload(received_data, received_data)
+        self.assertLess(len(blob), len(received_data))
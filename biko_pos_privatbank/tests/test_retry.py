@@ -0,0 +1,153 @@
+import time
+from unittest.mock import MagicMock, patch
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_api import (
+    TERMINAL_ERROR_BUSY,
+    TERMINAL_ERROR_CONNECT,
+    TERMINAL_ERROR_RECEIVE,
+    TERMINAL_ERROR_SEND,
+    PrivatbankTerminal,
+)
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_retry import RetryPolicy
+
+REPLY = b'{"method": "Purchase", "error": false}'
+
+
+class TestRetryPolicy(BaseCase):
+    def test_budget_per_error_class(self):
+        policy = RetryPolicy(budgets={"connect": 2})
+        started = time.monotonic()
+        self.assertTrue(policy.allows("connect", {}, started))
+        self.assertTrue(policy.allows("connect", {"connect": 1}, started))
+        self.assertFalse(policy.allows("connect", {"connect": 2}, started))
+        self.assertFalse(policy.allows("receive", {}, started))
+
+    def test_processed_requests_not_retried(self):
+        policy = RetryPolicy()
+        started = time.monotonic()
+        for error_class in ("receive", "reply", "cancelled", "down", "queue"):
+            self.assertFalse(policy.allows(error_class, {}, started), error_class)
+        for error_class in ("connect", "deviceBusy", "send"):
+            self.assertTrue(policy.allows(error_class, {}, started), error_class)
+
+    def test_deadline(self):
+        policy = RetryPolicy(deadline=5.0)
+        self.assertFalse(policy.allows("connect", {}, time.monotonic() - 6.0))
+
+    def test_delay_bounds(self):
+        policy = RetryPolicy(base_delay=0.1, max_delay=0.5, multiplier=2.0)
+        for attempt in range(10):
+            delay = policy.delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(0.5, 0.1 * 2**attempt))
+
+    def test_no_retry(self):
+        policy = RetryPolicy.no_retry()
+        self.assertFalse(policy.allows("connect", {}, time.monotonic()))
+
+
+class TestTerminalExchange(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.terminal = PrivatbankTerminal("127.0.0.1:2000", env=None)
+        self.sent = 0
+        # Whether each connection is taken from the pool, then fresh ones
+        self.reused = [True]
+        self.connects = []
+        for name, side_effect in (
+            ("_connect", self._connect),
+            ("_send_data", self._send),
+            ("_receive_data", self._receive),
+            ("_release", lambda reusable: None),
+        ):
+            patcher = patch.object(self.terminal, name, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.send_results = []
+        self.replies = []
+
+    def _connect(self):
+        self.terminal.socket_reused = self.reused.pop(0) if self.reused else False
+        self.connects.append(self.terminal.socket_reused)
+        return True
+
+    def _send(self, data):
+        self.sent += 1
+        return self.send_results.pop(0)
+
+    def _receive(self, **kwargs):
+        return self.replies.pop(0)
+
+    def test_reply(self):
+        self.send_results, self.replies = [True], [REPLY]
+        self.assertEqual(self.terminal._exchange({}), REPLY)
+        self.assertEqual(self.terminal.last_error, "")
+
+    def test_lost_reply_not_resent(self):
+        self.send_results, self.replies = [True, True], [b"", REPLY]
+        self.assertEqual(self.terminal._exchange({}), b"")
+        self.assertEqual(self.sent, 1)
+        self.assertEqual(self.terminal.last_error, TERMINAL_ERROR_RECEIVE)
+
+    def test_stale_pooled_socket_resent_once(self):
+        self.send_results, self.replies = [False, True], [REPLY]
+        self.assertEqual(self.terminal._exchange({}), REPLY)
+        self.assertEqual(self.connects, [True, False])
+
+    def test_send_error_on_fresh_socket(self):
+        self.reused = [False]
+        self.send_results = [False, True]
+        self.assertEqual(self.terminal._exchange({}), b"")
+        self.assertEqual(self.sent, 1)
+        self.assertEqual(self.terminal.last_error, TERMINAL_ERROR_SEND)
+
+
+class TestSendWithRetries(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.terminal = PrivatbankTerminal("127.0.0.1:2000", env=None)
+        self.policy = RetryPolicy(base_delay=0.001)
+        self.committed = []
+        self.attempts = []
+        for name, side_effect in (
+            ("_attempt_payment", self._attempt),
+            ("_get_committed_state", self._committed_state),
+            ("_create_update_transaction", lambda **vals: None),
+        ):
+            patcher = patch.object(self.terminal, name, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _attempt(self, *args):
+        error = self.attempts.pop(0)
+        self.terminal.last_error = error
+        if error:
+            return {"status": "retry", "info": error}
+        return {"status": "done", "info": ""}
+
+    def _committed_state(self, order, payment_type_id):
+        return self.committed.pop(0) if self.committed else (None, None, None)
+
+    def _send(self):
+        return self.terminal._send_with_retries(MagicMock(), 1, 1, {}, 1.0, self.policy)
+
+    def test_unprocessed_request_retried(self):
+        self.attempts = [TERMINAL_ERROR_CONNECT, TERMINAL_ERROR_BUSY, ""]
+        self.assertEqual(self._send()["status"], "done")
+        self.assertEqual(self.attempts, [])
+
+    def test_lost_reply_not_retried(self):
+        self.attempts = [TERMINAL_ERROR_RECEIVE, ""]
+        self.assertEqual(self._send()["status"], "retry")
+        self.assertEqual(self.attempts, [""])
+
+    def test_approved_by_another_worker(self):
+        self.attempts = [TERMINAL_ERROR_BUSY, ""]
+        self.committed = [
+            ("waitingCard", None, None),
+            ("done", '{"responseCode": "0000"}', None),
+        ]
+        self.assertEqual(self._send()["status"], "done")
+        self.assertEqual(self.attempts, [""])
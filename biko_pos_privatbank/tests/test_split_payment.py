@@ -0,0 +1,157 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from odoo.tests.common import BaseCase, TransactionCase
+
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_api import (
+    TERMINAL_ERROR_CONNECT,
+    TERMINAL_ERROR_RECEIVE,
+    PrivatbankTerminal,
+)
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_dispatcher import (
+    TerminalDispatcher,
+)
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_health import (
+    health_cache,
+)
+from odoo.addons.biko_pos_privatbank.models.privat_terminal_split import (
+    LEG_ERROR_DEADLINE,
+    PaymentLeg,
+    exchange_leg,
+)
+
+REQUEST_REF = "sale.order.checkbox.wizard,1"
+FIRST = "127.0.0.1:2001"
+SECOND = "127.0.0.1:2002"
+REPLY = b'{"method": "Purchase", "error": false}'
+BUSY_REPLY = json.dumps(
+    {"method": "ServiceMessage", "params": {"msgType": "deviceBusy"}, "error": False}
+).encode()
+
+
+def make_leg(request_ref=REQUEST_REF):
+    payment_method = MagicMock()
+    payment_method.name = "Card"
+    payment_method._get_privatbank_terminal_addresses.return_value = [FIRST]
+    return PaymentLeg(
+        payment_method=payment_method,
+        amount=100.0,
+        order_id=1,
+        payment_type_id=1,
+        session_id=1,
+        request_ref=request_ref,
+    )
+
+
+class TestExchangeLeg(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = TerminalDispatcher()
+        self.outcomes = {}
+        self.sent_to = []
+        patcher = patch.object(
+            PrivatbankTerminal,
+            "_run_exchange",
+            autospec=True,
+            side_effect=self._run_exchange,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run_exchange(self, terminal, registry, data, queue_wait, reply_deadline):
+        address = f"{terminal.terminal_ip}:{terminal.terminal_port}"
+        self.sent_to.append(address)
+        terminal.last_error, reply = self.outcomes[address]
+        return reply
+
+    def _exchange(self, expires_in=60.0):
+        leg = make_leg()
+        leg.addresses = [FIRST, SECOND]
+        exchange_leg(
+            leg, None, self.dispatcher, time.monotonic() + expires_in, 5.0, 1.0
+        )
+        return leg
+
+    def test_failover_after_connect_error(self):
+        self.outcomes = {FIRST: (TERMINAL_ERROR_CONNECT, b""), SECOND: ("", REPLY)}
+        leg = self._exchange()
+        self.assertEqual(self.sent_to, [FIRST, SECOND])
+        self.assertEqual(leg.terminal.terminal_port, "2002")
+        self.assertEqual(leg.received_data, REPLY)
+        self.assertTrue(self.dispatcher.get_state()[FIRST]["down"])
+
+    def test_failover_after_busy_reply(self):
+        self.outcomes = {FIRST: ("", BUSY_REPLY), SECOND: ("", REPLY)}
+        leg = self._exchange()
+        self.assertEqual(self.sent_to, [FIRST, SECOND])
+        self.assertEqual(leg.received_data, REPLY)
+        self.assertTrue(self.dispatcher.get_state()[FIRST]["busy"])
+
+    def test_lost_reply_not_sent_elsewhere(self):
+        # The first terminal may have charged the card
+        self.outcomes = {FIRST: (TERMINAL_ERROR_RECEIVE, b""), SECOND: ("", REPLY)}
+        leg = self._exchange()
+        self.assertEqual(self.sent_to, [FIRST])
+        self.assertEqual(leg.terminal.terminal_port, "2001")
+        self.assertEqual(leg.terminal.last_error, TERMINAL_ERROR_RECEIVE)
+
+    def test_deadline(self):
+        leg = self._exchange(expires_in=-1.0)
+        self.assertEqual(self.sent_to, [])
+        self.assertEqual(leg.error, LEG_ERROR_DEADLINE)
+
+
+class TestSplitPaymentIdempotency(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.committed_ref = REQUEST_REF
+        self.sent = []
+        method_model = type(self.env["pos.payment.method"])
+        for target, name, kwargs in (
+            (
+                PrivatbankTerminal,
+                "_prepare_payment",
+                {"return_value": (MagicMock(), None)},
+            ),
+            (
+                PrivatbankTerminal,
+                "_get_committed_state",
+                {"side_effect": self._get_committed_state},
+            ),
+            (PrivatbankTerminal, "_prepare_order_data", {"return_value": {}}),
+            (health_cache, "get_state", {"return_value": None}),
+            (method_model, "_privatbank_store_leg", {}),
+            (method_model, "_privatbank_run_legs", {"side_effect": self._run_legs}),
+        ):
+            patcher = patch.object(target, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_committed_state(self, order, payment_type_id):
+        return "done", "{}", self.committed_ref
+
+    def _run_legs(self, legs):
+        self.sent.extend(legs)
+        for leg in legs:
+            leg.result = {"status": "done", "info": ""}
+
+    def _pay(self, leg):
+        return self.env["pos.payment.method"]._privatbank_send_split_payment([leg])
+
+    def test_leg_approved_for_the_same_request(self):
+        result = self._pay(make_leg())
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(self.sent, [])
+
+    def test_leg_approved_for_another_request(self):
+        self.committed_ref = "sale.order.checkbox.wizard,2"
+        leg = make_leg()
+        self.assertEqual(self._pay(leg)["status"], "done")
+        self.assertEqual(self.sent, [leg])
+
+    def test_leg_without_request(self):
+        self.committed_ref = False
+        leg = make_leg(request_ref="")
+        self.assertEqual(self._pay(leg)["status"], "done")
+        self.assertEqual(self.sent, [leg])
@@ -0,0 +1,93 @@
+import json
+import timeit
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models.privat_terminal_protocol import (
+    decode_reply_text,
+    parse_reply,
+    repair_fields,
+    repair_text,
+)
+
+SAMPLE_REPLIES: Dict[str, bytes] = {
+    "approved": json.dumps(
+        {
+            "method": "Purchase",
+            "step": 0,
+            "params": {
+                "amount": "100.50",
+                "approvalCode": "123456",
+                "bankAcquirer": "PrivatBank",
+                "invoiceNumber": "000123",
+                "pan": "5168********1234",
+                "paymentSystem": "MasterCard",
+                "responseCode": "0000",
+                "rrn": "123456789012",
+                "terminalId": "S1T00001",
+            },
+            "error": False,
+            "errorDescription": "",
+        }
+    ).encode(),
+    "cyrillic": json.dumps(
+        {
+            "method": "Purchase",
+            "step": 0,
+            "params": {"responseCode": "1001"},
+            "error": True,
+            "errorDescription": "Операцію відхилено банком",
+        },
+        ensure_ascii=False,
+    ).encode(),
+    "mojibake": json.dumps(
+        {
+            "method": "Purchase",
+            "step": 0,
+            "params": {"responseCode": "1001"},
+            "error": True,
+            "errorDescription": "Операцію відхилено банком".encode().decode("latin-1"),
+        },
+        ensure_ascii=False,
+    ).encode(),
+}
+
+
+def legacy_decode(frame: bytes) -> Dict[str, Any]:
+    """The former pipeline: `fix_text` over the whole reply before `json.loads`."""
+    return json.loads(repair_text(frame.decode()))
+
+
+def fast_decode(frame: bytes) -> Dict[str, Any]:
+    """The pipeline of `PrivatbankTerminal._parse_data`."""
+    return repair_fields(parse_reply(decode_reply_text(frame)))
+
+
+def run(number: int = 2000) -> List[Tuple[str, float, float]]:
+    """
+    Measures the per-reply cost of both pipelines on the sample replies.
+
+    Args:
+        number (int): Iterations per measurement. Defaults to 2000.
+
+    Returns:
+        List[Tuple[str, float, float]]: Sample name, legacy and fast cost in microseconds.
+    """
+    # Import ftfy outside of the measurement
+    repair_text("")
+    results: List[Tuple[str, float, float]] = []
+    for name, frame in SAMPLE_REPLIES.items():
+        assert legacy_decode(frame) == fast_decode(frame), name
+        legacy: float = timeit.timeit(lambda: legacy_decode(frame), number=number)
+        fast: float = timeit.timeit(lambda: fast_decode(frame), number=number)
+        results.append((name, legacy / number * 1e6, fast / number * 1e6))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    print(f"{'reply':<10} {'legacy us':>10} {'fast us':>10} {'speedup':>8}")
+    for name, legacy, fast in run():
+        print(f"{name:<10} {legacy:>10.1f} {fast:>10.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, List, Optional, Tuple
+
+import odoo
+from odoo import SUPERUSER_ID, api
+
+from ..models.privat_terminal_api import PrivatbankTerminal
+from .terminal_simulator import TerminalSimulator, load_transaction_pairs
+
+_logger = logging.getLogger(__name__)
+
+PHASES: List[str] = [
+    "queue",
+    "connect",
+    "send",
+    "card_wait",
+    "receive",
+    "parse",
+    "total",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (List[float]): Sorted sample.
+        q (float): Percentile in the 0-100 range.
+
+    Returns:
+        float: The percentile value, 0.0 for an empty sample.
+    """
+    if not values:
+        return 0.0
+    rank: int = max(int(round(q / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def _run_payment(
+    address: str, data: Dict[str, Any], queue: ContextManager[Any]
+) -> Dict[str, Any]:
+    """
+    Runs the protocol phases of one payment through PrivatbankTerminal.
+
+    The database part of `send_payment_request` is skipped, only the exchange
+    with the terminal is measured. `queue` stands for the terminal queue that
+    serializes the payments to one terminal in production.
+    """
+    terminal: PrivatbankTerminal = PrivatbankTerminal(address, env=None)  # type: ignore
+    timings: Dict[str, float] = {}
+    first_message: List[float] = []
+
+    queued: float = time.perf_counter()
+    with queue:
+        timings["queue"] = time.perf_counter() - queued
+        return _exchange(terminal, data, timings, first_message)
+
+
+def _exchange(
+    terminal: PrivatbankTerminal,
+    data: Dict[str, Any],
+    timings: Dict[str, float],
+    first_message: List[float],
+) -> Dict[str, Any]:
+    started: float = time.perf_counter()
+    if not terminal._connect():
+        return {"status": "connect_error", "timings": timings}
+    connected: float = time.perf_counter()
+    timings["connect"] = connected - started
+
+    if not terminal._send_data(data):
+        terminal._release(reusable=False)
+        return {"status": "send_error", "timings": timings}
+    sent: float = time.perf_counter()
+    timings["send"] = sent - connected
+
+    received_data: bytes = terminal._receive_data(
+        on_message=lambda message: first_message.append(time.perf_counter())
+    )
+    received: float = time.perf_counter()
+    terminal._release(reusable=bool(received_data))
+    if not received_data:
+        return {"status": "receive_error", "timings": timings}
+    first: float = first_message[0] if first_message else received
+    timings["card_wait"] = first - sent
+    timings["receive"] = received - first
+
+    return_data, _data = terminal._parse_data(received_data)
+    parsed: float = time.perf_counter()
+    timings["parse"] = parsed - received
+    timings["total"] = parsed - started
+
+    status: str = "done"
+    if return_data.get("status") == "retry":
+        status = "busy" if return_data.get("info") == "deviceBusy" else "error"
+    return {"status": status, "timings": timings}
+
+
+def run_benchmark(
+    addresses: List[str],
+    payments: int = 100,
+    concurrency: int = 10,
+    amount: float = 100.0,
+    requests: Optional[List[Dict[str, Any]]] = None,
+    serialize: bool = True,
+) -> Dict[str, Any]:
+    """
+    Drives concurrent payments against terminals and aggregates phase latencies.
+
+    Like the terminal queue in production, payments to the same terminal are
+    serialized unless `serialize` is False, a terminal answers `deviceBusy` to
+    a request arriving during a transaction. Only approved payments are counted
+    in the latency percentiles, the other outcomes are only counted by status.
+
+    Args:
+        addresses (List[str]): Terminal addresses in the 'IP:PORT' format, payments
+            are distributed round-robin.
+        payments (int): Total number of payments. Defaults to 100.
+        concurrency (int): Number of payments in flight. Defaults to 10.
+        amount (float): Amount of each payment. Defaults to 100.0.
+        requests (Optional[List[Dict[str, Any]]]): Recorded requests sent in turn
+            instead of purchases of `amount`, e.g. to replay `load_transaction_pairs`.
+        serialize (bool): Send one payment at a time to each terminal. Defaults to True.
+
+    Returns:
+        Dict[str, Any]: Throughput, status counts and p50/p95/p99 per phase in milliseconds.
+    """
+    if not requests:
+        terminal: PrivatbankTerminal = PrivatbankTerminal(
+            addresses[0], env=None  # type: ignore
+        )
+        requests = [terminal._prepare_order_data(amount, "")]
+    locks: Dict[str, threading.Lock] = {address: threading.Lock() for address in addresses}
+
+    def run(index: int) -> Dict[str, Any]:
+        address: str = addresses[index % len(addresses)]
+        return _run_payment(
+            address,
+            requests[index % len(requests)],
+            locks[address] if serialize else nullcontext(),
+        )
+
+    started: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results: List[Dict[str, Any]] = list(executor.map(run, range(payments)))
+    elapsed: float = time.perf_counter() - started
+
+    statuses: Dict[str, int] = {}
+    samples: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    result: Dict[str, Any]
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        # Instant busy or error replies would hide the latency of the payments
+        if result["status"] != "done":
+            continue
+        phase: str
+        value: float
+        for phase, value in result["timings"].items():
+            samples[phase].append(value * 1000.0)
+
+    phases: Dict[str, Dict[str, float]] = {}
+    for phase in PHASES:
+        values: List[float] = sorted(samples[phase])
+        phases[phase] = {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+        }
+
+    return {
+        "payments": payments,
+        "concurrency": concurrency,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(payments / elapsed, 2) if elapsed else 0.0,
+        "approved_throughput": round(statuses.get("done", 0) / elapsed, 2)
+        if elapsed
+        else 0.0,
+        "statuses": statuses,
+        "phases": phases,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Formats the result of `run_benchmark` as a text table.
+
+    Args:
+        report (Dict[str, Any]): The benchmark result.
+
+    Returns:
+        str: The report.
+    """
+    lines: List[str] = [
+        f"Payments: {report['payments']}, concurrency: {report['concurrency']}, "
+        f"elapsed: {report['elapsed']} s, throughput: {report['throughput']} payments/s "
+        f"({report['approved_throughput']} approved/s)",
+        f"Statuses: {report['statuses']}, latencies of approved payments only",
+        f"{'phase':<10} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}",
+    ]
+    phase: str
+    stats: Dict[str, float]
+    for phase, stats in report["phases"].items():
+        lines.append(
+            f"{phase:<10} {stats['count']:>7} {stats['p50']:>10} "
+            f"{stats['p95']:>10} {stats['p99']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def load_recorded_pairs(
+    database: str, config: Optional[str] = None, limit: int = 1000
+) -> List[Tuple[str, str]]:
+    """
+    Reads recorded request/reply pairs with `load_transaction_pairs` outside of
+    a running server.
+
+    Args:
+        database (str): The database name.
+        config (Optional[str]): Path of the Odoo configuration file.
+        limit (int): Maximum number of pairs. Defaults to 1000.
+
+    Returns:
+        List[Tuple[str, str]]: The `send_data` and `received_data` of each transaction.
+    """
+    if config:
+        odoo.tools.config.parse_config(["-c", config])
+    with api.Environment.manage(), odoo.registry(database).cursor() as cr:
+        return load_transaction_pairs(api.Environment(cr, SUPERUSER_ID, {}), limit=limit)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Load test of the PrivatBank terminal client against simulators"
+    )
+    parser.add_argument("--terminals", type=int, default=4)
+    parser.add_argument("--payments", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, nargs=2, default=(0.05, 0.2))
+    parser.add_argument("--fragment-size", type=int, default=0)
+    parser.add_argument("--error-ratio", type=float, default=0.0)
+    parser.add_argument(
+        "--no-serialize",
+        action="store_true",
+        help="Send concurrent payments to the same terminal, it answers deviceBusy",
+    )
+    parser.add_argument(
+        "--replay-db",
+        help="Replay the transactions recorded in this database",
+    )
+    parser.add_argument("--replay-limit", type=int, default=1000)
+    parser.add_argument("-c", "--config", help="Odoo configuration file for --replay-db")
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    pairs: List[Tuple[str, str]] = []
+    requests: List[Dict[str, Any]] = []
+    if args.replay_db:
+        pairs = load_recorded_pairs(args.replay_db, args.config, args.replay_limit)
+        send_data: str
+        for send_data, _received_data in pairs:
+            try:
+                requests.append(json.loads(send_data))
+            except ValueError:
+                continue
+        if not requests:
+            parser.error(f"No recorded transactions in {args.replay_db}")
+
+    simulators: List[TerminalSimulator] = [
+        TerminalSimulator(
+            latency=tuple(args.latency),
+            fragment_size=args.fragment_size,
+            error_ratio=args.error_ratio,
+            replay=pairs,
+        )
+        for _index in range(args.terminals)
+    ]
+    try:
+        addresses: List[str] = [simulator.start() for simulator in simulators]
+        print(
+            format_report(
+                run_benchmark(
+                    addresses,
+                    payments=args.payments,
+                    concurrency=args.concurrency,
+                    requests=requests,
+                    serialize=not args.no_serialize,
+                )
+            )
+        )
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
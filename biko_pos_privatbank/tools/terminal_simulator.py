@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from ..models.privat_terminal_protocol import FRAME_DELIMITER, FrameDecoder
+
+_logger = logging.getLogger(__name__)
+
+OdooEnvironment = Any
+
+SERVICE_MESSAGES: List[str] = ["cardInserted", "pinEntryRequired", "waitingResponse"]
+
+
+def _canonical(data: Dict[str, Any]) -> str:
+    """Key used to match a request with a recorded one."""
+    params: Dict[str, Any] = data.get("params") or {}
+    return json.dumps(
+        [data.get("method"), str(params.get("amount")), params.get("rrn", "")]
+    )
+
+
+def load_transaction_pairs(
+    env: OdooEnvironment,
+    domain: Optional[List[Tuple[str, str, Any]]] = None,
+    limit: int = 1000,
+) -> List[Tuple[str, str]]:
+    """
+    Loads recorded request/reply pairs from `privatbank_terminal.transaction`.
+
+    Args:
+        env (Environment): The Odoo environment object.
+        domain (Optional[List]): Extra search domain. Defaults to None.
+        limit (int): Maximum number of pairs. Defaults to 1000.
+
+    Returns:
+        List[Tuple[str, str]]: The `send_data` and `received_data` of each transaction.
+    """
+    transactions: Any = env["privatbank_terminal.transaction"].search(
+        [("send_data", "!=", False), ("received_data", "!=", False)] + (domain or []),
+        order="id desc",
+        limit=limit,
+    )
+    return [(rec.send_data, rec.received_data) for rec in transactions]
+
+
+class TerminalSimulator:
+    """
+    TCP server speaking the NUL-terminated JSON protocol of PrivatBank terminals.
+
+    Like a real device it processes one transaction at a time and answers
+    `deviceBusy` to requests arriving meanwhile. Replies are either generated or
+    replayed from recorded transactions matched by method, amount and RRN.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Tuple[float, float] = (0.05, 0.2),
+        fragment_size: int = 0,
+        fragment_delay: float = 0.001,
+        service_messages: bool = True,
+        error_ratio: float = 0.0,
+        replay: Optional[List[Tuple[str, str]]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Initializes the simulator.
+
+        Args:
+            host (str): The address to listen on. Defaults to '127.0.0.1'.
+            port (int): The port to listen on, 0 picks a free one. Defaults to 0.
+            latency (Tuple[float, float]): Range of the simulated card wait in seconds.
+            fragment_size (int): Split replies into chunks of this size, 0 disables it.
+            fragment_delay (float): Pause between fragments in seconds.
+            service_messages (bool): Send intermediate service messages before the reply.
+            error_ratio (float): Share of requests answered with an error.
+            replay (Optional[List[Tuple[str, str]]]): Recorded (send_data, received_data) pairs.
+            seed (Optional[int]): Seed of the random generator.
+
+        Returns:
+            None
+        """
+        self.host: str = host
+        self.port: int = port
+        self.latency: Tuple[float, float] = latency
+        self.fragment_size: int = fragment_size
+        self.fragment_delay: float = fragment_delay
+        self.service_messages: bool = service_messages
+        self.error_ratio: float = error_ratio
+        self.random: random.Random = random.Random(seed)
+        self.replay: Dict[str, Deque[str]] = {}
+        for send_data, received_data in replay or []:
+            try:
+                key: str = _canonical(json.loads(send_data))
+            except ValueError:
+                continue
+            self.replay.setdefault(key, deque()).append(received_data)
+        self.busy: bool = False
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "approved": 0,
+            "errors": 0,
+            "busy": 0,
+            "replayed": 0,
+        }
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.thread: Optional[threading.Thread] = None
+        self._started: threading.Event = threading.Event()
+
+    @property
+    def address(self) -> str:
+        """The simulator address in the 'IP:PORT' format used by PrivatbankTerminal."""
+        return f"{self.host}:{self.port}"
+
+    def _approved_reply(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        params: Dict[str, Any] = request.get("params") or {}
+        number: int = self.random.randint(100000, 999999)
+        return {
+            "method": request.get("method"),
+            "step": 0,
+            "params": {
+                "amount": str(params.get("amount")),
+                "approvalCode": f"{number}",
+                "bankAcquirer": "PrivatBank",
+                "invoiceNumber": f"{number % 10000:06d}",
+                "pan": f"5168********{number % 10000:04d}",
+                "paymentSystem": "MasterCard",
+                "responseCode": "0000",
+                "rrn": params.get("rrn") or f"{self.random.randint(10**11, 10**12 - 1)}",
+                "terminalId": "S1T00001",
+            },
+            "error": False,
+            "errorDescription": "",
+        }
+
+    def _build_reply(self, request: Dict[str, Any]) -> bytes:
+        recorded: Optional[Deque[str]] = self.replay.get(_canonical(request))
+        if recorded:
+            self.stats["replayed"] += 1
+            reply: str = recorded[0]
+            recorded.rotate(-1)
+            return reply.encode()
+
+        if request.get("method") not in ("Purchase", "Refund"):
+            self.stats["errors"] += 1
+            return json.dumps(
+                {
+                    "method": request.get("method"),
+                    "step": 0,
+                    "params": {},
+                    "error": True,
+                    "errorDescription": "Unknown method",
+                }
+            ).encode()
+
+        if self.random.random() < self.error_ratio:
+            self.stats["errors"] += 1
+            return json.dumps(
+                {
+                    "method": request.get("method"),
+                    "step": 0,
+                    "params": {"responseCode": "1001"},
+                    "error": True,
+                    "errorDescription": "Transaction declined",
+                }
+            ).encode()
+
+        self.stats["approved"] += 1
+        return json.dumps(self._approved_reply(request)).encode()
+
+    async def _write_frame(self, writer: asyncio.StreamWriter, frame: bytes) -> None:
+        data: bytes = frame + FRAME_DELIMITER
+        if not self.fragment_size:
+            writer.write(data)
+            await writer.drain()
+            return
+        for offset in range(0, len(data), self.fragment_size):
+            writer.write(data[offset : offset + self.fragment_size])
+            await writer.drain()
+            await asyncio.sleep(self.fragment_delay)
+
+    async def _process(
+        self, writer: asyncio.StreamWriter, request: Dict[str, Any]
+    ) -> None:
+        self.stats["requests"] += 1
+        if self.busy:
+            self.stats["busy"] += 1
+            await self._write_frame(
+                writer,
+                json.dumps(
+                    {
+                        "method": "ServiceMessage",
+                        "step": 0,
+                        "params": {"msgType": "deviceBusy"},
+                        "error": False,
+                        "errorDescription": "",
+                    }
+                ).encode(),
+            )
+            return
+
+        self.busy = True
+        try:
+            delay: float = self.random.uniform(*self.latency)
+            messages: List[str] = SERVICE_MESSAGES if self.service_messages else []
+            msg_type: str
+            for msg_type in messages:
+                await asyncio.sleep(delay / (len(messages) + 1))
+                await self._write_frame(
+                    writer,
+                    json.dumps(
+                        {
+                            "method": "ServiceMessage",
+                            "step": 0,
+                            "params": {"msgType": msg_type},
+                            "error": False,
+                            "errorDescription": "",
+                        }
+                    ).encode(),
+                )
+            await asyncio.sleep(delay / (len(messages) + 1))
+            await self._write_frame(writer, self._build_reply(request))
+        finally:
+            self.busy = False
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        decoder: FrameDecoder = FrameDecoder()
+        tasks: List["asyncio.Task[None]"] = []
+        try:
+            while True:
+                data: bytes = await reader.read(4096)
+                if not data:
+                    break
+                frame: bytes
+                for frame in decoder.feed(data):
+                    try:
+                        request: Dict[str, Any] = json.loads(frame)
+                    except ValueError:
+                        _logger.warning(f"SIMULATOR: Invalid request {frame!r}")
+                        continue
+                    tasks.append(asyncio.ensure_future(self._process(writer, request)))
+            await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._started.set()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._serve())  # type: ignore
+        self.loop.run_forever()  # type: ignore
+
+    def start(self) -> str:
+        """
+        Starts the simulator in a background thread.
+
+        Returns:
+            str: The simulator address in the 'IP:PORT' format.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run, name="privatbank-terminal-simulator", daemon=True
+        )
+        self.thread.start()
+        self._started.wait()
+        _logger.info(f"SIMULATOR: Listening on {self.address}")
+        return self.address
+
+    def stop(self) -> None:
+        """Stops the simulator and its thread."""
+        if not self.loop or not self.server:
+            return
+
+        async def shutdown() -> None:
+            self.server.close()  # type: ignore
+            # Pooled clients keep their connections open, drop them as well
+            tasks: List["asyncio.Task[Any]"] = [
+                task
+                for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()
+            ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()  # type: ignore
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()  # type: ignore
+        self.loop.close()
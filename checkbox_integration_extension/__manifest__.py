@@ -4,14 +4,17 @@
     Module adding ability to work in both modes: stand-alone KassaManager, and 
     General CheckBox API
     """,
-    "version": "14.0.1.1.0",
+    "version": "14.0.1.3.0",
     "license": "LGPL-3",
     "author": "Artem Borovlev",
     "depends": [
         "checkbox_integration",
     ],
     "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "views/pos_config_views.xml",
+        "views/checkbox_receipt_queue_views.xml",
     ],
     "demo": [],
     "external_dependencies": {
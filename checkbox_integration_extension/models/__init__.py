@@ -1 +1 @@
-from . import pos_config, pos_session
+from . import checkbox_receipt_queue, checkbox_token, pos_config, pos_session
@@ -1,13 +1,51 @@
+import json
 import logging
+import time
 
 import requests
 from odoo.exceptions import ValidationError
 
+from .checkbox_breaker import BreakerPolicy, get_breaker
+from .checkbox_http import DEFAULT_POOL_MAXSIZE, get_session
+
 _logger = logging.getLogger(__name__)
 
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+# Receipts are sent again after a timeout, so they can afford a short one
+DEFAULT_RECEIPT_READ_TIMEOUT = 10
+DEFAULT_RECEIPT_ATTEMPTS = 3
+RECEIPT_RETRY_DELAY = 0.5
+
+
+def make_queued_response(receipt_uid):
+    """
+    Builds the answer for a receipt accepted into the outbound queue, `id` is
+    the ID the receipt gets in Checkbox once it is delivered.
+    """
+    response = requests.Response()
+    response.status_code = 202
+    response.headers["Content-Type"] = "application/json"
+    response._content = json.dumps({"id": receipt_uid, "status": "QUEUED"}).encode()
+    return response
+
 
 class CheckboxAPI:
-    def __init__(self, api_url, api_port, cb_license, mode, access_token=None):
+    def __init__(
+        self,
+        api_url,
+        api_port,
+        cb_license,
+        mode,
+        access_token=None,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        on_unauthorized=None,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        receipt_read_timeout=DEFAULT_RECEIPT_READ_TIMEOUT,
+        receipt_attempts=DEFAULT_RECEIPT_ATTEMPTS,
+        breaker_policy=None,
+    ):
         self.mode = mode
         api_url = api_url.strip()
         if api_url[-1] == "/":
@@ -17,10 +55,28 @@ class CheckboxAPI:
         self.api_url = api_url
         self.license = cb_license
         self.access_token = access_token
+        self.pool_maxsize = pool_maxsize
+        # A session of its own instead of the shared pooled one, if set
+        self.session = None
+        # Called with the rejected token when the API answers 401
+        self.on_unauthorized = on_unauthorized
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.receipt_read_timeout = receipt_read_timeout
+        self.receipt_attempts = max(receipt_attempts, 1)
+        self.breaker = get_breaker(
+            self.api_url, mode, breaker_policy or BreakerPolicy()
+        )
 
-    def send_request(self, endpoint, method, payload, headers=None):
-        if not headers:
-            headers = {}
+    def _request(self, endpoint, method, payload, headers=None, read_timeout=None):
+        """
+        Sends the request, raising `requests` exceptions as they are.
+
+        The request goes through the circuit breaker of the endpoint, which
+        raises `CheckboxUnavailable` without calling Checkbox while the circuit
+        is open or too many requests are in flight.
+        """
+        headers = dict(headers or {})
         headers.update(
             {
                 "accept": "application/json",
@@ -29,20 +85,114 @@ class CheckboxAPI:
                 "X-Client-Version": "14.0",
             }
         )
+        token = self.breaker.acquire()
+        success = False
         try:
-            r = requests.request(
+            # Pooled keep-alive session, the connection is reused between calls
+            session = self.session or get_session(self.api_url, self.pool_maxsize)
+            r = session.request(
                 method,
                 self.api_url + endpoint,
                 headers=headers,
                 json=payload,
-                timeout=30,
+                timeout=(self.connect_timeout, read_timeout or self.read_timeout),
             )
+            # Rejected requests (4xx) are answered, the service itself is fine
+            success = r.status_code < 500 and r.status_code != 429
+        finally:
+            self.breaker.release(token, success)
+
+        if r.status_code == 401 and self.access_token and self.on_unauthorized:
+            _logger.info("===CHECKBOX===: Access token rejected, dropping it from the cache")
+            self.on_unauthorized(self.access_token)
+
+        return r
+
+    def send_request(self, endpoint, method, payload, headers=None):
+        try:
+            r = self._request(endpoint, method, payload, headers)
         except requests.exceptions.RequestException as e:
             _logger.error(f"===CHECKBOX===: Request error: {e}")
             raise ValidationError(f"Request error: {e}") from e
 
         return r
 
+    def _find_receipt(self, receipt_id, headers):
+        """
+        Looks the receipt up by its client-generated ID.
+
+        Returns the receipt response if Checkbox has it, None if it doesn't.
+        Raises `requests` exceptions if Checkbox can't be asked.
+        """
+        r = self._request(
+            f"/api/v1/receipts/{receipt_id}",
+            "GET",
+            None,
+            headers,
+            read_timeout=self.receipt_read_timeout,
+        )
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r
+
+    def _send_receipt_idempotent(self, endpoint, payload, headers):
+        """
+        Sends a receipt that has a client-generated `id`, safe to call again.
+
+        After a timeout or a broken connection the receipt may or may not have
+        been fiscalized. It is looked up by its ID and only sent again if
+        Checkbox doesn't have it. Checkbox also refuses a second receipt with
+        the same ID, so a resend can't create a duplicate.
+        """
+        receipt_id = payload["id"]
+        error = None
+        for attempt in range(1, self.receipt_attempts + 1):
+            if attempt > 1:
+                time.sleep(RECEIPT_RETRY_DELAY * (attempt - 1))
+            try:
+                r = self._request(
+                    endpoint,
+                    "POST",
+                    payload,
+                    headers,
+                    read_timeout=self.receipt_read_timeout,
+                )
+            except requests.exceptions.ConnectTimeout as e:
+                # Not connected, nothing was sent
+                error = e
+                _logger.warning(
+                    f"===CHECKBOX===: Receipt {receipt_id} connect timeout, "
+                    f"attempt {attempt}"
+                )
+                continue
+            except requests.exceptions.RequestException as e:
+                error = e
+                _logger.warning(
+                    f"===CHECKBOX===: Receipt {receipt_id} outcome unknown, "
+                    f"attempt {attempt}: {e}"
+                )
+            else:
+                if r.status_code != 409:
+                    return r
+                # Already created by an earlier attempt
+                error = requests.exceptions.HTTPError(r.text, response=r)
+                _logger.info(f"===CHECKBOX===: Receipt {receipt_id} already exists")
+
+            try:
+                found = self._find_receipt(receipt_id, headers)
+            except requests.exceptions.RequestException as e:
+                error = e
+                _logger.warning(
+                    f"===CHECKBOX===: Receipt {receipt_id} lookup failed: {e}"
+                )
+                continue
+            if found is not None:
+                return found
+
+        _logger.error(f"===CHECKBOX===: Request error: {error}")
+        raise ValidationError(f"Request error: {error}") from error
+
     def cashier_signin(self, login, password):
         if self.mode == "checkbox_kassa":
             return {"text": "", "access_token": "", "ok": True}
@@ -121,6 +271,30 @@ class CheckboxAPI:
             "z_report_id": response_json.get("id"),
         }
 
+    def get_current_shift(self):
+        """
+        Returns the open shift of the signed-in cashier, `shift` is None if the
+        cashier has none. The Kassa can't be asked, `ok` is False in that mode.
+        """
+        if self.mode == "checkbox_kassa":
+            return {"text": "", "ok": False, "shift": None}
+
+        headers = {
+            "Authorization": "Bearer %s" % self.access_token,
+        }
+
+        result = self.send_request(
+            "/api/v1/cashier/shift",
+            "GET",
+            payload={},
+            headers=headers,
+        )
+        return {
+            "text": result.text,
+            "ok": result.ok,
+            "shift": result.json() if result.ok else None,
+        }
+
     def service_receipt(self, amount):
         if self.mode == "checkbox_kassa":
             endpoint = "/api/v1/receipt/service"
@@ -226,6 +400,8 @@ class CheckboxAPI:
             headers = {
                 "Authorization": "Bearer " + self.access_token,
             }
+            if payload.get("id"):
+                return self._send_receipt_idempotent(endpoint, payload, headers)
 
         result = self.send_request(
             endpoint,
@@ -0,0 +1,210 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from odoo.exceptions import ValidationError
+
+_logger = logging.getLogger(__name__)
+
+BREAKER_PARAM_PREFIX = "checkbox_integration_extension.breaker_"
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CheckboxUnavailable(ValidationError):
+    """
+    Raised without calling Checkbox while its circuit is open or all the
+    request slots are taken. Handled like any other request error.
+    """
+
+
+class BreakerPolicy:
+    """
+    Thresholds of the circuit breaker and the concurrency limiter.
+    """
+
+    def __init__(
+        self,
+        window=20,
+        min_calls=5,
+        error_rate=0.5,
+        slow_call=10.0,
+        slow_rate=0.8,
+        open_seconds=30.0,
+        max_concurrent=4,
+        acquire_timeout=1.0,
+    ):
+        """
+        Args:
+            window (int): Number of the latest calls the rates are computed on.
+            min_calls (int): Calls required in the window before the circuit can open.
+            error_rate (float): Share of failed calls that opens the circuit.
+            slow_call (float): Seconds after which a successful call counts as slow.
+            slow_rate (float): Share of slow calls that opens the circuit.
+            open_seconds (float): Time the circuit stays open before a probe.
+            max_concurrent (int): Requests in flight per endpoint and process.
+            acquire_timeout (float): Seconds to wait for a free request slot.
+        """
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.max_concurrent = max_concurrent
+        self.acquire_timeout = acquire_timeout
+
+    @classmethod
+    def from_env(cls, env):
+        """
+        Builds the policy from the `checkbox_integration_extension.breaker_*`
+        system parameters named after the arguments, e.g. `breaker_error_rate`.
+        """
+        policy = cls()
+        get_param = env["ir.config_parameter"].sudo().get_param
+        for name, value in vars(cls()).items():
+            try:
+                setattr(
+                    policy,
+                    name,
+                    type(value)(get_param(BREAKER_PARAM_PREFIX + name, value)),
+                )
+            except ValueError:
+                pass
+        return policy
+
+    def __eq__(self, other):
+        return isinstance(other, BreakerPolicy) and vars(self) == vars(other)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker and request limiter of one Checkbox endpoint in this process.
+
+    Closed: requests pass, their outcome is recorded. Once enough of the latest
+    calls failed or were slow, the circuit opens and requests fail at once for
+    `open_seconds`. Then a single probe request is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name, policy):
+        self.name = name
+        self.policy = policy
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.calls = deque(maxlen=policy.window)
+        self.semaphore = threading.BoundedSemaphore(policy.max_concurrent)
+        self.lock = threading.Lock()
+
+    def set_policy(self, policy):
+        with self.lock:
+            if policy == self.policy:
+                return
+            if policy.window != self.policy.window:
+                self.calls = deque(self.calls, maxlen=policy.window)
+            if policy.max_concurrent != self.policy.max_concurrent:
+                # Requests in flight release the semaphore they took
+                self.semaphore = threading.BoundedSemaphore(policy.max_concurrent)
+            self.policy = policy
+
+    def acquire(self):
+        """
+        Takes a request slot, returns the token to pass to `release`.
+
+        Raises:
+            CheckboxUnavailable: If the circuit is open or no slot is free.
+        """
+        with self.lock:
+            is_probe = False
+            if self.state == STATE_OPEN:
+                remaining = self.opened_at + self.policy.open_seconds - time.monotonic()
+                if remaining > 0:
+                    raise CheckboxUnavailable(
+                        f"Checkbox {self.name} is unavailable, "
+                        f"retry in {math.ceil(remaining)} seconds"
+                    )
+                self.state = STATE_HALF_OPEN
+                _logger.info(f"===CHECKBOX===: Circuit {self.name} half-open, probing")
+            if self.state == STATE_HALF_OPEN:
+                if self.probe_in_flight:
+                    raise CheckboxUnavailable(
+                        f"Checkbox {self.name} is unavailable, checking the connection"
+                    )
+                self.probe_in_flight = is_probe = True
+            semaphore = self.semaphore
+
+        if not semaphore.acquire(timeout=self.policy.acquire_timeout):
+            if is_probe:
+                with self.lock:
+                    self.probe_in_flight = False
+            raise CheckboxUnavailable(
+                f"Too many requests to Checkbox {self.name} in progress"
+            )
+        return semaphore, is_probe, time.monotonic()
+
+    def release(self, token, success):
+        """
+        Frees the request slot and records the outcome of the request.
+        """
+        semaphore, is_probe, started = token
+        semaphore.release()
+        duration = time.monotonic() - started
+        slow = success and duration >= self.policy.slow_call
+
+        with self.lock:
+            if is_probe:
+                self.probe_in_flight = False
+                if success and not slow:
+                    self._close()
+                else:
+                    self._open(f"probe {'slow' if success else 'failed'}")
+                return
+            self.calls.append((success, slow))
+            if self.state != STATE_CLOSED or len(self.calls) < self.policy.min_calls:
+                return
+            failed = sum(1 for ok, _slow in self.calls if not ok)
+            slowed = sum(1 for _ok, is_slow in self.calls if is_slow)
+            if failed >= self.policy.error_rate * len(self.calls):
+                self._open(f"{failed} of {len(self.calls)} calls failed")
+            elif slowed >= self.policy.slow_rate * len(self.calls):
+                self._open(f"{slowed} of {len(self.calls)} calls slow")
+
+    def _open(self, reason):
+        _logger.warning(f"===CHECKBOX===: Circuit {self.name} open: {reason}")
+        self.state = STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.calls.clear()
+
+    def _close(self):
+        _logger.info(f"===CHECKBOX===: Circuit {self.name} closed")
+        self.state = STATE_CLOSED
+        self.calls.clear()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(api_url, mode, policy):
+    """
+    Returns the breaker of the endpoint and mode, creating it on first use.
+    """
+    key = (api_url, mode or "")
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(
+                f"{api_url} ({mode or 'cloud'})", policy
+            )
+    breaker.set_policy(policy)
+    return breaker
+
+
+def get_breaker_states():
+    with _breakers_lock:
+        return {breaker.name: breaker.state for breaker in _breakers.values()}
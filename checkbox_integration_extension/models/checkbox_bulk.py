@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo.exceptions import UserError, ValidationError
+
+from .checkbox_http import make_session
+
+_logger = logging.getLogger(__name__)
+
+OPERATION_OPEN = "open"
+OPERATION_CLOSE = "close"
+OPERATION_REPORT = "report"
+OPERATION_SIGNOUT = "signout"
+
+
+class SessionPlan:
+    """
+    Everything a bulk operation needs to talk to Checkbox for one session.
+
+    Built from the session in the request thread, the steps only use the API
+    objects and plain values, the database is not touched outside that thread.
+    """
+
+    def __init__(
+        self,
+        session_id,
+        name,
+        checkbox_api,
+        cloud_api,
+        login,
+        password,
+        paper_width,
+    ):
+        self.session_id = session_id
+        self.name = name
+        self.checkbox_api = checkbox_api
+        self.cloud_api = cloud_api
+        self.login = login
+        self.password = password
+        self.paper_width = paper_width
+
+
+def _check(result, step):
+    if not result["ok"]:
+        raise UserError(f"{step}: {result['text']}")
+    return result
+
+
+def step_signin(plan, result):
+    # A cached token is reused, Kassa mode needs no token
+    if plan.checkbox_api.access_token or plan.checkbox_api.mode == "checkbox_kassa":
+        return
+    r = _check(plan.checkbox_api.cashier_signin(plan.login, plan.password), "signin")
+    plan.checkbox_api.access_token = result["access_token"] = r["access_token"]
+
+
+def step_shift_open(plan, result):
+    _check(plan.checkbox_api.shift_create(), "shift open")
+    result["shift_opened"] = True
+
+
+def step_shift_close(plan, result):
+    r = plan.checkbox_api.shift_close()
+    if not r["ok"]:
+        # Signed in without an open shift: nothing to close, sign out anyway
+        current = plan.checkbox_api.get_current_shift()
+        if not current["ok"] or current["shift"]:
+            _check(r, "shift close")
+        result["no_shift"] = True
+        return
+    result["z_report_id"] = r["z_report_id"]
+
+
+def step_zreport(plan, result):
+    if not result.get("z_report_id"):
+        return
+    r = _check(
+        plan.cloud_api.reports_zreport(result["z_report_id"], plan.paper_width),
+        "Z-report",
+    )
+    result["report"] = r["text"]
+
+
+def step_xreport(plan, result):
+    r = _check(plan.checkbox_api.reports_xreport(plan.paper_width), "X-report")
+    result["report"] = r["text"]
+
+
+def step_signout(plan, result):
+    if not plan.checkbox_api.access_token and plan.checkbox_api.mode != "checkbox_kassa":
+        return
+    _check(plan.checkbox_api.cashier_signout(), "signout")
+    result["signed_out"] = True
+
+
+OPERATION_STEPS = {
+    OPERATION_OPEN: (step_signin, step_shift_open),
+    OPERATION_CLOSE: (step_signin, step_shift_close, step_zreport, step_signout),
+    OPERATION_REPORT: (step_signin, step_xreport),
+    OPERATION_SIGNOUT: (step_signout,),
+}
+
+
+class BulkCheckboxClient:
+    """
+    Runs Checkbox operations for many sessions at once on a thread pool.
+
+    The steps of a session run one after another in one worker thread, the
+    sessions run side by side, at most `parallelism` at a time. Every worker
+    thread sends its requests on HTTP sessions of its own, one per endpoint,
+    the pooled sessions are not shared with the bulk threads. The idempotent
+    receipts and the circuit breaker of `CheckboxAPI` apply unchanged.
+    """
+
+    def __init__(self, parallelism):
+        self.parallelism = max(parallelism, 1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+
+    def _get_thread_session(self, api):
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+        session = sessions.get(api.api_url)
+        if session is None:
+            # One request at a time per thread, one connection is enough
+            session = sessions[api.api_url] = make_session(1)
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _run_session(self, plan, steps):
+        result = {"session_id": plan.session_id, "name": plan.name, "ok": True}
+        started = time.monotonic()
+        for api in (plan.checkbox_api, plan.cloud_api):
+            api.session = self._get_thread_session(api)
+        for step in steps:
+            try:
+                step(plan, result)
+            except (UserError, ValidationError) as e:
+                result.update(ok=False, error=str(e.args[0] if e.args else e))
+                break
+            except Exception as e:
+                _logger.exception(
+                    "===CHECKBOX===: Bulk %s failed for %s", step.__name__, plan.name
+                )
+                result.update(ok=False, error=str(e) or e.__class__.__name__)
+                break
+        result["duration"] = round(time.monotonic() - started, 3)
+        return result
+
+    def run(self, plans, operation):
+        """
+        Runs the operation for all the plans.
+
+        Returns one result dict per plan, in the same order: `session_id`,
+        `name`, `ok`, `error`, `duration` and the step outputs
+        (`access_token`, `z_report_id`, `no_shift`, `report`, `signed_out`).
+        """
+        steps = OPERATION_STEPS[operation]
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.parallelism, thread_name_prefix="checkbox-bulk"
+            ) as executor:
+                return list(
+                    executor.map(lambda plan: self._run_session(plan, steps), plans)
+                )
+        finally:
+            with self._lock:
+                sessions, self._sessions = self._sessions, []
+            for session in sessions:
+                session.close()
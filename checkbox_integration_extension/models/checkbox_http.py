@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def make_session(pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """
+    Returns a new keep-alive session with up to `pool_maxsize` open connections
+    to an endpoint, without retries of its own.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        max_retries=0,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class SessionRegistry:
+    """
+    Per-process registry of keep-alive HTTP sessions, one per Checkbox endpoint.
+
+    Every session keeps up to `pool_maxsize` open connections to its endpoint,
+    so consecutive requests reuse the TCP/TLS connection instead of doing a new
+    handshake. Sessions are keyed by endpoint and pool size: a session is shared
+    by threads and may be in use, so a new pool size gets a session of its own
+    rather than closing the old one. The registry is reset after a fork, the
+    connections of the parent process must not be shared with the workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._pid = os.getpid()
+
+    def get_session(self, base_url, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        """
+        Returns the session of the endpoint and pool size, creating it on first use.
+        """
+        key = (base_url, pool_maxsize)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(key)
+            if session is None:
+                _logger.debug(
+                    f"===CHECKBOX===: New HTTP session for {base_url}, "
+                    f"pool size {pool_maxsize}"
+                )
+                session = self._sessions[key] = make_session(pool_maxsize)
+            return session
+
+    def get_stats(self):
+        """
+        Returns the connection reuse statistics of every endpoint, summed over
+        its sessions.
+
+        `connections` is the number of connections opened, `requests` the number
+        of requests sent and `reused` the requests sent on an already open
+        connection.
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+        stats = {}
+        for (base_url, _pool_maxsize), session in sessions:
+            endpoint = stats.setdefault(base_url, {"connections": 0, "requests": 0})
+            for adapter in set(session.adapters.values()):
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    endpoint["connections"] += pool.num_connections
+                    endpoint["requests"] += pool.num_requests
+        for endpoint in stats.values():
+            endpoint["reused"] = max(endpoint["requests"] - endpoint["connections"], 0)
+        return stats
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+registry = SessionRegistry()
+
+
+def get_session(base_url, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    return registry.get_session(base_url, pool_maxsize)
+
+
+def get_pool_stats():
+    return registry.get_stats()
@@ -0,0 +1,307 @@
+import json
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+import psycopg2
+from odoo import api, exceptions, fields, models
+
+_logger = logging.getLogger(__name__)
+
+STATE_PENDING = "pending"
+STATE_SENT = "sent"
+STATE_FAILED = "failed"
+
+# Statuses after which the same receipt is sent again
+RETRY_STATUSES = (401, 408, 425, 429)
+# Checkbox already has a receipt with this ID
+DUPLICATE_STATUS = 409
+
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+CRON_MAX_RUNTIME = 240
+# Key of the advisory lock serializing the delivery of one session
+QUEUE_LOCK_KEY = 7300021
+# Wait for a row lock when delivering from a request, see `_flush_session`
+FLUSH_LOCK_TIMEOUT = "5s"
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+class CheckboxReceiptQueue(models.Model):
+    _name = "checkbox.receipt.queue"
+    _description = "Checkbox Outbound Receipt"
+    _order = "id"
+
+    session_id = fields.Many2one(
+        comodel_name="pos.session",
+        required=True,
+        index=True,
+        ondelete="restrict",
+    )
+    receipt_uid = fields.Char(
+        string="Receipt UID",
+        required=True,
+        readonly=True,
+        help="Receipt ID sent to Checkbox, a receipt is queued and fiscalized once.",
+    )
+    payload = fields.Text(required=True, readonly=True)
+    state = fields.Selection(
+        selection=[
+            (STATE_PENDING, "Pending"),
+            (STATE_SENT, "Sent"),
+            (STATE_FAILED, "Failed"),
+        ],
+        default=STATE_PENDING,
+        required=True,
+        readonly=True,
+    )
+    attempts = fields.Integer(readonly=True)
+    next_attempt = fields.Datetime(default=fields.Datetime.now, readonly=True)
+    last_error = fields.Text(readonly=True)
+    response = fields.Text(readonly=True)
+
+    _sql_constraints = [
+        (
+            "receipt_uid_uniq",
+            "unique(receipt_uid)",
+            "The receipt is already queued.",
+        ),
+    ]
+
+    def init(self):
+        self._cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS checkbox_receipt_queue_pending_idx
+            ON checkbox_receipt_queue (session_id, id)
+            WHERE state = 'pending'
+            """
+        )
+
+    @api.model
+    def _enqueue(self, session, payload):
+        """
+        Stores a receipt for background delivery and returns its UID.
+
+        The UID is the `id` of the payload, generated if missing. Queueing the
+        same receipt again does nothing.
+        """
+        payload = dict(payload, id=payload.get("id") or str(uuid.uuid4()))
+        self.env.cr.execute(
+            """
+            INSERT INTO checkbox_receipt_queue (
+                session_id, receipt_uid, payload, state, attempts, next_attempt,
+                create_uid, create_date, write_uid, write_date
+            )
+            VALUES (%s, %s, %s, %s, 0, now() at time zone 'UTC',
+                %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (receipt_uid) DO NOTHING
+            """,
+            (
+                session.id,
+                payload["id"],
+                json.dumps(payload),
+                STATE_PENDING,
+                self.env.uid,
+                self.env.uid,
+            ),
+        )
+        self._trigger_delivery()
+        return payload["id"]
+
+    @api.model
+    def _trigger_delivery(self):
+        cron = self.env.ref(
+            "checkbox_integration_extension.ir_cron_checkbox_receipt_queue",
+            raise_if_not_found=False,
+        )
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _has_pending(self, session):
+        self.flush(["session_id", "state"])
+        self.env.cr.execute(
+            """
+            SELECT 1
+            FROM checkbox_receipt_queue
+            WHERE session_id = %s AND state = %s
+            LIMIT 1
+            """,
+            (session.id, STATE_PENDING),
+        )
+        return bool(self.env.cr.fetchone())
+
+    def _get_retry_delay(self):
+        return min(RETRY_BASE_DELAY * 2 ** self.attempts, RETRY_MAX_DELAY)
+
+    def _deliver(self, checkbox_api):
+        """
+        Sends one queued receipt.
+
+        Returns True if the receipt is done (sent, or rejected for good), False
+        if it has to be sent again, which stops the delivery of its session.
+        """
+        self.ensure_one()
+        try:
+            result = checkbox_api.register_sell_return(json.loads(self.payload))
+        except exceptions.ValidationError as e:
+            # Network error, Checkbox or the Kassa is unreachable
+            self._schedule_retry(str(e))
+            self.session_id.config_id._checkbox_set_offline(True)
+            return False
+
+        self.session_id.config_id._checkbox_set_offline(False)
+        if result.ok or result.status_code == DUPLICATE_STATUS:
+            self.write({"state": STATE_SENT, "response": result.text})
+            return True
+        if result.status_code in RETRY_STATUSES or result.status_code >= 500:
+            if result.status_code == 401:
+                try:
+                    self.session_id._checkbox_cashier_signin()
+                except exceptions.UserError as e:
+                    _logger.warning(f"===CHECKBOX===: Signin error: {e}")
+            self._schedule_retry(f"{result.status_code}: {result.text}")
+            return False
+
+        _logger.error(
+            f"===CHECKBOX===: Receipt {self.receipt_uid} rejected: {result.text}"
+        )
+        self.write(
+            {
+                "state": STATE_FAILED,
+                "attempts": self.attempts + 1,
+                "last_error": result.text,
+                "response": result.text,
+            }
+        )
+        return True
+
+    def _schedule_retry(self, error):
+        _logger.warning(
+            f"===CHECKBOX===: Receipt {self.receipt_uid} not delivered: {error}"
+        )
+        self.write(
+            {
+                "attempts": self.attempts + 1,
+                "next_attempt": fields.Datetime.now()
+                + timedelta(seconds=self._get_retry_delay()),
+                "last_error": error,
+            }
+        )
+
+    @api.model
+    def _deliver_session(self, session, started=None, max_runtime=None, force=False):
+        """
+        Sends the pending receipts of the session in the order they were queued,
+        committing the cursor of the environment after each one: the cron cursor,
+        or the one of `_flush_session`, never a request cursor. Stops at the first
+        receipt that has to be retried, so a receipt is never fiscalized before an
+        older one.
+
+        With `force` the retry delay of the first receipt is ignored. Returns the
+        number of receipts left pending.
+        """
+        self._set_flush_lock_timeout()
+        self.env.cr.execute(
+            "SELECT pg_try_advisory_lock(%s, %s)", (QUEUE_LOCK_KEY, session.id)
+        )
+        # Otherwise another worker is delivering this session
+        if self.env.cr.fetchone()[0]:
+            try:
+                self._deliver_session_locked(session, started, max_runtime, force)
+            finally:
+                self.env.cr.execute(
+                    "SELECT pg_advisory_unlock(%s, %s)", (QUEUE_LOCK_KEY, session.id)
+                )
+        return self.search_count(
+            [("session_id", "=", session.id), ("state", "=", STATE_PENDING)]
+        )
+
+    def _deliver_session_locked(self, session, started, max_runtime, force):
+        checkbox_api = session._checkbox_get_api()
+        first = True
+        while max_runtime is None or time.monotonic() - started < max_runtime:
+            receipt = self.search(
+                [("session_id", "=", session.id), ("state", "=", STATE_PENDING)],
+                limit=1,
+            )
+            if not receipt:
+                break
+            if not (force and first) and receipt.next_attempt > fields.Datetime.now():
+                break
+            first = False
+            try:
+                delivered = receipt._deliver(checkbox_api)
+                self.env.cr.commit()
+            except psycopg2.OperationalError as e:
+                if e.pgcode != LOCK_NOT_AVAILABLE:
+                    raise
+                # The row is locked by the request flushing the queue. The receipt
+                # stays pending, Checkbox ignores its ID when it is sent again.
+                self.env.cr.rollback()
+                self.env.clear()
+                _logger.warning(
+                    f"===CHECKBOX===: Receipt {receipt.receipt_uid} state not saved: {e}"
+                )
+                break
+            self._set_flush_lock_timeout()
+            if not delivered:
+                break
+
+    def _set_flush_lock_timeout(self):
+        # Set for each transaction of the flush cursor, ends with it
+        if self.env.context.get("checkbox_queue_flush"):
+            self.env.cr.execute("SET LOCAL lock_timeout = %s", (FLUSH_LOCK_TIMEOUT,))
+
+    @api.model
+    def _flush_session(self, session):
+        """
+        Delivers the pending receipts of the session from a request, e.g. before
+        its shift is closed. Returns the number of receipts left pending.
+
+        The delivery runs on a cursor of its own, so each receipt is committed
+        without committing the request transaction. A row locked by the request
+        (its session or POS config) is not waited for: the delivery stops after
+        `FLUSH_LOCK_TIMEOUT` and the receipt stays pending.
+        """
+        with self.pool.cursor() as cr:
+            env = self.env(
+                cr=cr, context=dict(self.env.context, checkbox_queue_flush=True)
+            )
+            return self.with_env(env)._deliver_session(
+                session.with_env(env), force=True
+            )
+
+    @api.model
+    def _cron_deliver_receipts(self):
+        """
+        Delivers the pending receipts of all sessions.
+
+        Once Checkbox is reachable again the whole backlog of a session is sent
+        in one run, the retry delays only apply while the first receipt fails.
+        """
+        started = time.monotonic()
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT session_id
+            FROM checkbox_receipt_queue
+            WHERE state = %s AND next_attempt <= now() at time zone 'UTC'
+            """,
+            (STATE_PENDING,),
+        )
+        session_ids = [row[0] for row in self.env.cr.fetchall()]
+        processed = 0
+        for session_id in session_ids:
+            if time.monotonic() - started >= CRON_MAX_RUNTIME:
+                break
+            self._deliver_session(
+                self.env["pos.session"].browse(session_id), started, CRON_MAX_RUNTIME
+            )
+            processed += 1
+        if processed:
+            _logger.info(
+                "===CHECKBOX===: Receipt queue processed for %d sessions in %.1fs",
+                processed,
+                time.monotonic() - started,
+            )
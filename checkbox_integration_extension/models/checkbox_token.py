@@ -0,0 +1,179 @@
+import base64
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+TOKEN_TTL_PARAM = "checkbox_integration_extension.token_ttl"
+TOKEN_REFRESH_MARGIN_PARAM = "checkbox_integration_extension.token_refresh_margin"
+DEFAULT_TOKEN_TTL = 3600
+DEFAULT_TOKEN_REFRESH_MARGIN = 300
+
+# Tokens already read by this process: (db, cache key) -> (token, expires at)
+_process_cache = {}
+_process_cache_lock = threading.Lock()
+
+
+def get_token_expiry(access_token, default_ttl):
+    """
+    Returns the expiry of the token, read from the `exp` claim if the token is a
+    JWT, otherwise `default_ttl` seconds from now.
+    """
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload))["exp"]
+        return datetime.utcfromtimestamp(int(exp))
+    except (IndexError, KeyError, TypeError, ValueError):
+        return datetime.utcnow() + timedelta(seconds=default_ttl)
+
+
+class CheckboxToken(models.Model):
+    _name = "checkbox.token"
+    _description = "Checkbox Cashier Access Token"
+
+    cache_key = fields.Char(required=True, index=True)
+    login = fields.Char(required=True)
+    license_key = fields.Char()
+    access_token = fields.Char(required=True)
+    expires_at = fields.Datetime(required=True)
+
+    _sql_constraints = [
+        (
+            "cache_key_uniq",
+            "unique(cache_key)",
+            "Only one token is cached per cashier and license.",
+        ),
+    ]
+
+    @api.model
+    def _make_cache_key(self, login, license_key):
+        return f"{login}|{license_key or ''}"
+
+    @api.model
+    def _get_refresh_margin(self):
+        try:
+            return int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param(TOKEN_REFRESH_MARGIN_PARAM, DEFAULT_TOKEN_REFRESH_MARGIN)
+            )
+        except ValueError:
+            return DEFAULT_TOKEN_REFRESH_MARGIN
+
+    @api.model
+    def _get_token(self, login, license_key):
+        """
+        Returns the cached token of the cashier, or None if there is no token or
+        it expires within the refresh margin, so it is renewed ahead of time.
+        """
+        key = self._make_cache_key(login, license_key)
+        fresh_until = datetime.utcnow() + timedelta(seconds=self._get_refresh_margin())
+
+        with _process_cache_lock:
+            cached = _process_cache.get((self.env.cr.dbname, key))
+        if cached and cached[1] > fresh_until:
+            return cached[0]
+
+        # Tokens signed in by the other workers
+        self.env.cr.execute(
+            """
+            SELECT access_token, expires_at
+            FROM checkbox_token
+            WHERE cache_key = %s AND expires_at > %s
+            """,
+            (key, fresh_until),
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        with _process_cache_lock:
+            _process_cache[(self.env.cr.dbname, key)] = row
+        return row[0]
+
+    @api.model
+    def _set_token(self, login, license_key, access_token):
+        """
+        Stores a token after a sign-in, replacing the cached one.
+
+        The token is committed on its own cursor, it stays valid for the other
+        workers even if the current transaction is rolled back.
+        """
+        key = self._make_cache_key(login, license_key)
+        try:
+            default_ttl = int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param(TOKEN_TTL_PARAM, DEFAULT_TOKEN_TTL)
+            )
+        except ValueError:
+            default_ttl = DEFAULT_TOKEN_TTL
+        expires_at = get_token_expiry(access_token, default_ttl)
+
+        with self.pool.cursor() as cr:
+            cr.execute(
+                """
+                INSERT INTO checkbox_token (
+                    cache_key, login, license_key, access_token, expires_at,
+                    create_uid, create_date, write_uid, write_date
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, now() at time zone 'UTC',
+                    %s, now() at time zone 'UTC')
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    access_token = EXCLUDED.access_token,
+                    expires_at = EXCLUDED.expires_at,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                """,
+                (
+                    key,
+                    login,
+                    license_key or None,
+                    access_token,
+                    expires_at,
+                    self.env.uid,
+                    self.env.uid,
+                ),
+            )
+        with _process_cache_lock:
+            _process_cache[(self.env.cr.dbname, key)] = (access_token, expires_at)
+        _logger.debug(f"===CHECKBOX===: Token of {login} cached until {expires_at}")
+
+    @api.model
+    def _invalidate_token(self, login, license_key, access_token=None):
+        """
+        Drops the cached token of the cashier after a sign-out or a rejected call.
+        With `access_token` only that token is dropped, a newer one stays.
+
+        The delete is committed on its own cursor, the call that found the token
+        rejected usually ends in a rollback. A row locked by the current
+        transaction is skipped rather than waited for.
+        """
+        key = self._make_cache_key(login, license_key)
+        query = """
+            DELETE FROM checkbox_token
+            WHERE id IN (
+                SELECT id
+                FROM checkbox_token
+                WHERE cache_key = %s {token_filter}
+                FOR UPDATE SKIP LOCKED
+            )
+        """
+        params = [key]
+        if access_token:
+            params.append(access_token)
+        with self.pool.cursor() as cr:
+            cr.execute(
+                query.format(
+                    token_filter="AND access_token = %s" if access_token else ""
+                ),
+                params,
+            )
+        with _process_cache_lock:
+            cached = _process_cache.get((self.env.cr.dbname, key))
+            if cached and (not access_token or cached[0] == access_token):
+                del _process_cache[(self.env.cr.dbname, key)]
@@ -1,5 +1,9 @@
+import logging
+
 from odoo import api, fields, models
 
+_logger = logging.getLogger(__name__)
+
 
 class PosConfig(models.Model):
     _inherit = "pos.config"
@@ -18,6 +22,17 @@ class PosConfig(models.Model):
     )
 
     checkbox_port = fields.Integer(string="Checkbox port")
+    checkbox_receipt_queue = fields.Boolean(
+        string="Fiscalize in background",
+        help="Receipts are queued and sent to Checkbox in the background "
+        "instead of waiting for the answer.",
+    )
+    checkbox_offline = fields.Boolean(
+        string="Checkbox offline",
+        readonly=True,
+        help="Checkbox was unreachable at the last attempt, receipts are queued "
+        "until it answers again.",
+    )
 
     @api.depends("checkbox_mode")
     def _compute_checkbox_url(self):
@@ -31,3 +46,13 @@ class PosConfig(models.Model):
 
     def _inverse_checkbox_url(self):
         pass
+
+    def _checkbox_set_offline(self, offline):
+        configs = self.filtered(lambda config: config.checkbox_offline != offline)
+        if configs:
+            if offline:
+                _logger.warning(
+                    f"===CHECKBOX===: {', '.join(configs.mapped('name'))} offline, "
+                    f"receipts are queued"
+                )
+            configs.sudo().write({"checkbox_offline": offline})
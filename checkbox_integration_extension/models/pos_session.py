@@ -1,11 +1,35 @@
 import logging
+import time
+import uuid
+from datetime import datetime, time as dt_time, timedelta
 
+import pytz
 from odoo import _, api, exceptions, fields, models
 
 from . import checkbox_api as API
+from .checkbox_breaker import BreakerPolicy
+from .checkbox_bulk import (
+    OPERATION_CLOSE,
+    OPERATION_STEPS,
+    BulkCheckboxClient,
+    SessionPlan,
+)
 
 _logger = logging.getLogger(__name__)
 
+HTTP_POOL_SIZE_PARAM = "checkbox_integration_extension.http_pool_size"
+CONNECT_TIMEOUT_PARAM = "checkbox_integration_extension.connect_timeout"
+READ_TIMEOUT_PARAM = "checkbox_integration_extension.read_timeout"
+RECEIPT_READ_TIMEOUT_PARAM = "checkbox_integration_extension.receipt_read_timeout"
+RECEIPT_ATTEMPTS_PARAM = "checkbox_integration_extension.receipt_attempts"
+BULK_PARALLELISM_PARAM = "checkbox_integration_extension.bulk_parallelism"
+DEFAULT_BULK_PARALLELISM = 16
+AUTOCLOSE_CUTOFF_PARAM = "checkbox_integration_extension.autoclose_cutoff"
+AUTOCLOSE_TZ_PARAM = "checkbox_integration_extension.autoclose_tz"
+AUTOCLOSE_BATCH_SIZE_PARAM = "checkbox_integration_extension.autoclose_batch_size"
+DEFAULT_AUTOCLOSE_BATCH_SIZE = 20
+AUTOCLOSE_MAX_RUNTIME = 600
+
 
 class PosSession(models.Model):
     _inherit = "pos.session"
@@ -15,18 +39,107 @@ class PosSession(models.Model):
     checkbox_mode = fields.Selection(related="config_id.checkbox_mode")
     checkbox_license_key = fields.Char(related="config_id.checkbox_license_key")
     z_report_id = fields.Char(string="Z Report ID")
+    z_report_text = fields.Text(
+        string="Z Report",
+        readonly=True,
+        help="Z-report text fetched when the shift was closed in bulk.",
+    )
+    checkbox_autoclose_error = fields.Char(
+        string="Checkbox Auto-Close Error",
+        readonly=True,
+    )
 
-    def _checkbox_cashier_signin(self):
-        self.ensure_one()
+    @api.model
+    def _checkbox_get_number_param(self, key, default, number_type=int):
+        try:
+            return number_type(
+                self.env["ir.config_parameter"].sudo().get_param(key, default)
+            )
+        except ValueError:
+            return default
+
+    @api.model
+    def _checkbox_get_api_options(self):
+        return {
+            "pool_maxsize": self._checkbox_get_number_param(
+                HTTP_POOL_SIZE_PARAM, API.DEFAULT_POOL_MAXSIZE
+            ),
+            "connect_timeout": self._checkbox_get_number_param(
+                CONNECT_TIMEOUT_PARAM, API.DEFAULT_CONNECT_TIMEOUT, float
+            ),
+            "read_timeout": self._checkbox_get_number_param(
+                READ_TIMEOUT_PARAM, API.DEFAULT_READ_TIMEOUT, float
+            ),
+            "receipt_read_timeout": self._checkbox_get_number_param(
+                RECEIPT_READ_TIMEOUT_PARAM, API.DEFAULT_RECEIPT_READ_TIMEOUT, float
+            ),
+            "receipt_attempts": self._checkbox_get_number_param(
+                RECEIPT_ATTEMPTS_PARAM, API.DEFAULT_RECEIPT_ATTEMPTS
+            ),
+            "breaker_policy": BreakerPolicy.from_env(self.env),
+        }
+
+    def _checkbox_uses_token_cache(self):
+        return (
+            self.checkbox_mode != "checkbox_kassa"
+            and self.config_id.checkbox_cashier_login
+        )
 
-        checkbox_api = API.CheckboxAPI(
+    def _checkbox_get_cached_token(self):
+        if not self._checkbox_uses_token_cache():
+            return None
+        return self.env["checkbox.token"].sudo()._get_token(
+            self.config_id.checkbox_cashier_login, self.checkbox_license_key
+        )
+
+    def _checkbox_drop_cached_token(self, access_token=None):
+        if self._checkbox_uses_token_cache():
+            self.env["checkbox.token"].sudo()._invalidate_token(
+                self.config_id.checkbox_cashier_login,
+                self.checkbox_license_key,
+                access_token,
+            )
+
+    def _checkbox_get_api(self):
+        return API.CheckboxAPI(
             api_url=self.checkbox_url,
             api_port=self.checkbox_port,
             cb_license=self.checkbox_license_key,
             mode=self.checkbox_mode,
-            access_token=self.checkbox_access_token,
+            # The token of another session of the same cashier is as good as ours
+            access_token=self._checkbox_get_cached_token()
+            or self.checkbox_access_token,
+            on_unauthorized=self._checkbox_drop_cached_token,
+            **self._checkbox_get_api_options(),
         )
 
+    @api.model
+    def _checkbox_get_cloud_api(self):
+        return API.CheckboxAPI(  # nosec B106
+            api_url="https://api.checkbox.in.ua",
+            api_port=0,
+            cb_license="",
+            mode="",
+            access_token="",
+            **self._checkbox_get_api_options(),
+        )
+
+    def _checkbox_cashier_signin(self):
+        self.ensure_one()
+
+        cached_token = self._checkbox_get_cached_token()
+        if cached_token:
+            _logger.debug("_checkbox_cashier_signin: cached token reused")
+            self.update(
+                {
+                    "checkbox_access_token": cached_token,
+                    "checkbox_is_signin": True,
+                }
+            )
+            return
+
+        checkbox_api = self._checkbox_get_api()
+
         r = checkbox_api.cashier_signin(
             self.config_id.checkbox_cashier_login,
             self.config_id.checkbox_cashier_password,
@@ -35,6 +148,12 @@ class PosSession(models.Model):
         _logger.debug("_checkbox_cashier_signin: response: %s", r["text"])
         if r["ok"]:
             access_token = r["access_token"]
+            if self._checkbox_uses_token_cache():
+                self.env["checkbox.token"].sudo()._set_token(
+                    self.config_id.checkbox_cashier_login,
+                    self.checkbox_license_key,
+                    access_token,
+                )
             self.update(
                 {
                     "checkbox_access_token": access_token,
@@ -49,13 +168,7 @@ class PosSession(models.Model):
     def _checkbox_shift_create(self):
         self.ensure_one()
 
-        checkbox_api = API.CheckboxAPI(
-            api_url=self.checkbox_url,
-            api_port=self.checkbox_port,
-            cb_license=self.checkbox_license_key,
-            mode=self.checkbox_mode,
-            access_token=self.checkbox_access_token,
-        )
+        checkbox_api = self._checkbox_get_api()
 
         r = checkbox_api.shift_create()
         _logger.debug("_checkbox_shift_create: response: %s", r["text"])
@@ -65,17 +178,12 @@ class PosSession(models.Model):
     def _checkbox_cashier_signout(self):
         self.ensure_one()
         if self.checkbox_access_token:
-            checkbox_api = API.CheckboxAPI(
-                api_url=self.checkbox_url,
-                api_port=self.checkbox_port,
-                cb_license=self.checkbox_license_key,
-                mode=self.checkbox_mode,
-                access_token=self.checkbox_access_token,
-            )
+            checkbox_api = self._checkbox_get_api()
             r = checkbox_api.cashier_signout()
             _logger.debug("_checkbox_cashier_signout: response: %s", r["text"])
 
             if r["ok"]:
+                self._checkbox_drop_cached_token()
                 self.update(
                     {
                         "checkbox_access_token": False,
@@ -90,30 +198,21 @@ class PosSession(models.Model):
     def _checkbox_shift_close(self):
         self.ensure_one()
 
-        checkbox_api = API.CheckboxAPI(
-            api_url=self.checkbox_url,
-            api_port=self.checkbox_port,
-            cb_license=self.checkbox_license_key,
-            mode=self.checkbox_mode,
-            access_token=self.checkbox_access_token,
-        )
+        # All the receipts of the shift must be fiscalized before the Z-report
+        self._checkbox_flush_receipt_queue()
+
+        checkbox_api = self._checkbox_get_api()
 
         r = checkbox_api.shift_close()
         _logger.debug("_checkbox_shift_close: response: %s", r["text"])
         if not r["ok"]:
             raise exceptions.Warning(r["text"])
-        self.z_report_id = r["z_report_id"]
+        self.update({"z_report_id": r["z_report_id"], "z_report_text": False})
 
     def _checkbox_service(self, amount):
         self.ensure_one()
 
-        checkbox_api = API.CheckboxAPI(
-            api_url=self.checkbox_url,
-            api_port=self.checkbox_port,
-            cb_license=self.checkbox_license_key,
-            mode=self.checkbox_mode,
-            access_token=self.checkbox_access_token,
-        )
+        checkbox_api = self._checkbox_get_api()
         result = checkbox_api.service_receipt(amount)
 
         if not result["ok"]:
@@ -122,13 +221,7 @@ class PosSession(models.Model):
     def _checkbox_xreport(self):
         self.ensure_one()
 
-        checkbox_api = API.CheckboxAPI(
-            api_url=self.checkbox_url,
-            api_port=self.checkbox_port,
-            cb_license=self.checkbox_license_key,
-            mode=self.checkbox_mode,
-            access_token=self.checkbox_access_token,
-        )
+        checkbox_api = self._checkbox_get_api()
         result = checkbox_api.reports_xreport(
             paper_width=self.config_id.paper_width,
         )
@@ -143,14 +236,11 @@ class PosSession(models.Model):
 
         if not self.z_report_id:
             raise exceptions.Warning(_("Z-Report ID is not set"))
+        if self.z_report_text:
+            # Prefetched when the shift was closed
+            return {"text": self.z_report_text, "ok": True}
 
-        checkbox_api = API.CheckboxAPI(  # nosec B106
-            api_url="https://api.checkbox.in.ua",
-            api_port=0,
-            cb_license="",
-            mode="",
-            access_token="",
-        )
+        checkbox_api = self._checkbox_get_cloud_api()
         result = checkbox_api.reports_zreport(
             report_id=self.z_report_id,
             paper_width=self.config_id.paper_width,
@@ -164,26 +254,46 @@ class PosSession(models.Model):
     def _checkbox_register_sell_return(self, payload):
         self.ensure_one()
 
-        checkbox_api = API.CheckboxAPI(
-            api_url=self.checkbox_url,
-            api_port=self.checkbox_port,
-            cb_license=self.checkbox_license_key,
-            mode=self.checkbox_mode,
-            access_token=self.checkbox_access_token,
-        )
-        result = checkbox_api.register_sell_return(payload)
+        queue = self.env["checkbox.receipt.queue"].sudo()
+        # The receipt ID makes a resend of the same receipt a no-op for Checkbox
+        payload = dict(payload, id=payload.get("id") or str(uuid.uuid4()))
+
+        # Queued receipts go first, a receipt never overtakes an older one
+        if (
+            self.config_id.checkbox_receipt_queue
+            or self.config_id.checkbox_offline
+            or queue._has_pending(self)
+        ):
+            return API.make_queued_response(queue._enqueue(self, payload))
+
+        checkbox_api = self._checkbox_get_api()
+        try:
+            result = checkbox_api.register_sell_return(payload)
+        except exceptions.ValidationError:
+            # Checkbox is unreachable, complete the sale and deliver later
+            self.config_id._checkbox_set_offline(True)
+            return API.make_queued_response(queue._enqueue(self, payload))
 
         return result
 
+    def _checkbox_flush_receipt_queue(self):
+        self.ensure_one()
+        pending = (
+            self.env["checkbox.receipt.queue"]
+            .sudo()
+            ._flush_session(self)
+        )
+        if pending:
+            raise exceptions.Warning(
+                _(
+                    "{count} receipts are not fiscalized yet, "
+                    "the shift can be closed once Checkbox is reachable."
+                ).format(count=pending)
+            )
+
     @api.model
     def _checkbox_get_receipt_info(self, receipt_id, rep_type):
-        checkbox_api = API.CheckboxAPI(  # nosec B106
-            api_url="https://api.checkbox.in.ua",
-            api_port=0,
-            cb_license="",
-            mode="",
-            access_token="",
-        )
+        checkbox_api = self._checkbox_get_cloud_api()
         result = checkbox_api.get_receipt_info(
             receipt_id,
             rep_type,
@@ -191,3 +301,213 @@ class PosSession(models.Model):
         )
 
         return result
+
+    def _checkbox_bulk_plan(self):
+        self.ensure_one()
+        checkbox_api = self._checkbox_get_api()
+        # The steps run in threads without a cursor, a rejected token is
+        # dropped by the next regular call instead
+        checkbox_api.on_unauthorized = None
+        return SessionPlan(
+            session_id=self.id,
+            name=self.name,
+            checkbox_api=checkbox_api,
+            cloud_api=self._checkbox_get_cloud_api(),
+            login=self.config_id.checkbox_cashier_login,
+            password=self.config_id.checkbox_cashier_password,
+            paper_width=self.config_id.paper_width,
+        )
+
+    def _checkbox_bulk_apply(self, result):
+        self.ensure_one()
+        access_token = result.pop("access_token", None)
+        if access_token and not result.get("signed_out"):
+            if self._checkbox_uses_token_cache():
+                self.env["checkbox.token"].sudo()._set_token(
+                    self.config_id.checkbox_cashier_login,
+                    self.checkbox_license_key,
+                    access_token,
+                )
+            self.update(
+                {
+                    "checkbox_access_token": access_token,
+                    "checkbox_is_signin": True,
+                }
+            )
+        if result.get("z_report_id"):
+            self.update(
+                {
+                    "z_report_id": result["z_report_id"],
+                    "z_report_text": result.get("report") or False,
+                }
+            )
+        if result.get("signed_out"):
+            self._checkbox_drop_cached_token()
+            self.update(
+                {
+                    "checkbox_access_token": False,
+                    "checkbox_is_signin": False,
+                }
+            )
+
+    def checkbox_bulk_shift_operation(self, operation):
+        """
+        Runs a Checkbox shift operation for all the sessions at once.
+
+        `operation` is "open" (sign-in and shift open), "close" (receipt queue
+        flush, shift close, Z-report and sign-out), "report" (X-report) or
+        "signout". The network part of the sessions runs in parallel, the
+        results are stored on the sessions afterwards.
+
+        Returns a list with a result dict per session: `session_id`, `name`,
+        `ok`, `error`, `duration`, and `z_report_id`, `no_shift`, `report` and
+        `signed_out` where applicable.
+        """
+        if not (
+            self.env.is_superuser()
+            or self.env.user.has_group("point_of_sale.group_pos_manager")
+        ):
+            raise exceptions.AccessError(
+                _("Only POS managers can run bulk Checkbox operations.")
+            )
+        if operation not in OPERATION_STEPS:
+            raise exceptions.UserError(
+                _("Unknown Checkbox operation: {operation}").format(
+                    operation=operation
+                )
+            )
+
+        results = {}
+        plans = []
+        for session in self:
+            if operation == OPERATION_CLOSE:
+                try:
+                    session._checkbox_flush_receipt_queue()
+                except exceptions.UserError as e:
+                    results[session.id] = {
+                        "session_id": session.id,
+                        "name": session.name,
+                        "ok": False,
+                        "error": str(e.args[0] if e.args else e),
+                    }
+                    continue
+            plans.append(session._checkbox_bulk_plan())
+
+        # The limiter of each endpoint caps its in-flight requests, more
+        # parallel sessions than that would only fail on a busy limiter
+        endpoints = {plan.checkbox_api.api_url for plan in plans}
+        max_concurrent = BreakerPolicy.from_env(self.env).max_concurrent
+        parallelism = min(
+            self._checkbox_get_number_param(
+                BULK_PARALLELISM_PARAM, DEFAULT_BULK_PARALLELISM
+            ),
+            max_concurrent * max(len(endpoints), 1),
+        )
+        started = time.monotonic()
+        for result in BulkCheckboxClient(parallelism).run(plans, operation):
+            self.browse(result["session_id"])._checkbox_bulk_apply(result)
+            results[result["session_id"]] = result
+
+        _logger.info(
+            "===CHECKBOX===: Bulk %s of %d sessions in %.1fs, %d failed",
+            operation,
+            len(self),
+            time.monotonic() - started,
+            len([result for result in results.values() if not result["ok"]]),
+        )
+        return [results[session.id] for session in self]
+
+    @api.model
+    def _checkbox_get_autoclose_cutoff(self):
+        """
+        Returns the latest passed cutoff as a naive UTC datetime, None if the
+        auto-close is disabled. The cutoff is a local time of day, e.g. "23:30".
+        """
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        cutoff_time = get_param(AUTOCLOSE_CUTOFF_PARAM)
+        if not cutoff_time:
+            return None
+        try:
+            hour, minute = (int(part) for part in cutoff_time.split(":"))
+            tz = pytz.timezone(
+                get_param(AUTOCLOSE_TZ_PARAM) or self.env.user.tz or "UTC"
+            )
+        except (ValueError, pytz.UnknownTimeZoneError):
+            _logger.error(
+                "===CHECKBOX===: Invalid auto-close cutoff %s, "
+                "expected HH:MM and a valid time zone",
+                cutoff_time,
+            )
+            return None
+        now = datetime.now(tz)
+        cutoff = tz.localize(datetime.combine(now.date(), dt_time(hour, minute)))
+        if cutoff > now:
+            cutoff = tz.localize(
+                datetime.combine(now.date() - timedelta(days=1), dt_time(hour, minute))
+            )
+        return cutoff.astimezone(pytz.utc).replace(tzinfo=None)
+
+    @api.model
+    def _cron_checkbox_autoclose_shifts(self):
+        """
+        Closes the fiscal shifts left open past the cutoff.
+
+        Sessions still signed in to Checkbox, without a Z-report and opened
+        before the latest cutoff are closed in batches with
+        `checkbox_bulk_shift_operation`: shift close, Z-report and sign-out. A
+        session signed in without an open shift is only signed out. Each batch
+        is committed on its own, failures are kept in `checkbox_autoclose_error`
+        and logged. Sessions that failed before go last, so they can't keep the
+        others from being closed within the run time.
+        """
+        cutoff = self._checkbox_get_autoclose_cutoff()
+        if not cutoff:
+            return
+        batch_size = max(
+            self._checkbox_get_number_param(
+                AUTOCLOSE_BATCH_SIZE_PARAM, DEFAULT_AUTOCLOSE_BATCH_SIZE
+            ),
+            1,
+        )
+        sessions = self.search(
+            [
+                ("state", "in", ["opened", "closing_control"]),
+                ("checkbox_is_signin", "=", True),
+                ("z_report_id", "=", False),
+                ("start_at", "<", cutoff),
+            ],
+            order="id",
+        )
+        # Ids only, every batch is read again after the previous commit
+        session_ids = sessions.sorted(
+            lambda session: bool(session.checkbox_autoclose_error)
+        ).ids
+        started = time.monotonic()
+        closed = failed = 0
+        for offset in range(0, len(session_ids), batch_size):
+            if time.monotonic() - started >= AUTOCLOSE_MAX_RUNTIME:
+                break
+            batch = self.browse(session_ids[offset : offset + batch_size])
+            for result in batch.checkbox_bulk_shift_operation(OPERATION_CLOSE):
+                session = self.browse(result["session_id"])
+                if result["ok"]:
+                    closed += 1
+                    session.checkbox_autoclose_error = False
+                else:
+                    failed += 1
+                    session.checkbox_autoclose_error = result["error"]
+                    _logger.warning(
+                        "===CHECKBOX===: Auto-close of %s failed: %s",
+                        result["name"],
+                        result["error"],
+                    )
+            self.env.cr.commit()
+
+        if session_ids:
+            _logger.info(
+                "===CHECKBOX===: Auto-closed %d of %d shifts in %.1fs, %d failed",
+                closed,
+                len(session_ids),
+                time.monotonic() - started,
+                failed,
+            )
@@ -0,0 +1,3 @@
+from . import test_receipt_queue
+from . import test_breaker
+from . import test_bulk
@@ -0,0 +1,95 @@
+from odoo.tests.common import BaseCase
+
+from odoo.addons.checkbox_integration_extension.models.checkbox_breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    BreakerPolicy,
+    CheckboxUnavailable,
+    CircuitBreaker,
+)
+
+
+class TestCircuitBreaker(BaseCase):
+    def _breaker(self, **policy):
+        values = dict(window=10, min_calls=4, acquire_timeout=0.01)
+        values.update(policy)
+        return CircuitBreaker("test", BreakerPolicy(**values))
+
+    def _call(self, breaker, success):
+        breaker.release(breaker.acquire(), success)
+
+    def _expire(self, breaker):
+        breaker.opened_at -= breaker.policy.open_seconds
+
+    def test_opens_on_errors(self):
+        breaker = self._breaker(error_rate=0.5)
+        for success in (True, False, True):
+            self._call(breaker, success)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        self._call(breaker, False)
+        self.assertEqual(breaker.state, STATE_OPEN)
+        with self.assertRaises(CheckboxUnavailable):
+            breaker.acquire()
+
+    def test_min_calls(self):
+        breaker = self._breaker(error_rate=0.5)
+        for _index in range(3):
+            self._call(breaker, False)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    def test_opens_on_slow_calls(self):
+        breaker = self._breaker(slow_call=0.0, slow_rate=0.8)
+        for _index in range(4):
+            self._call(breaker, True)
+        self.assertEqual(breaker.state, STATE_OPEN)
+
+    def test_single_probe_closes(self):
+        breaker = self._breaker(error_rate=0.5)
+        for _index in range(4):
+            self._call(breaker, False)
+        self._expire(breaker)
+        token = breaker.acquire()
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        # Only one probe at a time
+        with self.assertRaises(CheckboxUnavailable):
+            breaker.acquire()
+        breaker.release(token, True)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        self._call(breaker, True)
+
+    def test_failed_probe_opens_again(self):
+        breaker = self._breaker(error_rate=0.5)
+        for _index in range(4):
+            self._call(breaker, False)
+        self._expire(breaker)
+        self._call(breaker, False)
+        self.assertEqual(breaker.state, STATE_OPEN)
+        with self.assertRaises(CheckboxUnavailable):
+            breaker.acquire()
+
+    def test_concurrency_limit(self):
+        breaker = self._breaker(max_concurrent=2)
+        tokens = [breaker.acquire(), breaker.acquire()]
+        with self.assertRaises(CheckboxUnavailable):
+            breaker.acquire()
+        breaker.release(tokens.pop(), True)
+        tokens.append(breaker.acquire())
+        for token in tokens:
+            breaker.release(token, True)
+        # A request refused by the limiter isn't recorded as a failure
+        self.assertEqual(list(breaker.calls), [(True, False)] * 3)
+
+    def test_set_policy(self):
+        breaker = self._breaker(max_concurrent=1)
+        token = breaker.acquire()
+        breaker.set_policy(
+            BreakerPolicy(
+                window=10, min_calls=4, acquire_timeout=0.01, max_concurrent=2
+            )
+        )
+        other_tokens = [breaker.acquire(), breaker.acquire()]
+        # Released to the semaphore it was taken from
+        breaker.release(token, True)
+        for other_token in other_tokens:
+            breaker.release(other_token, True)
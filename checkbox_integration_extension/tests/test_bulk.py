@@ -0,0 +1,139 @@
+import threading
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.checkbox_integration_extension.models import checkbox_bulk
+from odoo.addons.checkbox_integration_extension.models.checkbox_bulk import (
+    OPERATION_CLOSE,
+    OPERATION_OPEN,
+    BulkCheckboxClient,
+    SessionPlan,
+    step_shift_close,
+    step_signin,
+    step_signout,
+    step_zreport,
+)
+
+
+class FakeCheckboxAPI:
+    def __init__(self, api_url="https://kassa", access_token=None, mode=""):
+        self.api_url = api_url
+        self.access_token = access_token
+        self.mode = mode
+        self.session = None
+        self.has_shift = True
+        self.fail = set()
+        self.calls = []
+        self.sessions = set()
+
+    def _answer(self, name, **values):
+        self.calls.append(name)
+        self.sessions.add((threading.get_ident(), id(self.session)))
+        if name in self.fail:
+            return {"ok": False, "text": f"{name} refused"}
+        return dict(values, ok=True)
+
+    def cashier_signin(self, login, password):
+        return self._answer("signin", access_token=f"token-{login}")
+
+    def shift_create(self):
+        return self._answer("shift_create")
+
+    def shift_close(self):
+        if not self.has_shift:
+            self.calls.append("shift_close")
+            return {"ok": False, "text": "No open shift"}
+        return self._answer("shift_close", z_report_id="z-1")
+
+    def get_current_shift(self):
+        return self._answer("current_shift", shift=None)
+
+    def reports_zreport(self, report_id, paper_width):
+        return self._answer("zreport", text=f"Z {report_id}")
+
+    def cashier_signout(self):
+        return self._answer("signout")
+
+
+def make_plan(session_id=1, access_token=None):
+    return SessionPlan(
+        session_id=session_id,
+        name=f"POS/{session_id}",
+        checkbox_api=FakeCheckboxAPI(access_token=access_token),
+        cloud_api=FakeCheckboxAPI(api_url="https://cloud"),
+        login=f"cashier{session_id}",
+        password="secret",
+        paper_width=80,
+    )
+
+
+class TestBulkSteps(BaseCase):
+    def test_signin(self):
+        plan, result = make_plan(), {}
+        step_signin(plan, result)
+        self.assertEqual(result["access_token"], "token-cashier1")
+        self.assertEqual(plan.checkbox_api.access_token, "token-cashier1")
+
+    def test_signin_with_cached_token(self):
+        plan, result = make_plan(access_token="cached"), {}
+        step_signin(plan, result)
+        self.assertEqual(plan.checkbox_api.calls, [])
+        self.assertNotIn("access_token", result)
+
+    def test_shift_close_and_zreport(self):
+        plan, result = make_plan(access_token="cached"), {}
+        step_shift_close(plan, result)
+        step_zreport(plan, result)
+        self.assertEqual(result, {"z_report_id": "z-1", "report": "Z z-1"})
+        self.assertEqual(plan.cloud_api.calls, ["zreport"])
+
+    def test_shift_close_without_shift(self):
+        plan, result = make_plan(access_token="cached"), {}
+        plan.checkbox_api.has_shift = False
+        step_shift_close(plan, result)
+        step_zreport(plan, result)
+        step_signout(plan, result)
+        self.assertEqual(result, {"no_shift": True, "signed_out": True})
+        self.assertEqual(plan.cloud_api.calls, [])
+
+    def test_signout_without_token(self):
+        plan, result = make_plan(), {}
+        step_signout(plan, result)
+        self.assertEqual(plan.checkbox_api.calls, [])
+
+
+class TestBulkCheckboxClient(BaseCase):
+    def test_results_in_plan_order(self):
+        plans = [make_plan(session_id) for session_id in range(1, 9)]
+        plans[2].cloud_api.fail.add("zreport")
+        results = BulkCheckboxClient(4).run(plans, OPERATION_CLOSE)
+        self.assertEqual(
+            [result["session_id"] for result in results], list(range(1, 9))
+        )
+        self.assertFalse(results[2]["ok"])
+        self.assertEqual(results[2]["error"], "Z-report: zreport refused")
+        # The failed session stops at its failed step, it is not signed out
+        self.assertEqual(plans[2].checkbox_api.calls, ["signin", "shift_close"])
+        for result in results[:2] + results[3:]:
+            self.assertTrue(result["ok"])
+            self.assertTrue(result["signed_out"])
+            self.assertEqual(result["report"], "Z z-1")
+
+    def test_unexpected_error(self):
+        plan = make_plan()
+        plan.checkbox_api.shift_create = None
+        with self.assertLogs(checkbox_bulk.__name__, "ERROR"):
+            (result,) = BulkCheckboxClient(2).run([plan], OPERATION_OPEN)
+        self.assertFalse(result["ok"])
+        self.assertIn("NoneType", result["error"])
+
+    def test_session_per_thread(self):
+        plans = [make_plan(session_id) for session_id in range(1, 9)]
+        BulkCheckboxClient(3).run(plans, OPERATION_CLOSE)
+        used = set()
+        for plan in plans:
+            used |= plan.checkbox_api.sessions
+        sessions = {session for _thread, session in used}
+        # Every thread has a session of its own, never shared with another thread
+        self.assertEqual(len(sessions), len(used))
+        self.assertLessEqual(len(sessions), 3)
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+
+class QueuedReceipt:
+    def __init__(self, delivered, receipt_uid, outcome, next_attempt=None):
+        self.delivered = delivered
+        self.receipt_uid = receipt_uid
+        self.outcome = outcome
+        self.next_attempt = next_attempt or fields.Datetime.now()
+        self.pending = True
+
+    def _deliver(self, checkbox_api):
+        self.delivered.append(self.receipt_uid)
+        self.pending = not self.outcome
+        return self.outcome
+
+
+class TestReceiptQueueOrder(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = self.env["checkbox.receipt.queue"]
+        self.session = MagicMock()
+        self.delivered = []
+        self.receipts = []
+        patcher = patch.object(type(self.queue), "search", side_effect=self._search)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(self.env.cr, "commit")
+        self.commit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _search(self, domain, limit=None, **kwargs):
+        # The oldest pending receipt, as by `_order = "id"`
+        for receipt in self.receipts:
+            if receipt.pending:
+                return receipt
+        return self.queue.browse()
+
+    def _queue(self, *outcomes):
+        self.receipts = [
+            QueuedReceipt(self.delivered, f"r{index}", outcome)
+            for index, outcome in enumerate(outcomes, 1)
+        ]
+
+    def _deliver(self, force=False):
+        self.queue._deliver_session_locked(self.session, None, None, force)
+
+    def test_delivered_in_queue_order(self):
+        self._queue(True, True, True)
+        self._deliver()
+        self.assertEqual(self.delivered, ["r1", "r2", "r3"])
+        # Committed after every receipt
+        self.assertEqual(self.commit.call_count, 3)
+
+    def test_stops_at_the_first_retry(self):
+        # A receipt is never fiscalized before an older one
+        self._queue(True, False, True)
+        self._deliver()
+        self.assertEqual(self.delivered, ["r1", "r2"])
+        self.assertTrue(self.receipts[2].pending)
+
+    def test_retry_delay(self):
+        self._queue(True)
+        self.receipts[0].next_attempt = fields.Datetime.now() + timedelta(minutes=5)
+        self._deliver()
+        self.assertEqual(self.delivered, [])
+        # A flush ignores the delay of the first receipt
+        self._deliver(force=True)
+        self.assertEqual(self.delivered, ["r1"])
+
+    def test_forced_flush_keeps_the_later_delays(self):
+        self._queue(False, True)
+        self._deliver(force=True)
+        self.assertEqual(self.delivered, ["r1"])